@@ -0,0 +1,126 @@
+import array
+import math
+import os
+import random
+import subprocess
+import sys
+import wave
+
+# numpy is optional, only makes generating large libraries faster
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class syntheticLibrary:
+    """Generator of a reproducible sound library for benchmarks. Every file
+    has distinct content, so hashes, caches and the catalog behave as with
+    a real library: sines step through frequencies, noise is seeded per file.
+    """
+    TYPES = {'show': 1.0, 'stationID': 0.05, 'fill': 0.2, 'PSA': 0.1}  # type -> share of length
+
+    def __init__(self, root: str, count: int = 20, seconds: float = 30, rate: int = 44100,
+                 channels: int = 2, kind: str = 'sine', level: float = -12, seed: int = 0) -> None:
+        """
+        Args:
+            root (str): library directory, one sub directory per sound type
+            count (int, optional): shows generated, other types get a few files each. Defaults to 20.
+            seconds (float, optional): length of a show. Defaults to 30.
+            rate (int, optional): sample rate in Hz. Defaults to 44100.
+            channels (int, optional): channel count. Defaults to 2.
+            kind (str, optional): 'sine' or 'noise'. Defaults to 'sine'.
+            level (float, optional): peak level in dBFS. Defaults to -12.
+            seed (int, optional): random seed of noise. Defaults to 0.
+        """
+        assert kind in ('sine', 'noise')
+        self.root = root
+        self.count = count
+        self.seconds = seconds
+        self.rate = rate
+        self.channels = channels
+        self.kind = kind
+        self.level = level
+        self.seed = seed
+
+    def counts(self) -> dict:
+        """Files generated per sound type
+
+        Returns:
+            dict: type -> number of files
+        """
+        n = {t: max(1, self.count // 10) for t in syntheticLibrary.TYPES}
+        n['show'] = self.count
+        return n
+
+    def _samples(self, index: int, frames: int) -> bytes:
+        # interleaved 16-bit frames of one file
+        peak = 32767 * 10 ** (self.level / 20)
+        freq = 110 * 2 ** ((index % 48) / 12) + index // 48  # semitone steps, then 1 Hz apart
+        if numpy is not None:
+            if self.kind == 'sine':
+                x = numpy.sin(2 * numpy.pi * freq * numpy.arange(frames) / self.rate)
+            else:
+                x = numpy.random.default_rng((self.seed, index)).uniform(-1, 1, frames)
+            x = numpy.repeat((x * peak).astype('<i2')[:, None], self.channels, axis=1)
+            return x.tobytes()
+        rng = random.Random('{}-{}'.format(self.seed, index))
+        if self.kind == 'sine':
+            w = 2 * math.pi * freq / self.rate
+            x = (int(peak * math.sin(w * i)) for i in range(frames))
+        else:
+            x = (int(peak * rng.uniform(-1, 1)) for _ in range(frames))
+        a = array.array('h', (v for v in x for _ in range(self.channels)))
+        if sys.byteorder != 'little':  # WAV is little endian
+            a.byteswap()
+        return a.tobytes()
+
+    def write(self, path: str, index: int, seconds: float):
+        """Write one WAV file
+
+        Args:
+            path (str): path to the file
+            index (int): file number, selects the content
+            seconds (float): length
+        """
+        with wave.open(path, 'wb') as w:
+            w.setnchannels(self.channels)
+            w.setsampwidth(2)
+            w.setframerate(self.rate)
+            w.writeframes(self._samples(index, int(seconds * self.rate)))
+
+    def generate(self, formats: list = ('.wav',), ffmpeg: str = None) -> list:
+        """Generate the library. Files already there are replaced.
+
+        Args:
+            formats (list, optional): extensions, cycled through the files of each type.
+                Anything but .wav is encoded from a WAV by ffmpeg. Defaults to ('.wav',).
+            ffmpeg (str, optional): path to ffmpeg, required for encoded formats.
+                Defaults to None.
+
+        Returns:
+            list: paths to generated files
+        """
+        formats = list(formats)
+        if ffmpeg is None and formats != ['.wav']:
+            raise ValueError("ffmpeg is required to encode {}".format(formats))
+        files = []
+        index = 0
+        for t, n in self.counts().items():
+            os.makedirs(os.path.join(self.root, t), exist_ok=True)
+            for i in range(n):
+                ext = formats[i % len(formats)]
+                path = os.path.join(self.root, t, '{}-{:05d}{}'.format(t, i, ext))
+                seconds = self.seconds * syntheticLibrary.TYPES[t]
+                if ext == '.wav':
+                    self.write(path, index, seconds)
+                else:
+                    self.write(path + '.wav', index, seconds)
+                    try:
+                        subprocess.run([ffmpeg, '-y', '-v', 'error', '-nostdin', '-i', path + '.wav', path],
+                                       check=True, stdin=subprocess.DEVNULL)
+                    finally:
+                        os.remove(path + '.wav')
+                files.append(path)
+                index += 1
+        return files
@@ -0,0 +1,370 @@
+"""Benchmark the station hot paths on a synthetic library and write the
+results as JSON, to compare releases over time.
+
+Run from the repository root, e.g.
+
+    python -m bench.run --files 50 --seconds 60 --formats .wav .mp3 --out bench.json
+    python -m bench.run --compare bench.json
+
+The station runs in a fresh working directory with its own config, library
+and database, and pygame uses the SDL dummy audio driver. Stages needing
+ffmpeg / ffprobe or py_cui are recorded as skipped if those are missing.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import yaml
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+from bench.library import syntheticLibrary  # noqa: E402
+
+
+class benchmark:
+    """Timed stages against one synthetic library. The modules are imported
+    by run() after switching to the working directory, since the config is
+    loaded on import.
+    """
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.results = {}
+        self.skipped = {}
+        self.bin = benchmark.findBin(args.bin)
+        self.files = []
+        self.generated = None  # seconds spent generating the library
+
+    @staticmethod
+    def findBin(candidate: str = None) -> str:
+        """Directory holding both ffmpeg and ffprobe
+
+        Args:
+            candidate (str, optional): preferred directory. Defaults to None.
+
+        Returns:
+            str: absolute path, None if not found
+        """
+        ext = '.exe' if os.name == 'nt' else ''
+        found = shutil.which('ffmpeg')
+        for d in (candidate, os.path.join(REPO, 'bin'), found and os.path.dirname(found)):
+            if d and all(os.path.isfile(os.path.join(d, p + ext)) for p in ('ffmpeg', 'ffprobe')):
+                return os.path.abspath(d)
+        return None
+
+    @staticmethod
+    def summary(samples: list) -> dict:
+        """Statistics of a series of timings
+
+        Args:
+            samples (list): seconds
+
+        Returns:
+            dict: count, total, mean, median, p95, min and max
+        """
+        ordered = sorted(samples)
+        return {'count': len(ordered), 'total': sum(ordered),
+                'mean': statistics.fmean(ordered), 'median': statistics.median(ordered),
+                'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                'min': ordered[0], 'max': ordered[-1]}
+
+    def record(self, name: str, samples: list, **extra):
+        if not samples:
+            self.skip(name, "no samples")
+            return
+        self.results[name] = dict(benchmark.summary(samples), **extra)
+
+    def skip(self, name: str, reason: str):
+        self.skipped[name] = reason
+
+    def timed(self, fn, *args) -> float:
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+
+    def config(self) -> dict:
+        """Station config for the working directory, from the sample config
+
+        Returns:
+            dict: config
+        """
+        with open(os.path.join(REPO, 'doc', 'sample.config.yml')) as f:
+            cfg = yaml.safe_load(f)
+        cfg['station']['name'] = 'BENCH'
+        cfg['path'].update({'bin': self.bin or 'bin', 'lib': 'lib', 'log': 'log', 'db': 'db.sqlite3'})
+        cfg['alert']['smtp']['enable'] = False
+        cfg['alert']['discord']['enable'] = False
+        cfg['metrics']['enable'] = False
+        cfg['audio']['formats'] = sorted(set(cfg['audio']['formats']) | set(self.args.formats))
+        return cfg
+
+    def prepare(self, workdir: str):
+        """Generate the library and the config in the working directory
+
+        Args:
+            workdir (str): working directory
+        """
+        lib = syntheticLibrary(os.path.join(workdir, 'lib'), self.args.files, self.args.seconds,
+                               kind=self.args.kind, seed=self.args.seed)
+        ffmpeg = self.bin and os.path.join(self.bin, 'ffmpeg')
+        formats = self.args.formats
+        if ffmpeg is None and formats != ['.wav']:
+            self.skip('library.encoded', "ffmpeg not found, generated WAV only")
+            formats = ['.wav']
+        start = time.perf_counter()
+        self.files = [os.path.relpath(f, workdir) for f in lib.generate(formats, ffmpeg)]
+        self.generated = time.perf_counter() - start
+        os.makedirs(os.path.join(workdir, 'log'))
+        with open(os.path.join(workdir, 'config.yml'), 'w') as f:
+            yaml.safe_dump(self.config(), f)
+
+    def meta(self) -> dict:
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        try:
+            import pygame
+            pygameVersion = pygame.version.ver
+        except ImportError:
+            pygameVersion = None
+        return {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit': commit, 'python': platform.python_version(),
+                'pygame': pygameVersion, 'platform': platform.platform(),
+                'cpus': os.cpu_count(), 'ffmpeg': self.bin is not None,
+                'params': {k: v for k, v in vars(self.args).items()
+                           if k not in ('out', 'compare', 'workdir', 'keep', 'verbose', 'bin')},
+                'library': {'files': len(self.files), 'bytes': sum(os.path.getsize(f) for f in self.files),
+                            'generated': self.generated}}
+
+    def listSound(self):
+        from modules.util import fsUtil
+        samples = [self.timed(fsUtil.list_sound, 'show') for _ in range(self.args.repeat)]
+        self.record('fsUtil.list_sound', samples, files=len(fsUtil.list_sound('show')))
+
+    def sha256(self):
+        from modules.util import fsUtil
+        samples = [self.timed(fsUtil.sha256sum, f) for f in self.files]
+        size = sum(os.path.getsize(f) for f in self.files)
+        self.record('fsUtil.sha256sum', samples, mb_per_s=size / 1e6 / sum(samples))
+
+    def loudNorm(self, station):
+        if self.bin is None:
+            self.skip('manager.loudNorm', "ffmpeg not found")
+            return
+        sounds = station.libSounds()
+        samples = [self.timed(station.loudNorm, sounds)]
+        self.record('manager.loudNorm', samples, files=len(sounds))
+        # nothing changed since, as on a restart
+        samples = [self.timed(station.scanLib) for _ in range(self.args.repeat)]
+        self.record('manager.scanLib', samples, files=len(sounds))
+
+    def getData(self, station):
+        from modules.audio import decodedCache, sound, transcodedCache
+        sounds = [sound(f) for f in station.libSounds()]
+        if self.bin is not None:
+            sounds = [s for s in sounds if not s.isStreamed()]
+
+        def cold():
+            samples = []
+            for s in sounds:
+                decodedCache.drop(s.path)
+                samples.append(self.timed(s.getData))
+            return samples
+
+        self.record('sound.getData', cold())
+        self.record('sound.getData.cached', [self.timed(s.getData) for s in sounds])
+        if self.bin is None:
+            self.skip('transcodeCache.transcode', "ffmpeg not found")
+            self.skip('sound.getData.stored', "ffmpeg not found")
+            return
+        self.record('transcodeCache.transcode',
+                    [self.timed(transcodedCache.transcode, s.path) for s in sounds])
+        self.record('sound.getData.stored', cold())
+
+    def play(self, station):
+        from modules.audio import decodedPrefetch
+        if self.bin is None:
+            self.skip('control.play', "ffprobe not found")
+            return
+        ctl = station.playControl
+        chan = ctl.channelMap['show']
+        ctl.setMode('loop')
+        ctl.play('show')  # pulls the queue
+        samples = []
+        waits = 0
+        for _ in range(self.args.plays):
+            chan.stop()
+            # as in steady playout, the next sound has been prefetched
+            decodedPrefetch.request(ctl.queue[(ctl.index + 1) % len(ctl.queue)].path).result()
+            while True:
+                elapsed = self.timed(ctl.play, 'show')
+                if ctl.pendingFetch is None:
+                    break
+                waits += 1
+                ctl.pendingFetch[1].result()
+            samples.append(elapsed)
+        chan.stop()
+        self.record('control.play', samples, waits=waits)
+
+    def scheduler(self, station):
+        import psutil
+        station.scheduleInit()
+        daemon = threading.Thread(name='Daemon', target=station.scheduleLoop, daemon=True)
+        daemon.start()
+        time.sleep(0.1)
+        proc = psutil.Process()
+
+        def cpu():
+            for t in proc.threads():
+                if t.id == daemon.native_id:
+                    return t.user_time + t.system_time
+            return None
+
+        before = cpu()
+        start = time.perf_counter()
+        time.sleep(self.args.idle)
+        after = cpu()
+        wall = time.perf_counter() - start
+        station.scheduler.stop()
+        daemon.join(5)
+        if before is None or after is None:
+            self.skip('scheduler.cpu', "thread CPU time not available")
+            return
+        self.results['scheduler.cpu'] = {'wall': wall, 'cpu': after - before,
+                                         'percent': 100 * (after - before) / wall}
+
+    def updateUI(self):
+        from modules.audio import decodedCache
+        if self.bin is None:
+            self.skip('TUI._updateUI', "ffmpeg not found")
+            return
+        try:
+            import py_cui
+            from modules.tui import TUI
+        except ImportError as e:
+            self.skip('TUI._updateUI', str(e))
+            return
+        # sounds decoded for the previous mixer are gone with it
+        decodedCache.pinned.clear()
+        for path in list(decodedCache.entries):
+            decodedCache.drop(path)
+        root = py_cui.PyCUI(4, 3, exit_key=1)
+        tui = TUI(root)
+        try:
+            first = self.timed(tui._updateUI)
+            samples = []
+            for _ in range(self.args.frames):
+                time.sleep(self.args.frame_interval)
+                samples.append(self.timed(tui._updateUI))
+            self.record('TUI._updateUI', samples, first=first)
+        finally:
+            tui.station.signOff()
+
+    def run(self) -> dict:
+        """Run all stages
+
+        Returns:
+            dict: meta, results and skipped stages
+        """
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+        cwd = os.getcwd()
+        workdir = os.path.abspath(tempfile.mkdtemp(prefix='bench-', dir=self.args.workdir))
+        try:
+            self.prepare(workdir)
+            os.chdir(workdir)
+            from modules import logger
+            if not self.args.verbose:
+                logger.consoleHandler.setLevel('WARNING')
+            from modules.station import manager
+
+            self.listSound()
+            self.sha256()
+            station = manager()
+            try:
+                self.loudNorm(station)
+                self.getData(station)
+                self.play(station)
+                self.scheduler(station)
+            finally:
+                station.signOff()
+            self.updateUI()
+            return {'meta': self.meta(), 'results': self.results, 'skipped': self.skipped}
+        finally:
+            os.chdir(cwd)
+            if self.args.keep:
+                print("Working directory kept at " + workdir)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(data: dict, baseline: dict = None):
+    """Print results, with the ratio of medians to a baseline run
+
+    Args:
+        data (dict): results of this run
+        baseline (dict, optional): results of an earlier run. Defaults to None.
+    """
+    base = (baseline or {}).get('results', {})
+    print("{:<28}{:>12}{:>12}{:>12}{:>8}".format('stage', 'median ms', 'p95 ms', 'count',
+                                                 'x base' if baseline else ''))
+    for name, r in data['results'].items():
+        if 'median' not in r:
+            print("{:<28}{:>12}".format(name, '{:.2f}% CPU'.format(r['percent'])))
+            continue
+        ratio = ''
+        if name in base and base[name].get('median'):
+            ratio = '{:.2f}'.format(r['median'] / base[name]['median'])
+        print("{:<28}{:>12.3f}{:>12.3f}{:>12}{:>8}".format(
+            name, r['median'] * 1000, r['p95'] * 1000, r['count'], ratio))
+    for name, reason in data['skipped'].items():
+        print("{:<28}skipped: {}".format(name, reason))
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20, help="shows in the library (default 20)")
+    parser.add_argument('--seconds', type=float, default=30, help="length of a show (default 30)")
+    parser.add_argument('--formats', nargs='+', default=['.wav'],
+                        help="file formats, cycled through the library (default .wav)")
+    parser.add_argument('--kind', choices=('sine', 'noise'), default='sine')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20, help="repetitions of quick stages")
+    parser.add_argument('--plays', type=int, default=20, help="sounds started by control.play")
+    parser.add_argument('--idle', type=float, default=5, help="seconds the scheduler is watched")
+    parser.add_argument('--frames', type=int, default=100, help="TUI updates timed")
+    parser.add_argument('--frame-interval', type=float, default=0.05, help="seconds between TUI updates")
+    parser.add_argument('--bin', help="directory of ffmpeg and ffprobe (default bin, then PATH)")
+    parser.add_argument('--workdir', help="parent of the temporary working directory")
+    parser.add_argument('--keep', action='store_true', help="keep the working directory")
+    parser.add_argument('--verbose', action='store_true', help="log to console")
+    parser.add_argument('--out', default='bench_output.json', help="JSON results (default bench_output.json)")
+    parser.add_argument('--compare', help="JSON results of an earlier run")
+    args = parser.parse_args(argv)
+    args.formats = [f if f.startswith('.') else '.' + f for f in args.formats]
+
+    data = benchmark(args).run()
+    with open(args.out, 'w') as f:
+        json.dump(data, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(data, baseline)
+
+
+if __name__ == '__main__':
+    main()
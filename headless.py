@@ -31,7 +31,7 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import time
+import threading
 import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 
@@ -51,13 +51,13 @@ def routine():
 
         # Register schedule
         station.scheduleInit()
+        threading.Thread(name='Daemon', target=station.scheduleLoop,
+                         daemon=True).start()
 
-        # loop
-        while True:
-            station.scheduleRun()
-            station.playControl.play('show')
-            time.sleep(1)
-            pass
+        # playout runs until interrupted
+        station.playControl.startPlayout('show')
+        while station.playControl.playout.is_alive():
+            station.playControl.playout.join(1)
 
     except KeyboardInterrupt:
         logger.rootLogger.warning("KeyboardInterrupt detected.")
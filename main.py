@@ -9,9 +9,7 @@ from modules.util import configManager
 
 
 def runSchedule(station):
-    logging.info("Scheduler started.")
-    while station.mixer.get_init():
-        station.scheduleRun()
+    station.scheduleLoop()
 
 
 def runTUI(mainWindow):
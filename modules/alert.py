@@ -0,0 +1,195 @@
+import datetime
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class alertAggregator(logging.Handler):
+    """Alert aggregation in front of a notification handler (email, Discord).
+
+    Records are fingerprinted by level, origin and message with numbers and
+    quoted strings masked. A fingerprint alerts at most once per `window`;
+    repeats in between are only counted. New alerts are batched into one
+    message per `interval`, and a daily digest lists every alert of the day
+    with its count and first and last timestamps.
+    """
+    NUMBERS = re.compile(r'\d+(\.\d+)?')
+    QUOTED = re.compile(r'"[^"]*"|\'[^\']*\'')
+    MAX_FINGERPRINTS = 1000  # per digest, the rest is counted as other
+
+    def __init__(self, target: logging.Handler, window: float = 600, interval: float = 60, digest: str = None) -> None:
+        """
+        Args:
+            target (logging.Handler): handler sending the alerts
+            window (float, optional): seconds a repeated alert stays suppressed. Defaults to 600.
+            interval (float, optional): seconds between batched alerts. Defaults to 60.
+            digest (str, optional): daily digest time "HH:MM". Defaults to None, no digest.
+        """
+        logging.Handler.__init__(self, target.level)
+        self.target = target
+        self.window = window
+        self.interval = interval
+        self.digestAt = digest
+        self.batch = OrderedDict()  # fingerprint -> pending alert
+        self.sent = {}  # fingerprint -> [time sent, repeats suppressed since]
+        self.daily = OrderedDict()  # fingerprint -> digest entry
+        self.otherCount = 0
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.nextFlush = time.time() + interval
+        self.nextDigest = self._nextDigest(time.time())
+        self.thread = threading.Thread(
+            name='Alert', target=self._run, daemon=True)
+        self.thread.start()
+
+    def fingerprint(record) -> tuple:
+        """Key identifying repeats of the same alert
+
+        Args:
+            record (logging.LogRecord): log record
+
+        Returns:
+            tuple: fingerprint
+        """
+        message = alertAggregator.QUOTED.sub('*', record.getMessage())
+        message = alertAggregator.NUMBERS.sub('#', message)
+        return record.levelno, record.pathname, record.lineno, message
+
+    def _nextDigest(self, now: float) -> float:
+        if not self.digestAt:
+            return None
+        hour, minute = (int(x) for x in self.digestAt.split(':')[:2])
+        t = datetime.datetime.fromtimestamp(now).replace(
+            hour=hour, minute=minute, second=0, microsecond=0)
+        if t.timestamp() <= now:
+            t += datetime.timedelta(days=1)
+        return t.timestamp()
+
+    def emit(self, record):
+        if getattr(record, 'noAlert', False):
+            return  # about the alert channel itself
+        fp = alertAggregator.fingerprint(record)
+        now = record.created
+        with self.cond:
+            day = self.daily.get(fp)
+            if day is None:
+                if len(self.daily) >= alertAggregator.MAX_FINGERPRINTS:
+                    self.otherCount += 1
+                else:
+                    self.daily[fp] = {'level': record.levelname, 'message': record.getMessage(),
+                                      'count': 1, 'first': now, 'last': now}
+            else:
+                day['count'] += 1
+                day['last'] = now
+
+            pending = self.batch.get(fp)
+            if pending is not None:
+                pending['count'] += 1
+                pending['last'] = now
+                return
+            sent = self.sent.get(fp)
+            if sent is not None and now - sent[0] < self.window:
+                sent[1] += 1  # storm, suppressed
+                return
+            self.batch[fp] = {'record': record, 'count': 1, 'last': now,
+                              'suppressed': sent[1] if sent is not None else 0}
+
+    def _format(self, t: float) -> str:
+        return datetime.datetime.fromtimestamp(t).strftime('%H:%M:%S')
+
+    def _send(self, record, message: str):
+        alert = logging.makeLogRecord(record.__dict__)
+        alert.msg = message
+        alert.args = None
+        alert.exc_info = None
+        alert.exc_text = None
+        self.target.handle(alert)
+
+    def flush(self):
+        """Send the pending batch as one message
+        """
+        with self.cond:
+            if not self.batch:
+                return
+            batch = self.batch
+            self.batch = OrderedDict()
+            now = time.time()
+            for fp in batch:
+                self.sent[fp] = [now, 0]
+            # forget alerts whose window has passed, repeats are kept for the next alert
+            for fp in [fp for fp, s in self.sent.items()
+                       if now - s[0] >= self.window and (s[1] == 0 or now - s[0] >= 86400)]:
+                del self.sent[fp]
+        if len(batch) == 1:
+            alert = next(iter(batch.values()))
+            message = alert['record'].getMessage()
+            if alert['count'] > 1 or alert['suppressed']:
+                message += "\n(x{} until {}, {} more suppressed before)".format(
+                    alert['count'], self._format(alert['last']), alert['suppressed'])
+            self._send(alert['record'], message)
+            return
+        lines = ["{} alerts:".format(len(batch))]
+        for alert in batch.values():
+            r = alert['record']
+            lines.append("[{}] x{} {} - {} {}".format(
+                r.levelname, alert['count'] + alert['suppressed'],
+                self._format(r.created), self._format(alert['last']), r.getMessage()))
+        top = max((a['record'] for a in batch.values()), key=lambda r: r.levelno)
+        self._send(top, '\n'.join(lines))
+
+    def digest(self):
+        """Send the daily digest and start a new day
+        """
+        with self.cond:
+            daily, other = self.daily, self.otherCount
+            self.daily = OrderedDict()
+            self.otherCount = 0
+        if not daily and not other:
+            return
+        entries = sorted(daily.values(), key=lambda d: d['count'], reverse=True)
+        lines = ["Daily digest: {} alerts of {} kinds.".format(
+            sum(d['count'] for d in entries) + other, len(entries))]
+        for d in entries:
+            lines.append("[{}] x{} first {} last {} {}".format(
+                d['level'], d['count'],
+                datetime.datetime.fromtimestamp(d['first']).strftime('%Y-%m-%d %H:%M:%S'),
+                datetime.datetime.fromtimestamp(d['last']).strftime('%Y-%m-%d %H:%M:%S'),
+                d['message']))
+        if other:
+            lines.append("{} other alerts.".format(other))
+        record = logging.makeLogRecord({
+            'name': 'alert', 'msg': '\n'.join(lines), 'levelno': logging.WARNING,
+            'levelname': 'WARNING', 'threadName': 'Alert'})
+        self.target.handle(record)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if self.stopped:
+                    return
+                now = time.time()
+                due = min(t for t in (self.nextFlush, self.nextDigest) if t is not None)
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+            try:
+                if now >= self.nextFlush:
+                    self.nextFlush = now + self.interval
+                    self.flush()
+                if self.nextDigest is not None and now >= self.nextDigest:
+                    self.nextDigest = self._nextDigest(now)
+                    self.digest()
+            except Exception as e:
+                logging.error("Alert delivery failed: " + str(e),
+                              extra={'noAlert': True})
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.thread.join(timeout=5)
+        self.flush()
+        self.target.close()
+        logging.Handler.close(self)
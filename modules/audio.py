@@ -1,98 +1,526 @@
-import multiprocessing
+import concurrent.futures
+import queue
 import threading
 import time
 import logging
+from collections import OrderedDict
 from pygame import mixer
-import asyncio
+import pygame
+import math
+import psutil
 
-from .util import configManager, ffmpegWrapper, conversion, Singleton
+from .util import configManager, ffmpegWrapper, conversion, Singleton, metaCache
+from . import meter
+from .metrics import metricsRegistry
+from .transcode import transcodedCache
+
+
+class soundCache:
+    """Decoded sound cache bounded by a memory budget. Least recently used
+    sounds are evicted first; sounds pinned by a channel are never evicted.
+    """
+    requests = metricsRegistry.counter('decoded_cache_requests_total', 'Decoded sound lookups', ('result',))
+    decodeSeconds = metricsRegistry.histogram('decode_seconds', 'Time to load a sound on a cache miss',
+                                              ('source',))
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()  # path -> (mixer.Sound, bytes)
+        self.pinned = {}  # owner -> path
+        self.size = 0
+
+    def budget(self) -> int:
+        """Memory budget in bytes. Configured either in bytes or as a fraction
+        of available memory (counting what the cache already holds).
+
+        Returns:
+            int: budget in bytes
+        """
+        b = configManager.cfg.cache.decoded_budget
+        if b <= 1:
+            b = b * (psutil.virtual_memory().available + self.size)
+        return int(b)
+
+    def estimate(self, path: str) -> int:
+        """Estimated decoded size of a sound in the mixer format
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            int: size in bytes, None if duration unknown
+        """
+        duration = metaCache.get(path)['duration']
+        if duration is None:
+            return None
+        freq, fmt, channels = mixer.get_init()
+        return int(duration * freq * channels * (abs(fmt) // 8))
+
+    def _sizeOf(self, data: mixer.Sound) -> int:
+        freq, fmt, channels = mixer.get_init()
+        return int(data.get_length() * freq * channels * (abs(fmt) // 8))
+
+    def get(self, path: str) -> mixer.Sound:
+        """Get decoded sound, decode it on miss
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            mixer.Sound: decoded sound
+        """
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+                soundCache.requests.inc(result='hit')
+                return self.entries[path][0]
+        soundCache.requests.inc(result='miss')
+        start = time.perf_counter()
+        data, source = self._decode(path)  # decode outside the lock
+        soundCache.decodeSeconds.observe(time.perf_counter() - start, source=source)
+        return self.put(path, data)
+
+    def _decode(self, path: str) -> tuple:
+        # returns the sound and where it came from. Prefer the PCM stored in
+        # the mixer format, pygame copies it out of the memory map into the
+        # sound, nothing is decoded
+        mapped = transcodedCache.mapped(path)
+        if mapped is not None:
+            with mapped:
+                return mixer.Sound(buffer=mapped), 'stored'
+        transcodedCache.request(path)
+        try:
+            return mixer.Sound(path), 'file'
+        except pygame.error:
+            # codec the mixer cannot decode, i.e. some m4a
+            if transcodedCache.transcode(path) is None:
+                raise
+            logging.warning("\"{}\" could not be decoded, played from a transcoded copy.".format(path))
+            with transcodedCache.mapped(path) as mapped:
+                return mixer.Sound(buffer=mapped), 'transcoded'
+
+    def put(self, path: str, data: mixer.Sound) -> mixer.Sound:
+        """Add a decoded sound
+
+        Args:
+            path (str): path to sound file
+            data (mixer.Sound): decoded sound
+
+        Returns:
+            mixer.Sound: the cached sound
+        """
+        with self.lock:
+            if path in self.entries:  # decoded concurrently
+                self.entries.move_to_end(path)
+                return self.entries[path][0]
+            n = self._sizeOf(data)
+            self.entries[path] = (data, n)
+            self.size += n
+            self.evict()
+            return data
+
+    def contains(self, path: str) -> bool:
+        with self.lock:
+            return path in self.entries
+
+    def peek(self, path: str) -> mixer.Sound:
+        """Get decoded sound without decoding it on miss
+
+        Returns:
+            mixer.Sound: decoded sound, None if not cached
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            return entry[0] if entry is not None else None
+
+    def evict(self, reserve: int = 0):
+        """Drop least recently used sounds until the cache fits in budget
+
+        Args:
+            reserve (int, optional): bytes to keep free in addition. Defaults to 0.
+        """
+        with self.lock:
+            budget = self.budget() - reserve
+            pinned = set(self.pinned.values())
+            for path in list(self.entries):
+                if self.size <= budget:
+                    break
+                if path in pinned:
+                    continue
+                self.drop(path)
+
+    def drop(self, path: str):
+        with self.lock:
+            if path in self.entries:
+                _, n = self.entries.pop(path)
+                self.size -= n
+
+    def pin(self, path: str, owner):
+        """Keep a sound in cache while its owner (i.e. a channel) plays it.
+        A new pin replaces the owner's previous one.
+
+        Args:
+            path (str): path to sound file
+            owner (hashable): pin owner
+        """
+        with self.lock:
+            previous = self.pinned.get(owner)
+            self.pinned[owner] = path
+            self._release(previous)
+
+    def unpin(self, owner):
+        with self.lock:
+            self._release(self.pinned.pop(owner, None))
+
+    def _release(self, path: str):
+        # a sound stored as PCM reloads from the page cache, leave it to the OS
+        if path is None or path in self.pinned.values():
+            return
+        if path in self.entries and transcodedCache.contains(path):
+            self.drop(path)
+
+    def lookahead(self, paths: list, limit: int) -> list:
+        """Pick the upcoming sounds that fit in the budget next to what is pinned
+
+        Args:
+            paths (list): upcoming sounds in play order
+            limit (int): max number of sounds
+
+        Returns:
+            list: paths worth preloading
+        """
+        with self.lock:
+            pinned = set(self.pinned.values())
+            free = self.budget() - sum(n for p, (_, n) in self.entries.items() if p in pinned)
+        selected = []
+        for path in paths[:limit]:
+            n = self.estimate(path)
+            if n is None or n > free:
+                break
+            free -= n
+            selected.append(path)
+        return selected
+
+
+decodedCache = soundCache()
+metricsRegistry.gauge('decoded_cache_bytes', 'Memory held by decoded sounds', fn=lambda: decodedCache.size)
+metricsRegistry.gauge('decoded_cache_entries', 'Decoded sounds in memory', fn=lambda: len(decodedCache.entries))
+
+
+class prefetcher:
+    """Decode sounds into the decoded cache on a background thread. Loudness
+    of fresh decodes is measured on a second thread, so it never delays the
+    next decode.
+    """
+    def __init__(self, cache: soundCache) -> None:
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.inflight = {}  # path -> Future
+        self.requests = queue.Queue()
+        self.thread = None
+        self.measures = queue.Queue()  # paths decoded, loudness maybe unknown
+        self.meterThread = None
+
+    def request(self, path: str) -> concurrent.futures.Future:
+        """Ask for a sound to be decoded
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            concurrent.futures.Future: resolves to the decoded mixer.Sound
+        """
+        with self.lock:
+            if path in self.inflight:
+                return self.inflight[path]
+            future = concurrent.futures.Future()
+            if self.cache.contains(path):
+                future.set_result(self.cache.get(path))
+                return future
+            self.inflight[path] = future
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    name='Prefetch', target=self._run, daemon=True)
+                self.thread.start()
+        self.requests.put(path)
+        return future
+
+    def ready(self, path: str) -> bool:
+        return self.cache.contains(path)
+
+    def _run(self):
+        while True:
+            path = self.requests.get()
+            with self.lock:
+                future = self.inflight.get(path)
+            if future is None:
+                continue
+            try:
+                start = time.time()
+                data = self.cache.get(path)
+                logging.debug("Decoded \"{}\" in {:.2f}s".format(
+                    path, time.time() - start))
+                with self.lock:
+                    self.inflight.pop(path, None)
+                future.set_result(data)
+            except Exception as e:
+                logging.error("Cannot decode {}: {}".format(path, str(e)))
+                with self.lock:
+                    self.inflight.pop(path, None)
+                future.set_exception(e)
+                continue
+            if meter.available():
+                self._queueMeasure(path)
+
+    def _queueMeasure(self, path: str):
+        with self.lock:
+            if self.meterThread is None or not self.meterThread.is_alive():
+                self.meterThread = threading.Thread(
+                    name='Meter', target=self._meter, daemon=True)
+                self.meterThread.start()
+        self.measures.put(path)
+
+    def _meter(self):
+        while True:
+            path = self.measures.get()
+            data = self.cache.peek(path)
+            if data is not None:  # else evicted meanwhile, measured by the next decode
+                self._measure(path, data)
+
+    def _measure(self, path: str, data: mixer.Sound):
+        # measure loudness on the playback decode if it is still unknown
+        if not meter.available():
+            return
+        record = metaCache.lookup(path)
+        if record is None or record.get('loudness') is not None:
+            return
+        if (record.get('channels') or 0) > mixer.get_init()[2]:
+            return  # downmixed by the mixer, not comparable
+        try:
+            metaCache.update(path, record['hash'], **meter.measureSound(data, record.get('channels')))
+        except Exception as e:
+            logging.error("Cannot measure loudness of {}: {}".format(path, str(e)))
+
+
+decodedPrefetch = prefetcher(decodedCache)
 
 
 class sound:
-    """Sound lazy-load proxy class
+    """Sound lazy-load proxy class. Decoded data lives in decodedCache.
     """
     def __init__(self, filename, duration=None) -> None:
         self.path = filename
-        self.data = None # load on demand
         self.duration = duration
 
     def getDuration(self):
         if self.duration is None:
-            self.duration = ffmpegWrapper.getLength(self.path)
+            self.duration = metaCache.get(self.path)['duration']
         return self.duration
 
     def getData(self):
-        if self.data is None:
-            self.data = mixer.Sound(self.path)
-        return self.data
+        return decodedCache.get(self.path)
+
+    def isStreamed(self) -> bool:
+        """Long sounds are streamed from disk instead of decoded into memory
+
+        Returns:
+            bool: True if longer than the streaming threshold
+        """
+        duration = self.getDuration()
+        return duration is not None and duration > configManager.cfg.audio.stream_threshold
 
     def strDuration(self):
         return conversion.floatToHMS(self.getDuration())
 
     def unloadData(self):
-        self.data = None
+        decodedCache.drop(self.path)
 
     def __str__(self) -> str:
         return self.path
 
 
+class ramp:
+    """A volume ramp on a channel
+    """
+    CURVES = ('linear', 'equal_power')
+
+    def __init__(self, chan: mixer.Channel, target: float, length: float, curve: str) -> None:
+        assert curve in ramp.CURVES
+        self.chan = chan
+        self.start = chan.get_volume()
+        self.target = target
+        self.length = length  # second
+        self.curve = curve
+        self.begin = time.monotonic()
+        self.future = concurrent.futures.Future()
+
+    def value(self, now: float) -> float:
+        x = min((now - self.begin) / self.length, 1) if self.length > 0 else 1
+        if self.curve == 'equal_power':
+            x = math.sin(x * math.pi / 2) if self.target > self.start \
+                else 1 - math.cos(x * math.pi / 2)
+        return self.start + (self.target - self.start) * x
+
+    def done(self, now: float) -> bool:
+        return now - self.begin >= self.length
+
+
+class automation:
+    """Volume automation engine. A single thread updates all running ramps at a
+    fixed control rate, so fades never block the caller.
+    """
+    RATE = 100  # Hz
+    fades = metricsRegistry.counter('fades_total', 'Volume ramps by outcome', ('outcome',))
+    fadeSeconds = metricsRegistry.histogram('fade_seconds', 'Duration of completed volume ramps')
+
+    def __init__(self) -> None:
+        self.ramps = {}  # channel -> ramp
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def fade(self, chan: mixer.Channel, target: float, length: int = None, curve: str = 'linear') -> concurrent.futures.Future:
+        """Ramp channel volume to target. A ramp already running on the channel
+        is retargeted, starting from the current volume.
+
+        Args:
+            chan (mixer.Channel): the channel affected
+            target (float): volume after the ramp, 0 to 1
+            length (int, optional): ramp length in ms. Defaults to audio.transition_length.
+            curve (str, optional): 'linear' or 'equal_power'. Defaults to 'linear'.
+
+        Returns:
+            concurrent.futures.Future: True when the ramp completes, False if it was
+            cancelled or retargeted
+        """
+        if length is None:
+            length = configManager.cfg.audio.transition_length
+        with self.cond:
+            old = self.ramps.pop(chan, None)
+            if old is not None:
+                old.future.set_result(False)
+                automation.fades.inc(outcome='retargeted')
+            r = ramp(chan, target, length / 1000, curve)
+            self.ramps[chan] = r
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    name='Automation', target=self._run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return r.future
+
+    def cancel(self, chan: mixer.Channel):
+        """Stop the ramp on a channel, leaving volume where it is
+
+        Args:
+            chan (mixer.Channel): the channel affected
+        """
+        with self.cond:
+            r = self.ramps.pop(chan, None)
+            if r is not None:
+                r.future.set_result(False)
+                automation.fades.inc(outcome='cancelled')
+
+    def busy(self, chan: mixer.Channel) -> bool:
+        with self.cond:
+            return chan in self.ramps
+
+    def _run(self):
+        with self.cond:
+            while True:
+                while not self.ramps:
+                    self.cond.wait()
+                now = time.monotonic()
+                for chan, r in list(self.ramps.items()):
+                    if r.done(now):
+                        chan.set_volume(r.target)  # exact end value
+                        del self.ramps[chan]
+                        r.future.set_result(True)
+                        automation.fades.inc(outcome='completed')
+                        automation.fadeSeconds.observe(now - r.begin)
+                    else:
+                        chan.set_volume(r.value(now))
+                self.cond.wait(1 / automation.RATE)
+
+
+automationEngine = automation()
+
+
 class effect:
     """Common audio effects
     """
-    def fadeOut(chan: mixer.Channel, desired_vol: int = 0):
-        asyncio.run(effect._fadeOut(chan, desired_vol))
+    LOUDNESS_STATS = ('loudness', 'lra', 'true_peak', 'threshold', 'offset')
 
-    def fadeIn(chan: mixer.Channel, desired_vol: int = 0):
-        asyncio.run(effect._fadeIn(chan, desired_vol))
-
-    async def _fadeOut(chan: mixer.Channel, desired_vol: int = 0):
-        """Fade out effect
+    def fadeOut(chan: mixer.Channel, desired_vol: float = 0, curve: str = 'linear') -> concurrent.futures.Future:
+        """Fade out effect. Does not block.
 
         Args:
             chan (mixer.Channel): the channel affected
-            desired_vol (int, optional): the vol after fading. Assumed lower than original. Defaults to 0.
+            desired_vol (float, optional): the vol after fading. Assumed lower than original. Defaults to 0.
+            curve (str, optional): 'linear' or 'equal_power'. Defaults to 'linear'.
+
+        Returns:
+            concurrent.futures.Future: resolves when the fade ends
         """
-        vol = chan.get_volume()
-        for i in range(1, configManager.cfg.audio.transition_length):
-            await asyncio.sleep(1/configManager.cfg.audio.transition_length)
-            chan.set_volume((configManager.cfg.audio.transition_length-i) /
-                            configManager.cfg.audio.transition_length*(vol-desired_vol)+desired_vol)
-        # Avoid float point error builds up
-        chan.set_volume(desired_vol)
+        return automationEngine.fade(chan, desired_vol, curve=curve)
 
-    async def _fadeIn(chan: mixer.Channel, desired_vol: int = 1):
-        """Fade in effect
+    def fadeIn(chan: mixer.Channel, desired_vol: float = 1, curve: str = 'linear') -> concurrent.futures.Future:
+        """Fade in effect. Does not block.
 
         Args:
             chan (mixer.Channel): the channel affected
-            desired_vol (int, optional): the vol after fading. Assumed higher than original. Defaults to 1.
-        """
-        vol = chan.get_volume()
-        for i in range(1, configManager.cfg.audio.transition_length):
-            await asyncio.sleep(1/configManager.cfg.audio.transition_length)
-            chan.set_volume(i/configManager.cfg.audio.transition_length *
-                            (desired_vol-vol)+vol)
-        # Avoid float point error builds up
-        chan.set_volume(desired_vol)
-
-    def normalize(file: str):
-        # allow +/- 1.5 LUFS error
-        if abs(ffmpegWrapper.getLoudness(file) - configManager.cfg.audio.loudness) > configManager.cfg.audio.loudness_tolerant:
-            p = effect._normalize(file, configManager.cfg.audio.loudness)
-            return p
-        else:
+            desired_vol (float, optional): the vol after fading. Assumed higher than original. Defaults to 1.
+            curve (str, optional): 'linear' or 'equal_power'. Defaults to 'linear'.
+
+        Returns:
+            concurrent.futures.Future: resolves when the fade ends
+        """
+        return automationEngine.fade(chan, desired_vol, curve=curve)
+
+    def cachedLoudness(file: str) -> dict:
+        """Loudness statistics known from the metadata cache. Does not probe.
+
+        Args:
+            file (str): path to sound
+
+        Returns:
+            dict: statistics, None if not measured yet
+        """
+        record = metaCache.lookup(file)
+        if record is None:
             return None
+        measured = {k: record.get(k) for k in effect.LOUDNESS_STATS}
+        return None if None in measured.values() else measured
 
-    def _normalize(file, loudness: None):
-        """Loudness normalization in parallel
+    def measureLoudness(file: str) -> dict:
+        """Measure loudness statistics. The in-process meter reuses the
+        playback decode if the sound is in the decoded cache, or reads PCM
+        from ffmpeg otherwise; without numpy the loudnorm analysis is used.
+
+        Args:
+            file (str): path to sound
+
+        Returns:
+            dict: statistics as ffmpegWrapper.measureLoudness, empty if measurement fails
+        """
+        if not meter.available():
+            return ffmpegWrapper.measureLoudness(file)
+        data = decodedCache.peek(file)
+        if data is not None:
+            channels = metaCache.get(file).get('channels')
+            if (channels or 0) <= mixer.get_init()[2]:
+                return meter.measureSound(data, channels)
+        return meter.measureFile(file)
+
+    def _normalize(file, loudness: None, measured: dict = None) -> bool:
+        """Loudness normalization
 
         Args:
             file (str): path to sound
             loudness (int): a negative value in LUFS
+            measured (dict, optional): measured loudness statistics for a linear pass. Defaults to None.
 
         Returns:
-            multiprocessing.Process: a process running the normalization wrapper,
-            or nothing if loudness check fails
+            bool: True if normalized, False if loudness check or normalization fails
         """
         if loudness is None:
             loudness = configManager.cfg.audio.loudness
@@ -100,12 +528,117 @@ class effect:
             assert loudness <= 0
         except AssertionError:
             logging.error("Invalid loudness valid in LUFS.")
-            return
+            return False
+
+        return ffmpegWrapper.normalizeLoudness(file, loudness, measured)
+
 
-        p = multiprocessing.Process(
-            name='FFMPEG '+file, target=ffmpegWrapper.normalizeLoudness, args=(file, loudness))
-        p.start()
-        return p
+def normalize(file: str, loudness: float, tolerance: float, measured: dict = None) -> tuple:
+    """Measure loudness and normalize if out of tolerance. Blocks until done,
+    meant to run in a worker pool, also in a worker process: it only takes
+    plain arguments and leaves the caches to the caller.
+
+    Args:
+        file (str): path to sound
+        loudness (float): target in LUFS
+        tolerance (float): allowed deviation in LU
+        measured (dict, optional): known loudness statistics. Defaults to None, i.e. measure.
+
+    Returns:
+        tuple: (True if the file has been normalized, statistics measured before, None if given)
+    """
+    stats = None
+    if measured is None:
+        measured = stats = effect.measureLoudness(file)
+        if not measured:
+            raise RuntimeError("Loudness measurement failed")
+    if abs(measured['loudness'] - loudness) > tolerance:
+        if not effect._normalize(file, loudness, measured):
+            raise RuntimeError("Loudness normalization failed")
+        return True, stats
+    return False, stats
+
+
+class streamChannel:
+    """Channel that can also stream long sounds from disk through mixer.music,
+    which decodes on the fly with constant memory. It keeps the mixer.Channel
+    interface, so fades and ducking apply to whichever source is playing.
+    Only one streamChannel can exist since mixer.music is global.
+    """
+    def __init__(self, chan: mixer.Channel) -> None:
+        self.chan = chan
+        self.streaming = False
+        self.paused = False
+        self.volume = chan.get_volume()
+
+    def play(self, data: mixer.Sound, loops=0, maxtime=0, fade_ms=0):
+        if self.streaming:
+            mixer.music.stop()
+            self.streaming = False
+        self.paused = False
+        self.chan.set_volume(self.volume)
+        self.chan.play(data, loops, maxtime, fade_ms)
+
+    def stream(self, path: str, fade_ms=0):
+        """Stream a sound file
+
+        Args:
+            path (str): path to sound file
+            fade_ms (int, optional): fade in length in ms. Defaults to 0.
+        """
+        self.chan.stop()
+        mixer.music.load(path)
+        mixer.music.set_volume(self.volume)
+        mixer.music.play(fade_ms=fade_ms)
+        self.streaming = True
+        self.paused = False
+
+    def get_busy(self) -> bool:
+        if self.streaming:
+            # music is not busy while paused
+            return self.paused or mixer.music.get_busy()
+        return self.chan.get_busy()
+
+    def get_volume(self) -> float:
+        return self.volume
+
+    def set_volume(self, vol: float):
+        self.volume = vol
+        self.chan.set_volume(vol)
+        if self.streaming:
+            mixer.music.set_volume(vol)
+
+    def pause(self):
+        self.paused = True
+        self.chan.pause()
+        if self.streaming:
+            mixer.music.pause()
+
+    def unpause(self):
+        self.paused = False
+        self.chan.unpause()
+        if self.streaming:
+            mixer.music.unpause()
+
+    def stop(self):
+        self.chan.stop()
+        if self.streaming:
+            mixer.music.stop()
+            self.streaming = False
+
+    def fadeout(self, time: int):
+        self.chan.fadeout(time)
+        if self.streaming:
+            mixer.music.fadeout(time)
+
+    def get_sound(self) -> mixer.Sound:
+        return self.chan.get_sound()
+
+    def queue(self, data: mixer.Sound):
+        self.chan.queue(data)
+
+    def get_queue(self) -> mixer.Sound:
+        return self.chan.get_queue()
 
 
 class virtualMixerWrapper(Singleton):
@@ -115,19 +648,22 @@ class virtualMixerWrapper(Singleton):
         DEFAULT_CHANNEL = ["stationID", "show", "fill", "PSA"]
         self.lock = threading.RLock()
         self.mixer = mixer
-        self.mixer.init()
+        self.mixer.init(**configManager.cfg.audio.mixer)
         All_CHANNEL = DEFAULT_CHANNEL + configManager.cfg.audio.user_channels
         self.mixer.set_num_channels(len(All_CHANNEL))
         self.mixer.music.set_volume(1)
         self.channelMap = {}
         for i, chan in enumerate(All_CHANNEL):
             self.channelMap[chan] = self.mixer.Channel(i)
+        # long shows are streamed
+        self.channelMap['show'] = streamChannel(self.channelMap['show'])
         self.channelLastPlayed = {}
         for _, chan in enumerate(All_CHANNEL):
             self.channelLastPlayed[chan] = None
         self.vol = {}
         self.muted = False
         self.paused = False
+        self.listeners = []  # called on pause / resume
 
     def digest(self):
         """What's playing in each channel.
@@ -155,6 +691,7 @@ class virtualMixerWrapper(Singleton):
             if self.muted == True:
                 return
             for _, chan in self.channelMap.items():
+                automationEngine.cancel(chan)
                 chan.set_volume(0)
             self.muted = True
             logging.warning("All channels muted.")
@@ -164,6 +701,7 @@ class virtualMixerWrapper(Singleton):
             if self.muted == False:
                 return
             for _, chan in self.channelMap.items():
+                automationEngine.cancel(chan)
                 chan.set_volume(1)
             self.muted = False
             logging.warning("All channels unmuted.")
@@ -176,6 +714,7 @@ class virtualMixerWrapper(Singleton):
                 chan.pause()
             self.paused = True
             logging.warning("All channels paused.")
+        self.notify()
 
     def resume(self):
         with self.lock:
@@ -185,9 +724,15 @@ class virtualMixerWrapper(Singleton):
                 chan.unpause()
             self.paused = False
             logging.warning("All channels resumed.")
+        self.notify()
+
+    def notify(self):
+        for fn in self.listeners:
+            fn()
 
     def fadeout(self, length):
         self.mixer.fadeout(length)
+        self.mixer.music.fadeout(length)
 
     def volumeUp(self):
         with self.lock:
@@ -204,6 +749,7 @@ class virtualMixerWrapper(Singleton):
                 target = vol + deviation
                 target = min(target, 1.0)
                 target = max(target, 0)
+                automationEngine.cancel(self.channelMap[name])
                 self.channelMap[name].set_volume(target)
 
     def get_init(self):
@@ -218,6 +764,9 @@ class virtualMixerWrapper(Singleton):
     def destroy(self):
         with self.lock:
             if self.mixer.get_init():
-                self.mixer.fadeout(configManager.cfg.audio.transition_length)
+                self.fadeout(configManager.cfg.audio.transition_length)
                 self.mixer.stop()
+                self.mixer.music.stop()
+            for chan in self.channelMap.values():
+                automationEngine.cancel(chan)  # no ramps on a closed mixer
             self.mixer.quit()
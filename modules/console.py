@@ -0,0 +1,156 @@
+import collections
+import os
+import threading
+
+from .util import configManager
+
+
+def logFiles() -> list:
+    """Log files written by the rotating file handler, oldest first
+
+    Returns:
+        list: paths to log files
+    """
+    path = configManager.cfg.path.log
+    prefix = configManager.cfg.station.name + '.'
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return []
+    # the date suffix sorts chronologically
+    return [os.path.join(path, f) for f in sorted(names)
+            if f.startswith(prefix) and f.endswith('.log')]
+
+
+def reverseLines(files: list, blockSize: int = 64*1024):
+    """Read lines from the end of the newest file towards the start of the oldest
+
+    Args:
+        files (list): paths, oldest first
+        blockSize (int, optional): read size. Defaults to 64 KiB.
+
+    Yields:
+        str: lines, newest first
+    """
+    for file in reversed(files):
+        try:
+            f = open(file, 'rb')
+        except OSError:
+            continue
+        with f:
+            pos = f.seek(0, os.SEEK_END)  # size now, lines written later are live
+            if pos == 0:
+                continue
+            rest = None
+            while pos > 0:
+                step = min(blockSize, pos)
+                pos -= step
+                f.seek(pos)
+                block = f.read(step)
+                if rest is None:  # end of file
+                    block = block[:-1] if block.endswith(b'\n') else block
+                    rest = b''
+                lines = (block + rest).split(b'\n')
+                rest = lines.pop(0)  # may continue in the previous block
+                for line in reversed(lines):
+                    yield line.decode('utf-8', errors='replace').rstrip('\r')
+            yield rest.decode('utf-8', errors='replace').rstrip('\r')
+
+
+class logBuffer:
+    """Fixed-capacity log console buffer. Live lines go into a ring buffer;
+    older history is paged in from the log files on demand and dropped again
+    when the view returns to the bottom. Indexable like the list of lines a
+    text widget expects.
+    """
+    def __init__(self, capacity: int = 1000, historyLimit: int = 10000, files=logFiles) -> None:
+        """
+        Args:
+            capacity (int, optional): live lines kept. Defaults to 1000.
+            historyLimit (int, optional): max history lines paged in. Defaults to 10000.
+            files (callable, optional): returns log files, oldest first. Defaults to logFiles.
+        """
+        self.lock = threading.RLock()
+        self.live = collections.deque(maxlen=capacity)
+        self.older = collections.deque()  # paged in history, oldest first
+        self.historyLimit = historyLimit
+        self.files = files
+        self.reader = None
+        self.exhausted = False
+
+    def __len__(self) -> int:
+        return len(self.older) + len(self.live)
+
+    def __getitem__(self, i: int) -> str:
+        with self.lock:
+            if i < 0:
+                i += len(self)
+            if i < len(self.older):
+                return self.older[i]
+            return self.live[i - len(self.older)]
+
+    def extend(self, lines: list):
+        """Add live lines
+
+        Args:
+            lines (list): lines to add
+
+        Returns:
+            int: lines dropped at the top
+        """
+        with self.lock:
+            overflow = max(len(self.live) + len(lines) - self.live.maxlen, 0)
+            dropped = overflow
+            if self.older:
+                # keep history contiguous while it is paged in
+                for i in range(overflow):
+                    self.older.append(self.live[i] if i < len(self.live)
+                                      else lines[i - len(self.live)])
+                dropped = 0
+                while len(self.older) > self.historyLimit:
+                    self.older.popleft()
+                    dropped += 1
+                    self.exhausted = True  # cannot page past dropped lines
+            self.live.extend(lines)
+            return dropped
+
+    def append(self, line: str) -> int:
+        return self.extend([line])
+
+    def pageUp(self, count: int) -> int:
+        """Page in older lines from the log files
+
+        Args:
+            count (int): lines wanted
+
+        Returns:
+            int: lines added at the top
+        """
+        with self.lock:
+            if self.exhausted:
+                return 0
+            if self.reader is None:
+                self.reader = reverseLines(self.files())
+                # lines on screen are the newest ones in the files
+                for _ in range(len(self.live)):
+                    if next(self.reader, None) is None:
+                        self.exhausted = True
+                        return 0
+            count = min(count, self.historyLimit - len(self.older))
+            added = 0
+            for _ in range(count):
+                line = next(self.reader, None)
+                if line is None:
+                    self.exhausted = True
+                    break
+                self.older.appendleft(line)
+                added += 1
+            return added
+
+    def reset(self):
+        """Drop paged in history
+        """
+        with self.lock:
+            self.older.clear()
+            self.reader = None
+            self.exhausted = False
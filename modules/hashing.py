@@ -0,0 +1,95 @@
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from .util import fsUtil
+from .worker import workerPool
+
+
+class hashService:
+    """Content hashing on a pool of threads. hashlib releases the GIL while
+    hashing, so concurrent reads keep the disks busy instead of one core.
+    Throughput is measured over every batch.
+    """
+    def __init__(self, workers: int = 0) -> None:
+        """
+        Args:
+            workers (int, optional): hashing threads. Defaults to 0, i.e. cores plus four as reads mostly wait on I/O.
+        """
+        if not workers:
+            workers = min((os.cpu_count() or 1) + 4, 32)
+        self.pool = workerPool(workers, 'Hasher', level=logging.DEBUG)  # batches report on their own
+        self.lock = threading.Lock()
+        self.bytes = 0  # hashed in batches so far
+        self.seconds = 0  # wall time of those batches
+
+    def _sha256(self, path: str) -> tuple:
+        return fsUtil.sha256sum(path), os.path.getsize(path)
+
+    def sha256(self, path: str) -> concurrent.futures.Future:
+        """Hash a single file in the background
+
+        Args:
+            path (str): path to the file
+
+        Returns:
+            concurrent.futures.Future: resolves to the hash string
+        """
+        result = concurrent.futures.Future()
+
+        def done(f):
+            if f.cancelled():
+                result.cancel()
+            elif f.exception() is not None:
+                result.set_exception(f.exception())
+            else:
+                result.set_result(f.result()[0])
+        self.pool.submit(path, self._sha256, path).add_done_callback(done)
+        return result
+
+    def hashAll(self, paths: list) -> dict:
+        """Hash files concurrently. Blocks until all are done.
+
+        Args:
+            paths (list): paths to files
+
+        Returns:
+            dict: path -> hash, files that cannot be read are left out
+        """
+        if not paths:
+            return {}
+        start = time.time()
+        jobs = {self.pool.submit(p, self._sha256, p): p for p in paths}
+        hashes = {}
+        size = 0
+        for future in concurrent.futures.as_completed(jobs):
+            try:
+                h, n = future.result()
+            except concurrent.futures.CancelledError:
+                continue
+            except Exception as e:
+                logging.error("Cannot hash {}: {}".format(jobs[future], str(e)))
+                continue
+            hashes[jobs[future]] = h
+            size += n
+        elapsed = time.time() - start
+        with self.lock:
+            self.bytes += size
+            self.seconds += elapsed
+        logging.info("Hashed {} files, {:.1f} MB in {:.2f}s ({:.1f} MB/s).".format(
+            len(hashes), size / 1e6, elapsed, size / 1e6 / max(elapsed, 1e-6)))
+        return hashes
+
+    def throughput(self) -> float:
+        """Average hashing throughput of all batches
+
+        Returns:
+            float: MB/s
+        """
+        with self.lock:
+            return self.bytes / 1e6 / self.seconds if self.seconds else 0
+
+    def shutdown(self):
+        self.pool.shutdown()
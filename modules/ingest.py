@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from .util import configManager, fsUtil
+
+
+class ingestQueue:
+    """Debounced, prioritized ingest of files dropped into the library.
+
+    File system events are coalesced per path; a file is only processed once
+    its stat signature stayed unchanged for the debounce period, so partial
+    writes and copies in progress are not picked up. Settled files wait in a
+    priority queue (smallest first) and are handed to the worker pool no
+    faster than it has free workers.
+    """
+    TEMP_SUFFIXES = ('.part', '.tmp', '.crdownload', '.swp', '~')
+
+    def __init__(self, pool, process, onReady=None, debounce: float = 1) -> None:
+        """
+        Args:
+            pool (workerPool): pool running the jobs
+            process (callable): job run on each settled file, takes the path
+            onReady (callable, optional): called with (path, Future) when a job is done. Defaults to None.
+            debounce (float, optional): seconds a file must stay unchanged. Defaults to 1.
+        """
+        self.pool = pool
+        self.process = process
+        self.onReady = onReady
+        self.debounce = debounce
+        self.cond = threading.Condition()
+        self.pending = {}  # path -> (last event time, signature)
+        self.heap = []  # (priority, seq, path)
+        self.queued = set()
+        self.inflight = set()
+        self.seq = itertools.count()
+        self.stopped = False
+        self.thread = None
+
+    def ignored(path: str) -> bool:
+        """Editor temp files, hidden files and partial downloads are not ingested
+
+        Args:
+            path (str): path to the file
+
+        Returns:
+            bool: True if the file should be ignored
+        """
+        name = os.path.basename(path)
+        return name.startswith(('.', '~')) or name.lower().endswith(ingestQueue.TEMP_SUFFIXES) \
+            or not name.lower().endswith(tuple(configManager.cfg.audio.formats))
+
+    def notify(self, path: str):
+        """Record a file system event. Repeated events for a file only delay it.
+
+        Args:
+            path (str): path to the changed file
+        """
+        if ingestQueue.ignored(path):
+            return
+        try:
+            sig = fsUtil.signature(path)
+        except OSError:
+            return  # already gone
+        with self.cond:
+            self.pending[path] = (time.time(), sig)
+            self.cond.notify_all()
+
+    def _settle(self, now: float) -> float:
+        # move quiet, unchanged files to the priority queue, called with cond held
+        # returns seconds until the next pending file may settle, None if none
+        nextCheck = None
+        for path, (seen, sig) in list(self.pending.items()):
+            wait = seen + self.debounce - now
+            if wait > 0:
+                nextCheck = wait if nextCheck is None else min(nextCheck, wait)
+                continue
+            if path in self.queued or path in self.inflight:
+                # changed again while waiting, settle it once more afterwards
+                nextCheck = self.debounce if nextCheck is None else min(nextCheck, self.debounce)
+                continue
+            try:
+                current = fsUtil.signature(path)
+            except OSError:
+                del self.pending[path]  # deleted or moved away
+                continue
+            if current != sig:  # still being written
+                self.pending[path] = (now, current)
+                nextCheck = self.debounce if nextCheck is None else min(nextCheck, self.debounce)
+                continue
+            del self.pending[path]
+            heapq.heappush(self.heap, (current[0], next(self.seq), path))
+            self.queued.add(path)
+        return nextCheck
+
+    def _dispatch(self):
+        # hand queued files to free workers, called with cond held
+        while self.heap and len(self.inflight) < self.pool.workers:
+            _, _, path = heapq.heappop(self.heap)
+            self.queued.discard(path)
+            self.inflight.add(path)
+            future = self.pool.submit(path, self.process, path)
+            future.add_done_callback(
+                lambda f, path=path: self._done(path, f))
+
+    def _done(self, path: str, future):
+        with self.cond:
+            self.inflight.discard(path)
+            self.cond.notify_all()
+        if self.onReady is not None and not future.cancelled():
+            try:
+                self.onReady(path, future)
+            except Exception as e:
+                logging.error("Ingest of {} failed: {}".format(path, str(e)))
+
+    def progress(self) -> tuple:
+        """Ingest progress
+
+        Returns:
+            tuple: (pending, queued, inflight) file counts
+        """
+        with self.cond:
+            return len(self.pending), len(self.heap), len(self.inflight)
+
+    def _run(self):
+        with self.cond:
+            while not self.stopped:
+                timeout = self._settle(time.time())
+                self._dispatch()
+                self.cond.wait(timeout)
+
+    def start(self):
+        """Start processing events
+        """
+        with self.cond:
+            self.stopped = False
+        self.thread = threading.Thread(
+            name='Ingest', target=self._run, daemon=True)
+        self.thread.start()
+        logging.info("Ingest started.")
+
+    def stop(self):
+        """Stop processing events. Pending files are dropped.
+        """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
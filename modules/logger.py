@@ -1,12 +1,16 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 import time
 import re
 import smtplib
 import ssl
+import threading
 
 from .util import configManager
+from .alert import alertAggregator
 
 
 class ParallelTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
@@ -131,14 +135,112 @@ class ParallelTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler
         self.rolloverAt = newRolloverAt
 
 
+class logDispatcher(logging.handlers.QueueHandler):
+    """Root handler that only puts records on a bounded queue. A QueueListener
+    thread feeds the actual sinks, so a slow sink never blocks the caller.
+
+    Overflow policies when the queue is full:
+        'drop_oldest': discard the oldest queued record
+        'drop_new': discard the incoming record
+        'block': wait for space, at most `timeout` seconds
+    """
+    POLICIES = ('drop_oldest', 'drop_new', 'block')
+
+    def __init__(self, size: int = 10000, overflow: str = 'drop_oldest', timeout: float = 1) -> None:
+        assert overflow in logDispatcher.POLICIES
+        super().__init__(queue.Queue(maxsize=size))
+        self.overflow = overflow
+        self.timeout = timeout
+        self.dropped = 0
+        self.reported = 0
+        self.countLock = threading.Lock()  # dropped and reported
+
+    def _drop(self):
+        with self.countLock:
+            self.dropped += 1
+
+    def enqueue(self, record):
+        try:
+            if self.overflow == 'block':
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow != 'drop_oldest':
+                self._drop()
+                return
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self._drop()
+                except queue.Empty:
+                    pass  # drained meanwhile, there is room now
+                try:
+                    self.queue.put_nowait(record)
+                    break
+                except queue.Full:
+                    continue  # refilled by another thread, drop one more
+        with self.countLock:
+            missing = self.dropped - self.reported
+            if missing <= 0:
+                return
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'msg': "Log queue overflow: {} records dropped.".format(missing),
+                    'levelno': logging.WARNING, 'levelname': 'WARNING', 'threadName': 'Log'}))
+                self.reported += missing
+            except queue.Full:
+                pass
+
+
 class SSLSMTPHandler(logging.handlers.SMTPHandler):
+    """SMTP over STARTTLS. One session is kept open and reused; it is checked
+    with NOOP after being idle and reopened when the server dropped it.
+    """
+    def __init__(self, *args, keepalive: float = 300, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keepalive = keepalive
+        self.smtp = None
+        self.lastUsed = 0
+
+    def _connect(self):
+        port = 0
+        if self.mailport:
+            port = self.mailport
+        else:
+            port = 587
+        smtp = smtplib.SMTP(self.mailhost, port, timeout=self.timeout)
+        smtp.starttls(context=ssl.create_default_context())
+        smtp.login(self.username, self.password)
+        self.smtp = smtp
+
+    def _disconnect(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def _session(self) -> smtplib.SMTP:
+        # reuse the open session if the server still answers
+        if self.smtp is not None and time.time() - self.lastUsed > self.keepalive:
+            try:
+                if self.smtp.noop()[0] != 250:
+                    self._disconnect()
+            except (smtplib.SMTPException, OSError):
+                self.smtp = None
+        if self.smtp is None:
+            self._connect()
+        return self.smtp
+
     def emit(self, record):
         """
         Emit a record.
         """
+        if getattr(record, 'noAlert', False):
+            return  # about the alert itself, do not loop
         try:
-            context = ssl.create_default_context()
-
             from email.message import EmailMessage
             msg = EmailMessage()
             msg.set_content(self.format(record))
@@ -146,24 +248,27 @@ class SSLSMTPHandler(logging.handlers.SMTPHandler):
             msg["From"] = self.fromaddr
             msg["To"] = self.toaddrs
 
-            port = 0
-            if self.mailport:
-                port = self.mailport
-            else:
-                port = 587
-            with smtplib.SMTP(self.mailhost, port) as smtp:
-                smtp.starttls(context=context)
-                smtp.login(self.username, self.password)
-                smtp.send_message(msg)
-                logging.info("Email alert sent.")
+            try:
+                self._session().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # dropped since the last check, retry once on a new session
+                self.smtp = None
+                self._session().send_message(msg)
+            self.lastUsed = time.time()
+            logging.info("Email alert sent.", extra={'noAlert': True})
 
         # except (KeyboardInterrupt, SystemExit):
         #     raise
         except Exception as e:
+            self._disconnect()
             self.handleError(record)
-            logging.critical("Fail to send email alert: "+str(e))
+            logging.critical("Fail to send email alert: "+str(e),
+                             extra={'noAlert': True})
+
+    def close(self):
+        self._disconnect()
+        super().close()
 
-# TODO BufferedEmail for daily digest
 
 
 logFormatter = logging.Formatter(configManager.cfg.logger.log_format)
@@ -171,19 +276,22 @@ alertFormatter = logging.Formatter(configManager.cfg.logger.alert_format)
 rootLogger = logging.getLogger()
 rootLogger.level = logging.INFO
 
+sinks = []  # handlers fed by the dispatcher thread
+
+os.makedirs(configManager.cfg.path.log, exist_ok=True)
 fileHandler = ParallelTimedRotatingFileHandler(
     os.path.join(configManager.cfg.path.log, configManager.cfg.station.name), postfix='.log', encoding='utf-8', when='midnight', backupCount=0)
 fileHandler.setFormatter(logFormatter)
-rootLogger.addHandler(fileHandler)
+sinks.append(fileHandler)
 
 consoleHandler = logging.StreamHandler()
 consoleHandler.setFormatter(logFormatter)
-rootLogger.addHandler(consoleHandler)
+sinks.append(consoleHandler)
 
 consoleDetailHandler = logging.StreamHandler()
 consoleDetailHandler.setFormatter(alertFormatter)
 consoleDetailHandler.setLevel(logging.ERROR)
-rootLogger.addHandler(consoleDetailHandler)
+sinks.append(consoleDetailHandler)
 
 smtp_configManager = configManager.cfg.alert.smtp
 if smtp_configManager.enable:
@@ -193,10 +301,12 @@ if smtp_configManager.enable:
                                   subject=smtp_configManager.subject,
                                   credentials=(smtp_configManager.username,
                                                smtp_configManager.password),
+                                  timeout=smtp_configManager.timeout,
+                                  keepalive=smtp_configManager.keepalive,
                                   )
     smtp_handler.setFormatter(alertFormatter)
     smtp_handler.setLevel(logging.ERROR)
-    rootLogger.addHandler(smtp_handler)
+    sinks.append(alertAggregator(smtp_handler, **configManager.cfg.alert.aggregate))
 
 discord_configManager = configManager.cfg.alert.discord
 if discord_configManager.enable:
@@ -205,4 +315,22 @@ if discord_configManager.enable:
         discord_configManager.webhook, discord_configManager.agent, notify_users=discord_configManager.mentions)
     discord_handler.setFormatter(alertFormatter)
     discord_handler.setLevel(logging.WARNING)
-    rootLogger.addHandler(discord_handler)
+    sinks.append(alertAggregator(discord_handler, **configManager.cfg.alert.aggregate))
+
+# callers only enqueue, sinks run on the dispatcher thread
+dispatcher = logDispatcher(configManager.cfg.logger.queue_size,
+                           configManager.cfg.logger.overflow)
+rootLogger.addHandler(dispatcher)
+listener = logging.handlers.QueueListener(
+    dispatcher.queue, *sinks, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)  # flush on exit
+
+
+def addSink(handler: logging.Handler):
+    """Feed another handler from the dispatcher thread
+
+    Args:
+        handler (logging.Handler): the sink
+    """
+    listener.handlers = listener.handlers + (handler,)
@@ -0,0 +1,302 @@
+import logging
+import math
+
+from pygame import mixer
+
+from .util import configManager, ffmpegWrapper, metaCache
+
+# numpy is optional, loudness is measured by ffmpeg without it
+try:
+    import numpy
+    import pygame.sndarray
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    numpy = None
+
+
+class loudnessMeter:
+    """ITU-R BS.1770 / EBU R128 loudness meter on PCM blocks.
+
+    The signal is K-weighted by FFT convolution with the impulse response of
+    the two K-weighting biquads, so filtering is vectorized without scipy.
+    Only the weighted energy of every 100 ms hop is kept, from which the
+    momentary (400 ms), short-term (3 s), integrated (gated) loudness and
+    the loudness range are derived. Feed any number of blocks in order.
+    """
+    ABSOLUTE_GATE = -70  # LUFS
+    RELATIVE_GATE = -10  # LU, integrated loudness
+    LRA_GATE = -20  # LU, loudness range
+    FFT_SIZE = 2**17
+    PEAK_TAPS = 48  # 4x oversampling for true peak, 12 taps per phase
+    PEAK_BLOCK = 256  # frames screened at once for true peak
+
+    def __init__(self, rate: int, channels: int) -> None:
+        """
+        Args:
+            rate (int): sample rate in Hz
+            channels (int): channel count, 5.1 in FFmpeg order (L R C LFE Ls Rs)
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for the loudness meter")
+        self.rate = rate
+        self.channels = channels
+        self.hop = int(round(rate / 10))
+        # surround channels weigh 1.41, LFE is not measured
+        self.weights = numpy.ones(channels)
+        if channels == 6:
+            self.weights[:] = (1, 1, 1, 0, 1.41, 1.41)
+        ir = loudnessMeter.kWeighting(rate)
+        self.fftSize = loudnessMeter.FFT_SIZE
+        while self.fftSize < 2 * len(ir):
+            self.fftSize *= 2
+        self.step = self.fftSize - len(ir) + 1  # frames filtered per FFT
+        self.response = numpy.fft.rfft(ir, self.fftSize)
+        self.ringing = numpy.zeros((len(ir) - 1, channels))  # filter state
+        self.residual = numpy.zeros(0)  # weighted energy of the unfinished hop
+        self.hops = []  # weighted energy per hop, in blocks
+        self.phases = loudnessMeter.oversampler()
+        self.gain = numpy.abs(self.phases).sum(axis=0).max()
+        self.history = numpy.zeros((len(self.phases) - 1, int((self.weights > 0).sum())))
+        self.peak = 0
+        self.frames = 0
+
+    def kWeighting(rate: int):
+        """Impulse response of the K-weighting filter (high shelf then
+        RLB high-pass) at any sample rate, coefficients as in libebur128
+
+        Args:
+            rate (int): sample rate in Hz
+
+        Returns:
+            numpy.ndarray: impulse response, 250 ms long
+        """
+        f0, gain, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+        k = math.tan(math.pi * f0 / rate)
+        vh = 10 ** (gain / 20)
+        vb = vh ** 0.4996667741545416
+        a0 = 1 + k / q + k * k
+        shelfB = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+        shelfA = [1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+        f0, q = 38.13547087602444, 0.5003270373238773
+        k = math.tan(math.pi * f0 / rate)
+        a0 = 1 + k / q + k * k
+        highB = [1, -2, 1]
+        highA = [1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+        b = numpy.convolve(shelfB, highB)
+        a = numpy.convolve(shelfA, highA)
+        # sampled frequency response, the response has decayed by 60 dB
+        # within a few thousand samples, so the circular wrap is negligible
+        n = 1 << max(int(rate / 4) - 1, 1).bit_length()
+        z = numpy.exp(-1j * numpy.pi * numpy.arange(n // 2 + 1) / (n // 2))
+        h = numpy.polyval(b[::-1], z) / numpy.polyval(a[::-1], z)
+        return numpy.fft.irfft(h, n)[:int(rate / 4)]
+
+    def oversampler():
+        """Polyphase windowed-sinc interpolator for 4x true peak. The phase on
+        the original samples is left out, the sample peak covers it.
+
+        Returns:
+            numpy.ndarray: filter taps, shape (taps per phase, 3)
+        """
+        n = numpy.arange(loudnessMeter.PEAK_TAPS) - loudnessMeter.PEAK_TAPS // 2
+        taps = numpy.sinc(n / 4) * numpy.kaiser(loudnessMeter.PEAK_TAPS, 8)
+        return numpy.stack([taps[p::4][::-1] for p in range(1, 4)], axis=1)
+
+    def _samples(self, pcm):
+        pcm = numpy.asarray(pcm)
+        if pcm.ndim == 1:
+            pcm = pcm.reshape(-1, self.channels)
+        if pcm.dtype == numpy.uint8:
+            return (pcm.astype(numpy.float64) - 128) / 128
+        if numpy.issubdtype(pcm.dtype, numpy.integer):
+            return pcm / float(-numpy.iinfo(pcm.dtype).min)
+        return pcm.astype(numpy.float64)
+
+    def _truePeak(self, x):
+        # interpolated samples are bounded by the interpolator gain times the
+        # largest sample under the filter, so only blocks of frames that could
+        # exceed the peak found so far are oversampled
+        x = numpy.concatenate((self.history, x[:, self.weights > 0]))
+        self.history = x[len(x) - len(self.history):]
+        taps = len(self.phases)
+        outputs = len(x) - taps + 1
+        if outputs <= 0:
+            return
+        block = loudnessMeter.PEAK_BLOCK
+        blocks = -(-outputs // block)
+        amplitude = numpy.zeros((blocks + 1) * block)
+        amplitude[:len(x)] = numpy.abs(x).max(axis=1)
+        level = amplitude.reshape(-1, block).max(axis=1)
+        level = numpy.maximum(level[:-1], level[1:])  # a block's filter reaches into the next
+        candidates = numpy.flatnonzero(level * self.gain > self.peak)
+        if not len(candidates):
+            return
+        x = numpy.concatenate((x, numpy.zeros((blocks * block + taps - 1 - len(x), x.shape[1]))))
+        frames = candidates[:, None] * block + numpy.arange(block + taps - 1)
+        windows = sliding_window_view(x[frames], taps, axis=1)  # (blocks, block, channels, taps)
+        y = numpy.abs(windows @ self.phases)
+        last = outputs - candidates[-1] * block  # the rest of the last block is padding
+        self.peak = max(self.peak, float(y[:-1].max(initial=0)), float(y[-1, :last].max()))
+
+    def _filter(self, x):
+        y = numpy.fft.irfft(numpy.fft.rfft(x, self.fftSize, axis=0) * self.response[:, None],
+                            self.fftSize, axis=0)[:len(x) + len(self.ringing)]
+        y[:len(self.ringing)] += self.ringing
+        self.ringing = y[len(x):].copy()
+        return y[:len(x)]
+
+    def feed(self, pcm):
+        """Measure the next block of PCM
+
+        Args:
+            pcm (array): frames, shape (frames, channels) or interleaved.
+                Integer samples are scaled to full scale, floats are taken as is.
+        """
+        x = self._samples(pcm)
+        if not len(x):
+            return
+        self.frames += len(x)
+        self.peak = max(self.peak, float(numpy.abs(x[:, self.weights > 0]).max(initial=0)))
+        self._truePeak(x)
+        for i in range(0, len(x), self.step):
+            y = self._filter(x[i:i + self.step])
+            energy = numpy.concatenate((self.residual, (y * y) @ self.weights))
+            full = len(energy) // self.hop * self.hop
+            if full:
+                self.hops.append(energy[:full].reshape(-1, self.hop).sum(axis=1))
+            self.residual = energy[full:]
+
+    def _energies(self, hops: int):
+        # mean square of every window of `hops` hops, one per hop
+        e = numpy.concatenate(self.hops) if self.hops else numpy.zeros(0)
+        if len(e) < hops:
+            return numpy.zeros(0)
+        s = numpy.concatenate(([0], numpy.cumsum(e)))
+        return (s[hops:] - s[:-hops]) / (hops * self.hop)
+
+    def _lufs(self, energy):
+        with numpy.errstate(divide='ignore'):
+            return -0.691 + 10 * numpy.log10(energy)
+
+    def _gate(self, energy, relative: float):
+        # blocks above the absolute gate and the gate relative to their mean
+        energy = energy[self._lufs(energy) > loudnessMeter.ABSOLUTE_GATE]
+        if not len(energy):
+            return energy, float(loudnessMeter.ABSOLUTE_GATE)
+        threshold = float(self._lufs(energy.mean())) + relative
+        return energy[self._lufs(energy) > threshold], threshold
+
+    def momentary(self):
+        """Momentary loudness every 100 ms
+
+        Returns:
+            numpy.ndarray: LUFS
+        """
+        return self._lufs(self._energies(4))
+
+    def shortTerm(self):
+        """Short-term loudness every 100 ms
+
+        Returns:
+            numpy.ndarray: LUFS
+        """
+        return self._lufs(self._energies(30))
+
+    def integrated(self) -> tuple:
+        """Gated integrated loudness
+
+        Returns:
+            tuple: loudness (LUFS, -inf if silent) and the relative gate threshold (LUFS)
+        """
+        gated, threshold = self._gate(self._energies(4), loudnessMeter.RELATIVE_GATE)
+        if not len(gated):
+            return -math.inf, threshold
+        return float(self._lufs(gated.mean())), threshold
+
+    def lra(self) -> float:
+        """Loudness range (EBU Tech 3342)
+
+        Returns:
+            float: LU, 0 if shorter than one short-term block
+        """
+        gated, _ = self._gate(self._energies(30), loudnessMeter.LRA_GATE)
+        if not len(gated):
+            return 0.0
+        low, high = numpy.percentile(self._lufs(gated), (10, 95))
+        return float(high - low)
+
+    def truePeak(self) -> float:
+        """Maximum true peak
+
+        Returns:
+            float: dBTP, -inf if silent
+        """
+        return 20 * math.log10(self.peak) if self.peak > 0 else -math.inf
+
+    def stats(self) -> dict:
+        """Statistics in the form of ffmpegWrapper.measureLoudness
+
+        Returns:
+            dict: loudness (LUFS), lra (LU), true_peak (dBTP), threshold
+            (LUFS) and offset (LU). The offset only tunes the dynamic mode of
+            loudnorm and is left at 0.
+        """
+        loudness, threshold = self.integrated()
+        return {'loudness': loudness, 'lra': self.lra(), 'true_peak': self.truePeak(),
+                'threshold': threshold, 'offset': 0.0}
+
+
+def available() -> bool:
+    """Whether loudness is measured in process
+
+    Returns:
+        bool: True if numpy is installed and the meter is enabled in config
+    """
+    return numpy is not None and configManager.cfg.audio.meter == 'internal'
+
+
+def measureSound(data: mixer.Sound, channels: int = None, block: float = 10) -> dict:
+    """Measure a sound decoded for playback, without decoding it again
+
+    Args:
+        data (mixer.Sound): decoded sound in the mixer format
+        channels (int, optional): channels of the source file. Mono sources are
+            duplicated by the mixer and measured on one channel. Defaults to None, all.
+        block (float, optional): seconds converted to float at a time. Defaults to 10.
+
+    Returns:
+        dict: statistics as loudnessMeter.stats
+    """
+    freq, fmt, mixerChannels = mixer.get_init()
+    samples = pygame.sndarray.samples(data).reshape(-1, mixerChannels)
+    channels = min(channels or mixerChannels, mixerChannels)
+    meter = loudnessMeter(freq, channels)
+    step = int(block * freq)
+    for i in range(0, len(samples), step):
+        meter.feed(samples[i:i + step, :channels])
+    return meter.stats()
+
+
+def measureFile(file: str, block: float = 10) -> dict:
+    """Measure a file decoded to PCM by ffmpeg, block by block with bounded memory
+
+    Args:
+        file (str): path to sound file
+        block (float, optional): seconds read at a time. Defaults to 10.
+
+    Returns:
+        dict: statistics as loudnessMeter.stats, empty if decoding fails
+    """
+    record = metaCache.get(file)
+    rate = record.get('sample_rate') or 48000
+    channels = record.get('channels') or 2
+    try:
+        meter = loudnessMeter(rate, channels)
+        for chunk in ffmpegWrapper.decode(file, rate, channels, int(block * rate)):
+            meter.feed(numpy.frombuffer(chunk, dtype=numpy.float32))
+        measured = meter.stats()
+        logging.debug("Loudness of {} is {} LUFS".format(file, measured['loudness']))
+        return measured
+    except Exception as e:
+        logging.error("Error occured in the loudness measurement of {}: {}".format(file, str(e)))
+    return {}
@@ -0,0 +1,327 @@
+import bisect
+import http.server
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+
+class metric:
+    """A named metric, with one value per combination of label values
+    """
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        """
+        Args:
+            name (str): metric name
+            help (str): one line description
+            labels (tuple, optional): label names. Defaults to ().
+        """
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = OrderedDict()  # label values -> value
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, '')) for n in self.labelNames)
+
+    def labelSets(self) -> list:
+        """Label combinations seen so far
+
+        Returns:
+            list: dicts of label name -> value
+        """
+        with self.lock:
+            return [dict(zip(self.labelNames, k)) for k in self.values]
+
+    def samples(self) -> list:
+        """Current values
+
+        Returns:
+            list: (name suffix, labels, value)
+        """
+        with self.lock:
+            return [('', dict(zip(self.labelNames, k)), v) for k, v in self.values.items()]
+
+
+class counter(metric):
+    """Monotonically increasing count
+    """
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class gauge(metric):
+    """Value that goes up and down. Either set, or read from a callback
+    when collected.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None) -> None:
+        """
+        Args:
+            name (str): metric name
+            help (str): one line description
+            labels (tuple, optional): label names. Defaults to ().
+            fn (callable, optional): returns the value, for a gauge without labels. Defaults to None.
+        """
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def labelSets(self) -> list:
+        if self.fn is not None:
+            return [{}]
+        return super().labelSets()
+
+    def get(self, **labels) -> float:
+        if self.fn is not None:
+            return self.fn()
+        with self.lock:
+            return self.values.get(self._key(labels))
+
+    def samples(self) -> list:
+        if self.fn is None:
+            return super().samples()
+        try:
+            return [('', {}, self.fn())]
+        except Exception as e:
+            logging.debug("Gauge {} unavailable: {}".format(self.name, str(e)))
+            return []
+
+
+class histogram(metric):
+    """Distribution of observed values, counted in cumulative buckets
+    """
+    TYPE = 'histogram'
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = None) -> None:
+        """
+        Args:
+            name (str): metric name
+            help (str): one line description
+            labels (tuple, optional): label names. Defaults to ().
+            buckets (tuple, optional): ascending upper bounds. Defaults to BUCKETS.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets or histogram.BUCKETS)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            v = self.values.get(key)
+            if v is None:
+                v = self.values[key] = [[0] * len(self.buckets), 0.0, 0]  # counts, sum, count
+            v[0][i] += 1
+            v[1] += value
+            v[2] += 1
+
+    def summary(self, **labels) -> dict:
+        """Count, mean and 95th percentile of the observations. Without labels,
+        all label values are merged.
+
+        Returns:
+            dict: count, sum, mean and p95; None without observations
+        """
+        with self.lock:
+            if labels or not self.labelNames:
+                values = [self.values.get(self._key(labels))]
+            else:
+                values = list(self.values.values())
+            values = [v for v in values if v is not None]
+            counts = [sum(c) for c in zip(*(v[0] for v in values))]
+            total = sum(v[1] for v in values)
+            n = sum(v[2] for v in values)
+        if n == 0:
+            return None
+        return {'count': n, 'sum': total, 'mean': total / n, 'p95': self._quantile(0.95, counts, n)}
+
+    def _quantile(self, q: float, counts: list, n: int) -> float:
+        # linear interpolation within the bucket, as Prometheus histogram_quantile
+        rank = q * n
+        seen = 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                upper = self.buckets[i]
+                lower = self.buckets[i - 1] if i else 0
+                if math.isinf(upper):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-2]
+
+    def samples(self) -> list:
+        out = []
+        with self.lock:
+            for k, (counts, total, n) in self.values.items():
+                labels = dict(zip(self.labelNames, k))
+                cumulative = 0
+                for le, c in zip(self.buckets, counts):
+                    cumulative += c
+                    out.append(('_bucket', dict(labels, le=le), cumulative))
+                out.append(('_sum', labels, total))
+                out.append(('_count', labels, n))
+        return out
+
+
+class registry:
+    """All metrics of the process, rendered in the Prometheus text format
+    """
+    def __init__(self, namespace: str = None) -> None:
+        """
+        Args:
+            namespace (str, optional): prefix of the exported names. Defaults to None.
+        """
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.metrics = OrderedDict()  # name -> metric
+
+    def _get(self, cls, name: str, *args, **kwargs) -> metric:
+        with self.lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = self.metrics[name] = cls(name, *args, **kwargs)
+            assert type(m) is cls, "{} is already a {}".format(name, m.TYPE)
+            return m
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> counter:
+        return self._get(counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: tuple = (), fn=None) -> gauge:
+        """Get or create a gauge. A callback replaces the one registered
+        before, i.e. by an earlier instance of the owner.
+        """
+        m = self._get(gauge, name, help, labels)
+        if fn is not None:
+            m.fn = fn
+        return m
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = None) -> histogram:
+        return self._get(histogram, name, help, labels, buckets)
+
+    def get(self, name: str) -> metric:
+        with self.lock:
+            return self.metrics.get(name)
+
+    def collect(self) -> list:
+        """All metrics, in registration order
+
+        Returns:
+            list: metrics
+        """
+        with self.lock:
+            return list(self.metrics.values())
+
+    @staticmethod
+    def _value(v: float) -> str:
+        if math.isinf(v):
+            return '+Inf' if v > 0 else '-Inf'
+        if math.isnan(v):
+            return 'NaN'
+        return repr(float(v)) if isinstance(v, float) else str(v)
+
+    @staticmethod
+    def _labels(labels: dict) -> str:
+        if not labels:
+            return ''
+        escaped = (str(v if not isinstance(v, float) else registry._value(v))
+                   .replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for v in labels.values())
+        return '{' + ','.join('{}="{}"'.format(k, v) for k, v in zip(labels, escaped)) + '}'
+
+    def render(self) -> str:
+        """Text exposition of all metrics
+
+        Returns:
+            str: metrics in the Prometheus text format, version 0.0.4
+        """
+        lines = []
+        for m in self.collect():
+            name = '{}_{}'.format(self.namespace, m.name) if self.namespace else m.name
+            lines.append('# HELP {} {}'.format(name, m.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(name, m.TYPE))
+            for suffix, labels, value in m.samples():
+                if value is None:
+                    continue
+                lines.append('{}{}{} {}'.format(name, suffix, registry._labels(labels), registry._value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class metricsServer:
+    """Serve a registry on GET /metrics from a background thread
+    """
+    def __init__(self, reg: registry, host: str = '127.0.0.1', port: int = 9464) -> None:
+        """
+        Args:
+            reg (registry): metrics served
+            host (str, optional): address to bind. Defaults to '127.0.0.1'.
+            port (int, optional): port, 0 for any free one. Defaults to 9464.
+        """
+        self.registry = reg
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def _handler(self):
+        reg = self.registry
+
+        class handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = reg.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("Metrics request: " + format % args)
+
+        return handler
+
+    def start(self):
+        """Start serving
+
+        Raises:
+            OSError: if the address cannot be bound
+        """
+        if self.server is not None:
+            return
+        self.server = http.server.ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            name='Metrics', target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info("Metrics served on http://{}:{}/metrics".format(self.host, self.port))
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(5)
+        self.server = None
+        self.thread = None
+
+
+metricsRegistry = registry('wrpi')
@@ -0,0 +1,281 @@
+import collections
+import logging
+import threading
+import time
+
+from pygame import mixer
+import pygame
+
+# numpy is optional, only needed when crossfade is enabled
+try:
+    import numpy
+    import pygame.sndarray
+except ImportError:
+    numpy = None
+
+
+class crossfadeMixer:
+    """Gapless crossfade engine. Consecutive sounds are mixed in PCM with an
+    equal-power crossfade and rendered block by block into a single channel
+    through Channel.queue. Sound data is referenced as array views, only the
+    overlapping region and the current block are copied.
+    """
+    def __init__(self, chan: mixer.Channel, advance, fetch, overlap: int = 3000, block: int = 500, onPlay=None,
+                 samples=None) -> None:
+        """
+        Args:
+            chan (mixer.Channel): output channel
+            advance (callable): returns the next sound to play, or None
+            fetch (callable): returns decoded mixer.Sound of a sound
+            overlap (int, optional): crossfade length in ms. Defaults to 3000.
+            block (int, optional): render block length in ms. Defaults to 500.
+            onPlay (callable, optional): called with each sound as it starts. Defaults to None.
+            samples (callable, optional): returns frames of a sound read in place, i.e. from
+                a memory map, or None to fetch it. Defaults to None.
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for crossfade")
+        self.chan = chan
+        self.advance = advance
+        self.fetch = fetch
+        self.freq, fmt, self.channels = mixer.get_init()
+        self.overlap = int(overlap * self.freq / 1000)
+        self.block = int(block * self.freq / 1000)
+        self.segments = collections.deque()  # finalized frames, in play order
+        self.last = None  # remaining frames of the last sound, its tail is held back for mixing
+        self.marks = collections.deque()  # (frame, sound) where each sound starts
+        self.rendered = 0  # frames rendered so far
+        self.streamNext = None  # a long sound that must be streamed instead
+        self.upcoming = None  # (sound, frames) fetched, not yet appended
+        self.nowPlaying = None
+        self.onPlay = onPlay
+        self.samples = samples
+        self.renderTime = 0
+        self.thread = None
+        self.lock = threading.Lock()  # segments, last and marks, shared with skip
+        self.streaming = False
+        self.skipped = threading.Event()
+        self.stopped = threading.Event()
+
+    def _toArray(self, data: mixer.Sound):
+        a = pygame.sndarray.samples(data)  # a view, keeps the sound alive
+        return a.reshape(len(a), self.channels)
+
+    def _fade(self, n: int):
+        t = numpy.linspace(0, 1, n, dtype=numpy.float32)[:, None]
+        return numpy.cos(t * numpy.pi / 2), numpy.sin(t * numpy.pi / 2)
+
+    def _mix(self, tail, head):
+        fadeOut, fadeIn = self._fade(len(tail))
+        mixed = tail * fadeOut + head * fadeIn
+        if numpy.issubdtype(tail.dtype, numpy.integer):
+            info = numpy.iinfo(tail.dtype)
+            mixed = numpy.clip(numpy.rint(mixed), info.min, info.max)
+        return mixed.astype(tail.dtype)
+
+    def append(self, s, data):
+        """Append a sound, crossfading it with the tail of the previous one
+
+        Args:
+            s (sound): the sound
+            data (array): its PCM frames, shape (frames, channels)
+        """
+        pending = sum(len(seg) for seg in self.segments)
+        if self.last is None:
+            self.marks.append((self.rendered + pending, s))
+            self.last = data
+            return
+        n = min(self.overlap, len(self.last), len(data))
+        start = self.rendered + pending + len(self.last) - n
+        if n > 0:
+            self.segments.append(self.last[:-n])
+            self.segments.append(self._mix(self.last[-n:], data[:n]))
+        else:
+            self.segments.append(self.last)
+        self.marks.append((start, s))
+        self.last = data[n:]
+
+    def _pending(self) -> int:
+        # frames that can be rendered before the next sound is needed
+        held = len(self.last) - self.overlap if self.last is not None else 0
+        return sum(len(seg) for seg in self.segments) + max(held, 0)
+
+    def _prepare(self):
+        # resolve and fetch the next sound, may decode, so not called with the lock held
+        if self.upcoming is not None or self.streamNext is not None:
+            return
+        s = self.advance()
+        if s is None:
+            return
+        if s.isStreamed():
+            self.streamNext = s
+            return
+        data = self.samples(s.path) if self.samples is not None else None
+        if data is None:
+            data = self._toArray(self.fetch(s))
+        self.upcoming = (s, data)
+
+    def _extend(self) -> bool:
+        if self.upcoming is None:
+            self._prepare()
+        if self.upcoming is None:
+            return False
+        s, data = self.upcoming
+        self.upcoming = None
+        self.append(s, data)
+        return True
+
+    def render(self, frames: int):
+        """Render the next block
+
+        Args:
+            frames (int): block length in frames
+
+        Returns:
+            array: PCM frames, None if nothing left to play
+        """
+        pieces = []
+        need = frames
+        while need > 0:
+            if self.segments:
+                seg = self.segments[0]
+                piece = seg[:need]
+                if len(seg) <= need:
+                    self.segments.popleft()
+                else:
+                    self.segments[0] = seg[need:]
+            elif self.last is not None and len(self.last) > self.overlap:
+                k = min(need, len(self.last) - self.overlap)
+                piece = self.last[:k]
+                self.last = self.last[k:]
+            elif not self._extend():
+                # nothing to mix with, let the held back tail out
+                if self.last is None:
+                    break
+                self.segments.append(self.last)
+                self.last = None
+                continue
+            else:
+                continue
+            pieces.append(piece)
+            self.rendered += len(piece)
+            need -= len(piece)
+        if not pieces:
+            return None
+        return numpy.ascontiguousarray(numpy.concatenate(pieces))
+
+    def skip(self, fade: int = 0):
+        """Drop the rest of the current sound and continue with the next one.
+        Audio already queued on the channel still plays, then the pending
+        frames fade out.
+
+        Args:
+            fade (int, optional): fade out length in ms. Defaults to 0.
+        """
+        self.skipped.set()
+        if self.streaming:
+            self.chan.fadeout(fade)
+            return
+        with self.lock:
+            need = int(fade * self.freq / 1000)
+            pending = list(self.segments) + ([self.last] if self.last is not None else [])
+            tail = []
+            for seg in pending:
+                if need <= 0:
+                    break
+                tail.append(seg[:need])
+                need -= len(tail[-1])
+            self.segments.clear()
+            self.last = None
+            self.marks.clear()
+            if tail:
+                tail = numpy.concatenate(tail)
+                self.segments.append(self._mix(tail, numpy.zeros_like(tail)))
+        logging.info("Skipped \"{}\"".format(self.nowPlaying.path if self.nowPlaying else None))
+
+    def _updateNowPlaying(self):
+        # sounds starting within the queued audio count as playing
+        while self.marks and self.marks[0][0] < self.rendered:
+            self.nowPlaying = self.marks.popleft()[1]
+            logging.info("Playing \"{}\" Length {} (crossfade)".format(
+                self.nowPlaying.path, self.nowPlaying.strDuration()))
+            if self.onPlay is not None:
+                self.onPlay(self.nowPlaying)
+
+    def _feed(self) -> bool:
+        with self.lock:
+            short = self._pending() < self.block
+        if short:
+            self._prepare()  # outside the lock, a skip must not wait for a decode
+        start = time.perf_counter()
+        with self.lock:
+            out = self.render(self.block)
+        self.renderTime = time.perf_counter() - start
+        if self.renderTime > self.block / self.freq / 2:
+            logging.warning("Crossfade rendering is slow: {:.3f}s for a {:.3f}s block.".format(
+                self.renderTime, self.block / self.freq))
+        if out is None:
+            return False
+        data = pygame.sndarray.make_sound(
+            out if self.channels > 1 else out[:, 0])
+        if self.chan.get_busy():
+            self.chan.queue(data)
+        else:
+            self.chan.play(data)
+        with self.lock:
+            self._updateNowPlaying()
+        return True
+
+    def _streamLong(self):
+        s, self.streamNext = self.streamNext, None
+        self.nowPlaying = s
+        if self.onPlay is not None:
+            self.onPlay(s)
+        try:
+            self.chan.stream(s.path)
+        except (pygame.error, AttributeError) as e:
+            logging.error("Cannot stream {}: {}".format(s.path, str(e)))
+            return
+        logging.info("Streaming \"{}\" Length {}".format(s.path, s.strDuration()))
+        self.skipped.clear()
+        self.streaming = True
+        try:
+            self.skipped.wait(max(s.getDuration() - 1, 0))  # also set on stop
+            while self.chan.get_busy() and not self.stopped.is_set():
+                time.sleep(0.005)
+        finally:
+            self.streaming = False
+
+    def _run(self):
+        interval = self.block / self.freq / 4
+        while not self.stopped.is_set():
+            try:
+                if self.chan.get_queue() is None:
+                    if not self._feed():
+                        if self.streamNext is not None:
+                            # let queued audio drain, then stream
+                            while self.chan.get_busy() and not self.stopped.is_set():
+                                time.sleep(0.005)
+                            self._streamLong()
+                            continue
+                        self.stopped.wait(1)
+                        continue
+            except Exception as e:
+                logging.error("Crossfade error: " + str(e))
+                self.stopped.wait(1)
+            self.stopped.wait(interval)
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            name='Crossfade', target=self._run, daemon=True)
+        self.thread.start()
+        logging.info("Crossfade engine started, overlap {:.1f}s.".format(
+            self.overlap / self.freq))
+
+    def stop(self):
+        self.stopped.set()
+        self.skipped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
@@ -1,5 +1,8 @@
+import collections
+import concurrent.futures
 import datetime
 import logging
+import os
 import threading
 import time
 import random as rnd
@@ -7,21 +10,45 @@ import random as rnd
 from pygame import mixer
 import pygame
 
-from .audio import virtualMixerWrapper, effect, sound
+from .audio import virtualMixerWrapper, streamChannel, effect, sound, decodedCache, decodedPrefetch
 from .util import configManager, fsUtil
+from .metrics import metricsRegistry
+from .mixing import crossfadeMixer
+from .transcode import transcodedCache
+from .playlist import playlist
 
 
 class control:
     """Play controls. Keep multi-channel info & control for internal virtual mixer.
     """
+    END_MARGIN = 0.05  # wake up this long before a sound should end
+    END_POLL_INTERVAL = 0.005  # poll interval around the end of a sound
+    IDLE_INTERVAL = 1
+    FAIL_BACKOFF = 0.1  # wait after a sound fails to play, doubled per consecutive failure
+    gapSeconds = metricsRegistry.histogram('playout_gap_seconds', 'Silence between consecutive sounds',
+                                           buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 5))
     def __init__(self, m: virtualMixerWrapper) -> None:
+        self.virtualMixer = m
         self.mixer = m.mixer
         self.mixerLock = m.lock
         self.channelMap = m.channelMap
         self.channelLastPlayed = m.channelLastPlayed
-        self.queue = []  # For play_loop use
+        self.queue = playlist()  # For play_loop use
         self.index = 0
         self.mode = 'loop'
+        self.playType = 'show'  # audio type of the playout queue
+        self.pendingFetch = None  # (sound, Future, request time) of the next sound
+        # playout engine
+        self.playout = None
+        self.crossfader = None
+        self.playoutStopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.expectedEnd = None  # when the current sound should end
+        self.lastBusy = None  # last time the channel was seen busy
+        self.pausedSince = None
+        self.failures = 0  # consecutive sounds that failed to play
+        self.gaps = collections.deque(maxlen=100)  # seconds of silence between sounds
+        m.listeners.append(self.wake)
         pass
 
     def play_file(self, s: sound, chan: mixer.Channel) -> float:
@@ -35,8 +62,20 @@ class control:
             float: duration of the sound file
         """
         try:
+            if s.isStreamed() and isinstance(chan, streamChannel):
+                try:
+                    chan.stream(
+                        s.path, fade_ms=configManager.cfg.audio.transition_length)
+                    decodedCache.unpin(chan)
+                    logging.info("Streaming \"" + s.path +
+                                 "\" Length " + s.strDuration())
+                    return s.getDuration()
+                except pygame.error as e:
+                    logging.error("Cannot stream {}, decoding instead: {}".format(
+                        s.path, str(e)))
+            decodedCache.pin(s.path, chan)
             chan.play(
-                s.getData(), fade_ms=configManager.cfg.audio.transition_length)
+                self.fetch(s), fade_ms=configManager.cfg.audio.transition_length)
             logging.info("Playing \"" + s.path +
                          "\" Length " + s.strDuration())
             return s.getDuration()
@@ -45,6 +84,26 @@ class control:
         except Exception as e:
             logging.error("Cannot play sound " + s.path + ": " + str(e))
 
+    def fetch(self, s: sound) -> mixer.Sound:
+        """Get decoded data from the prefetcher. Waits if it is not ready yet.
+
+        Args:
+            s (sound): sound to fetch
+
+        Returns:
+            mixer.Sound: decoded sound
+        """
+        future = decodedPrefetch.request(s.path)
+        if future.done():
+            return future.result()
+        start = time.time()
+        data = future.result()
+        waited = time.time() - start
+        if waited > 0.1:
+            logging.warning("\"{}\" was not prefetched, waited {:.2f}s for decoding.".format(
+                s.path, waited))
+        return data
+
     def random(self, t: str):
         """Play a randomly picked sound from a given type
 
@@ -87,59 +146,219 @@ class control:
         """
         self.queue.extend(self._discoverSound(t))
 
-    def play(self, t: str):
-        """Play control, called every once in a while
+    def play(self, t: str) -> float:
+        """Play control, called by the playout engine. Never waits for decoding:
+        if the next sound is not decoded yet, it starts on a later call.
 
         Args:
             t (str): audio type
+
+        Returns:
+            float: seconds until it should be called again, None to wait for a wake up
         """
+        now = time.time()
         if len(self.queue) == 0:
             self.pullPlayList(t)
             self.index = -1
-        else:
-            if not self.channelMap[t].get_busy():  # previous sound is over
-                self.channelLastPlayed[t] = ''
-                self.queue[self.index].unloadData()
-                # update index
-                if self.mode == 'shuffle':
-                    self.index = rnd.randint(0, len(self.queue)-1)
-                elif self.mode in ('loop', 'once'):
-                    if self.index == len(self.queue)-1:  # last one, back to top
-                        self.index = 0
-                        if self.mode == 'once':
-                            self.mixer.fadeout(
-                                configManager.cfg.audio.transition_length)
-                    else:
-                        self.index += 1
-                elif self.mode == 'single':
-                    pass  # do nothing
-                logging.debug("Next play index {}, sound {}".format(
-                    self.index, self.queue[self.index].path))
-                s = self.queue[self.index]
-                self.play_file(s, self.channelMap[t])
-                self.channelLastPlayed[t] = s
-                if (len(self.queue) > 0) and self.mode in ('loop', 'once'):
-                    # TODO make this dynamic based on free memory
-                    self.preloadNextSound(1)
-        pass
+            if len(self.queue) > 0:
+                decodedPrefetch.request(self.queue[0].path)
+                return 0
+            return control.IDLE_INTERVAL
+        if self.virtualMixer.paused:
+            if self.pausedSince is None:
+                self.pausedSince = now
+            return None  # resume wakes us up
+        if self.pausedSince is not None:
+            self.extendPlayout(now - self.pausedSince)
+            self.pausedSince = None
+        if self.channelMap[t].get_busy():
+            self.lastBusy = now
+            return self._timeLeft(now)
+        # previous sound is over
+        if self.pendingFetch is None:
+            self.channelLastPlayed[t] = ''
+            decodedCache.unpin(self.channelMap[t])
+            s = self.advance()
+            if s.isStreamed():  # nothing to decode
+                future = concurrent.futures.Future()
+                future.set_result(None)
+            else:
+                future = decodedPrefetch.request(s.path)
+            self.pendingFetch = (s, future, now)
+        s, future, requested = self.pendingFetch
+        if not future.done():
+            future.add_done_callback(lambda _: self.wake())
+            return None
+        self.pendingFetch = None
+        waited = now - requested
+        if waited > 0.1:
+            logging.warning("Waited {:.2f}s for \"{}\" to be decoded.".format(
+                waited, s.path))
+        if future.exception() is not None:
+            return self._backoff()  # skipped, error logged by the prefetcher
+        duration = self.play_file(s, self.channelMap[t])
+        if duration is None:
+            return self._backoff()  # error logged by play_file
+        self.failures = 0
+        started = time.time()
+        if self.expectedEnd is not None:
+            # the previous sound ended between the last busy check and now
+            ended = max(self.lastBusy or 0, min(self.expectedEnd, now))
+            gap = started - ended
+            self.gaps.append(gap)
+            control.gapSeconds.observe(gap)
+            logging.debug("Transition gap {:.3f}s".format(gap))
+        self.expectedEnd = started + duration
+        self.lastBusy = started
+        self.channelLastPlayed[t] = s
+        if (len(self.queue) > 0) and self.mode in ('loop', 'once'):
+            self.preloadNextSound()
+        return self._timeLeft(started)
+
+    def advance(self) -> sound:
+        """Move the play index to the next sound according to play mode
+
+        Returns:
+            sound: the sound at the new index
+        """
+        if self.mode == 'shuffle':
+            self.index = rnd.randint(0, len(self.queue)-1)
+        elif self.mode in ('loop', 'once'):
+            if self.index >= len(self.queue)-1:  # last one, back to top
+                self.index = 0
+                if self.mode == 'once':
+                    self.virtualMixer.fadeout(
+                        configManager.cfg.audio.transition_length)
+            else:
+                self.index += 1
+        elif self.mode == 'single':
+            pass  # do nothing
+        logging.debug("Next play index {}, sound {}".format(
+            self.index, self.queue[self.index].path))
+        return self.queue[self.index]
+
+    def _backoff(self) -> float:
+        # do not run through a broken library at full speed
+        self.failures += 1
+        return min(control.FAIL_BACKOFF * 2 ** (self.failures - 1), control.IDLE_INTERVAL)
+
+    def _timeLeft(self, now: float) -> float:
+        # sleep until just before the expected end, then poll closely
+        if self.expectedEnd is None:
+            return control.IDLE_INTERVAL
+        remaining = self.expectedEnd - now
+        if remaining > control.END_MARGIN:
+            return remaining - control.END_MARGIN
+        if remaining > -1:
+            return control.END_POLL_INTERVAL
+        return control.IDLE_INTERVAL  # duration was off, or channel paused
+
+    def extendPlayout(self, seconds: float):
+        """Shift the expected end of the current sound, i.e. after a pause
+
+        Args:
+            seconds (float): time the sound was held
+        """
+        if self.expectedEnd is not None:
+            self.expectedEnd += seconds
+        self.wake()
+
+    def wake(self):
+        """Make the playout engine re-evaluate now
+        """
+        self.wakeup.set()
+
+    def startPlayout(self, t: str = 'show'):
+        """Start the playout engine thread
+
+        Args:
+            t (str, optional): audio type. Defaults to 'show'.
+        """
+        self.playoutStopped.clear()
+        self.playType = t
+        if configManager.cfg.audio.crossfade.enable:
+            try:
+                self.crossfader = crossfadeMixer(self.channelMap[t],
+                                                 lambda: self._crossfadeNext(t),
+                                                 self.fetch,
+                                                 configManager.cfg.audio.crossfade.overlap,
+                                                 configManager.cfg.audio.crossfade.block,
+                                                 lambda s: self.channelLastPlayed.update({t: s}),
+                                                 transcodedCache.samples)
+                self.crossfader.start()
+                self.playout = self.crossfader.thread
+                return
+            except ImportError as e:
+                logging.error("Crossfade unavailable, falling back: " + str(e))
+                self.crossfader = None
+        self.playout = threading.Thread(
+            name='Playout', target=self._playoutLoop, args=(t,), daemon=True)
+        self.playout.start()
+        logging.info("Playout started.")
+
+    def stopPlayout(self):
+        """Stop the playout engine thread
+        """
+        self.playoutStopped.set()
+        self.wake()
+        if self.crossfader is not None:
+            self.crossfader.stop()
+            self.crossfader = None
+        if self.playout is not None and self.playout is not threading.current_thread():
+            self.playout.join(timeout=5)
+        self.playout = None
+
+    def _crossfadeNext(self, t: str) -> sound:
+        # next sound for the crossfade engine
+        if len(self.queue) == 0:
+            self.pullPlayList(t)
+            self.index = -1
+            if len(self.queue) == 0:
+                return None
+        s = self.advance()
+        if self.mode in ('loop', 'once'):
+            self.preloadNextSound()
+        return s
 
-    def preloadNextSound(self, lookahead=1):
+    def _playoutLoop(self, t: str):
+        while not self.playoutStopped.is_set():
+            try:
+                timeout = self.play(t)
+            except Exception as e:
+                logging.error("Playout error: " + str(e))
+                timeout = control.IDLE_INTERVAL
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def preloadNextSound(self, lookahead=None):
         """Preload next N sounds
 
         Args:
-            lookahead (int, optional): N sounds to be loaded. Defaults to 1.
+            lookahead (int, optional): N sounds to be loaded. Defaults to None,
+                as many as the decoded cache budget allows.
         """
-        idx = self.index
-        for _ in range(lookahead):
-            i = (idx+1) % len(self.queue)
-            self.queue[i].getData()
-            idx += 1
+        limit = min(len(self.queue) - 1,
+                    configManager.cfg.cache.decoded_lookahead if lookahead is None else lookahead)
+        upcoming = [self.queue[(self.index+1+i) % len(self.queue)]
+                    for i in range(max(limit, 0))]
+        upcoming = [s.path for s in upcoming if not s.isStreamed()]
+        if self.crossfader is not None:
+            # the crossfade engine reads stored PCM in place
+            upcoming = [p for p in upcoming if not transcodedCache.contains(p)]
+        for path in decodedCache.lookahead(upcoming, limit):
+            decodedPrefetch.request(path)
 
     def next(self):
         """Jump to next piece
         """
         # TODO multichannel playlist
-        self.mixer.fadeout(configManager.cfg.audio.transition_length)
+        if self.crossfader is not None:
+            # fading the channel alone would resume from the engine's frames
+            self.crossfader.skip(configManager.cfg.audio.transition_length)
+            return
+        self.virtualMixer.fadeout(configManager.cfg.audio.transition_length)
+        self.expectedEnd = time.time() + configManager.cfg.audio.transition_length / 1000
+        self.wake()
 
     def appendPlayList(self, t: str = 'show'):
         """Append to play queue
@@ -147,23 +366,51 @@ class control:
         Args:
             t (str, optional): audio type. Defaults to 'show'.
         """
-        l = self._discoverSound(t)
-        for s in l:
-            if s not in self.queue:
-                effect.normalize(s)
+        for s in self._discoverSound(t):
+            if s.path not in self.queue:
                 self.queue.append(s)
 
+    def insertSound(self, path: str) -> bool:
+        """Hot insert a newly ingested file at the end of the live play queue
+
+        Args:
+            path (str): path to sound file, i.e. "lib/show/abc.mp3"
+
+        Returns:
+            bool: True if inserted
+        """
+        if os.path.basename(os.path.dirname(path)) != self.playType:
+            return False
+        if len(self.queue) == 0:
+            return False  # the next pull discovers it
+        if not self.queue.append(sound(path)):
+            return False  # already queued
+        if self.index == len(self.queue) - 2 and self.mode in ('loop', 'once'):
+            self.preloadNextSound()
+        return True
+
     def shiftPlayList(self, idx: int, offset: int):
         """Shift given item in a play list by given offset
 
         Args:
             idx (int): index of item to be moved
-            offset (int): can be positive or negative. If index out of range, the new index will wrap around.
+            offset (int): can be positive or negative. If index out of range, the new index is clamped.
         """
-        target = idx + offset
-        target = max(target, 0)
-        target = min(target, len(self.queue)-1)
-        self.queue[target], self.queue[idx] = self.queue[idx], self.queue[target]
+        self.moveInPlayList(idx, idx + offset)
+
+    def moveInPlayList(self, idx: int, target: int):
+        """Move given item in a play list to a new position. The play index
+        keeps pointing at the sound playing.
+
+        Args:
+            idx (int): index of item to be moved
+            target (int): new index, clamped to the list
+        """
+        with self.queue.lock:
+            current = self.queue[self.index] if 0 <= self.index < len(self.queue) else None
+            self.queue.move(idx, target)
+            if current is not None:
+                self.index = self.queue.index(current)
 
     def removeFromPlayList(self, idx: int):
         """remove item with given index from the queue
@@ -171,7 +418,11 @@ class control:
         Args:
             idx (int): index of item to be removed
         """
-        del self.queue[idx]
+        with self.queue.lock:
+            del self.queue[idx]
+            if idx <= self.index:
+                # the following sound still plays next
+                self.index -= 1
 
     def stationID(self):
         """Play randomly selected stationID. Lower show volume during station ID.
@@ -179,15 +430,23 @@ class control:
         with self.mixerLock:
             vol = self.channelMap['show'].get_volume()
             effect.fadeOut(self.channelMap['show'],
-                           configManager.cfg.audio.surpression_factor*vol)
+                           configManager.cfg.audio.surpression_factor*vol).result()
             duration = self.random('stationID')
+            if duration is None:  # error logged by random
+                effect.fadeIn(self.channelMap['show'], vol)
+                return
+            pausedAt = time.time()
             if duration > 8:
-                effect.fadeOut(self.channelMap['show'], 0)
+                effect.fadeOut(self.channelMap['show'], 0).result()
                 self.channelMap['show'].pause()
-            while self.channelMap['stationID'].get_busy():
-                time.sleep(1)
+        # sleep through the ID, then watch for its end closely, volume controls stay usable
+        time.sleep(max(duration - control.END_MARGIN, 0))
+        while self.channelMap['stationID'].get_busy():
+            time.sleep(control.END_POLL_INTERVAL)
+        with self.mixerLock:
             if duration > 8:
                 self.channelMap['show'].unpause()
+                self.extendPlayout(time.time() - pausedAt)
             effect.fadeIn(self.channelMap['show'], vol)
             logging.info("Station ID sent.")
             self.channelLastPlayed['stationID'] = None
@@ -0,0 +1,294 @@
+import logging
+import random
+import threading
+
+from .util import metaCache
+
+
+class node:
+    """Treap node holding one sound. Subtree size and duration sum are kept
+    up to date so position and time queries are O(log n).
+    """
+    __slots__ = ('sound', 'duration', 'hash', 'priority',
+                 'left', 'right', 'parent', 'size', 'total')
+
+    def __init__(self, s, duration: float, h: str) -> None:
+        self.sound = s
+        self.duration = duration
+        self.hash = h
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.size = 1
+        self.total = duration
+
+    def update(self):
+        self.size = 1
+        self.total = self.duration
+        for child in (self.left, self.right):
+            if child is not None:
+                self.size += child.size
+                self.total += child.total
+                child.parent = self
+
+
+class playlist:
+    """Play queue as an implicit treap. Indexing, insert, remove and move are
+    O(log n), membership by path or content hash is O(1), and the duration
+    of any range is O(log n). Behaves like a list of sounds otherwise.
+    `version` changes on every modification, so views can skip redraws.
+    """
+    def __init__(self, sounds=()) -> None:
+        self.lock = threading.RLock()
+        self.version = 0
+        self.root = None
+        self.paths = {}  # path -> node
+        self.hashes = {}  # content hash -> count
+        self.extend(sounds)
+
+    # treap primitives, called with lock held
+    def _size(self, n: node) -> int:
+        return n.size if n is not None else 0
+
+    def _split(self, n: node, k: int) -> tuple:
+        # first k items to the left tree, the rest to the right
+        if n is None:
+            return None, None
+        if self._size(n.left) >= k:
+            left, n.left = self._split(n.left, k)
+            n.update()
+            if left is not None:
+                left.parent = None
+            n.parent = None
+            return left, n
+        n.right, right = self._split(n.right, k - self._size(n.left) - 1)
+        n.update()
+        if right is not None:
+            right.parent = None
+        n.parent = None
+        return n, right
+
+    def _merge(self, a: node, b: node) -> node:
+        if a is None or b is None:
+            root = a if b is None else b
+            if root is not None:
+                root.parent = None
+            return root
+        if a.priority > b.priority:
+            a.right = self._merge(a.right, b)
+            a.update()
+            a.parent = None
+            return a
+        b.left = self._merge(a, b.left)
+        b.update()
+        b.parent = None
+        return b
+
+    def _node(self, i: int) -> node:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('playlist index out of range')
+        n = self.root
+        while True:
+            left = self._size(n.left)
+            if i < left:
+                n = n.left
+            elif i == left:
+                return n
+            else:
+                i -= left + 1
+                n = n.right
+
+    def _prefix(self, i: int) -> float:
+        # total duration of the first i items
+        total = 0
+        n = self.root
+        while n is not None and i > 0:
+            left = self._size(n.left)
+            if i <= left:
+                n = n.left
+                continue
+            total += (n.left.total if n.left is not None else 0) + n.duration
+            i -= left + 1
+            n = n.right
+        return total
+
+    def _duration(self, s) -> float:
+        try:
+            return s.getDuration() or 0
+        except Exception as e:
+            logging.error("Cannot get duration of {}: {}".format(s.path, str(e)))
+            return 0
+
+    # list interface
+    def __len__(self) -> int:
+        return self._size(self.root)
+
+    def __getitem__(self, i: int):
+        with self.lock:
+            return self._node(i).sound
+
+    def __iter__(self):
+        return iter([s for s, _ in self.entries()])
+
+    def entries(self) -> list:
+        """Snapshot of the playlist with known durations
+
+        Returns:
+            list: (sound, duration) in play order
+        """
+        with self.lock:
+            items = []
+            stack = []
+            n = self.root
+            while stack or n is not None:
+                while n is not None:
+                    stack.append(n)
+                    n = n.left
+                n = stack.pop()
+                items.append((n.sound, n.duration))
+                n = n.right
+        return items
+
+    def __contains__(self, item) -> bool:
+        """Membership by path, or by sound object's path"""
+        return getattr(item, 'path', item) in self.paths
+
+    def __delitem__(self, i: int):
+        self.pop(i)
+
+    def insert(self, i: int, s) -> bool:
+        """Insert a sound before index i
+
+        Args:
+            i (int): position, clamped to the list
+            s (sound): sound to insert
+
+        Returns:
+            bool: False if a sound with the same path is already queued
+        """
+        if s.path in self.paths:
+            return False
+        record = metaCache.lookup(s.path) or {}
+        n = node(s, self._duration(s), record.get('hash'))
+        with self.lock:
+            if s.path in self.paths:
+                return False
+            i = max(0, min(i if i >= 0 else i + len(self), len(self)))
+            left, right = self._split(self.root, i)
+            self.root = self._merge(self._merge(left, n), right)
+            self.version += 1
+            self.paths[s.path] = n
+            if n.hash is not None:
+                self.hashes[n.hash] = self.hashes.get(n.hash, 0) + 1
+        return True
+
+    def append(self, s) -> bool:
+        return self.insert(len(self), s)
+
+    def extend(self, sounds):
+        for s in sounds:
+            self.append(s)
+
+    def pop(self, i: int = -1):
+        """Remove and return the sound at index i"""
+        with self.lock:
+            if i < 0:
+                i += len(self)
+            if not 0 <= i < len(self):
+                raise IndexError('playlist index out of range')
+            left, rest = self._split(self.root, i)
+            n, right = self._split(rest, 1)
+            self.root = self._merge(left, right)
+            self.version += 1
+            del self.paths[n.sound.path]
+            if n.hash is not None:
+                self.hashes[n.hash] -= 1
+                if self.hashes[n.hash] == 0:
+                    del self.hashes[n.hash]
+            return n.sound
+
+    def move(self, i: int, j: int):
+        """Move the sound at index i to index j
+
+        Args:
+            i (int): current index
+            j (int): new index, clamped to the list
+        """
+        with self.lock:
+            if not 0 <= i < len(self):
+                raise IndexError('playlist index out of range')
+            j = max(0, min(j, len(self) - 1))
+            if i == j:
+                return
+            left, rest = self._split(self.root, i)
+            n, right = self._split(rest, 1)
+            left, right = self._split(self._merge(left, right), j)
+            self.root = self._merge(self._merge(left, n), right)
+            self.version += 1
+
+    def clear(self):
+        with self.lock:
+            self.root = None
+            self.version += 1
+            self.paths = {}
+            self.hashes = {}
+
+    # lookups
+    def index(self, item) -> int:
+        """Position of a sound, by path or sound object
+
+        Returns:
+            int: index in the playlist
+        """
+        with self.lock:
+            n = self.paths.get(getattr(item, 'path', item))
+            if n is None:
+                raise ValueError('{} is not in playlist'.format(item))
+            i = self._size(n.left)
+            while n.parent is not None:
+                if n is n.parent.right:
+                    i += self._size(n.parent.left) + 1
+                n = n.parent
+            return i
+
+    def containsHash(self, h: str) -> bool:
+        """Whether a sound with the given content hash is queued. Only sounds
+        whose metadata was known when queued are indexed by hash.
+        """
+        return h in self.hashes
+
+    # durations
+    def total(self) -> float:
+        """Total duration in seconds"""
+        with self.lock:
+            return self.root.total if self.root is not None else 0
+
+    def elapsed(self, i: int) -> float:
+        """Duration of the sounds before index i"""
+        with self.lock:
+            return self._prefix(max(0, min(i, len(self))))
+
+    def remaining(self, i: int) -> float:
+        """Duration of the sounds after index i"""
+        with self.lock:
+            return self.total() - self._prefix(max(0, min(i + 1, len(self))))
+
+    def eta(self, current: int, i: int) -> float:
+        """Seconds from the start of the current sound to the start of sound i,
+        wrapping around the end of the list as loop mode does
+
+        Args:
+            current (int): index of the playing sound
+            i (int): index of the sound of interest
+
+        Returns:
+            float: seconds
+        """
+        with self.lock:
+            current = max(current, 0)
+            if i >= current:
+                return self._prefix(i) - self._prefix(current)
+            return self.total() - self._prefix(current) + self._prefix(i)
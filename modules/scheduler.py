@@ -0,0 +1,204 @@
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+
+from .metrics import metricsRegistry
+
+
+class task:
+    """A recurring job. Timing follows the semantics of the `schedule` package
+    (1.1.0) the config was written for: every `interval` `unit`s, at `at`
+    within the unit.
+    """
+    UNITS = ('seconds', 'minutes', 'hours', 'days')
+
+    def __init__(self, name: str, fn, interval: int, unit: str, at: str = None) -> None:
+        """
+        Args:
+            name (str): task name for logging
+            fn (callable): job to run
+            interval (int): run every N units
+            unit (str): one of 'seconds', 'minutes', 'hours', 'days'
+            at (str, optional): time within the unit, ":SS" for minutes, "MM:SS" for hours,
+                "HH:MM(:SS)" for days. Defaults to None.
+        """
+        assert unit in task.UNITS
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.unit = unit
+        self.at = at
+        self.nextRun = None
+        self.generation = None
+        self.lastRun = None
+        self.lateness = None  # seconds the last run fired after its due time
+
+    def _atTime(self, t: datetime.datetime) -> datetime.datetime:
+        if self.at is None:
+            return t
+        parts = self.at.split(':')
+        if self.unit == 'minutes':
+            return t.replace(second=int(parts[-1]), microsecond=0)
+        if self.unit == 'hours':
+            if not parts[0]:  # ":MM"
+                return t.replace(minute=int(parts[1]), second=0, microsecond=0)
+            return t.replace(minute=int(parts[-2]), second=int(parts[-1]), microsecond=0)
+        if self.unit == 'days':
+            second = int(parts[2]) if len(parts) > 2 else 0
+            return t.replace(hour=int(parts[0]), minute=int(parts[1]), second=second, microsecond=0)
+        return t
+
+    def scheduleNext(self, now: datetime.datetime = None):
+        """Compute the next due time
+
+        Args:
+            now (datetime.datetime, optional): current time. Defaults to None.
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        period = datetime.timedelta(**{self.unit: self.interval})
+        nextRun = self._atTime(now + period)
+        if self.at is not None and self.lastRun is None:
+            # the first run may still be due within the current unit
+            at = self._atTime(now)
+            if self.unit == 'days' and self.interval == 1 and at > now:
+                nextRun -= period
+            elif self.unit in ('hours', 'minutes') and at > now.replace(microsecond=0):
+                nextRun -= datetime.timedelta(**{self.unit: 1})
+        self.nextRun = nextRun
+
+    def __lt__(self, other) -> bool:
+        return self.nextRun < other.nextRun
+
+
+class scheduler:
+    """Timer-heap scheduler. The run loop sleeps until the next task is due and
+    wakes early when tasks change or on stop.
+    """
+    lateness = metricsRegistry.histogram('scheduler_lateness_seconds', 'Delay of task runs after their due time',
+                                         ('task',))
+
+    def __init__(self) -> None:
+        self.heap = []  # (nextRun, seq, task)
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.generation = 0  # bumped by clear, stale tasks are not rescheduled
+        self.stopped = False
+
+    def every(self, interval: int, unit: str, at: str, fn, name: str = None) -> task:
+        """Register a recurring task
+
+        Args:
+            interval (int): run every N units
+            unit (str): one of 'seconds', 'minutes', 'hours', 'days'
+            at (str): time within the unit, or None
+            fn (callable): job to run
+            name (str, optional): task name. Defaults to the function name.
+
+        Returns:
+            task: the registered task
+        """
+        t = task(name or getattr(fn, '__name__', repr(fn)), fn, interval, unit, at)
+        t.scheduleNext()
+        with self.cond:
+            t.generation = self.generation
+            heapq.heappush(self.heap, (t.nextRun, next(self.seq), t))
+            self.cond.notify_all()
+        logging.debug("Task {} scheduled at {}.".format(t.name, t.nextRun))
+        return t
+
+    def clear(self):
+        """Remove all tasks
+        """
+        with self.cond:
+            self.heap = []
+            self.generation += 1
+            self.cond.notify_all()
+
+    def tasks(self) -> list:
+        with self.cond:
+            return [t for _, _, t in sorted(self.heap)]
+
+    def idleSeconds(self) -> float:
+        """Seconds until the next task is due
+
+        Returns:
+            float: seconds, None if nothing is scheduled
+        """
+        with self.cond:
+            if not self.heap:
+                return None
+            return (self.heap[0][0] - datetime.datetime.now()).total_seconds()
+
+    def _due(self) -> task:
+        # pop the next due task, called with cond held
+        if self.heap and self.heap[0][0] <= datetime.datetime.now():
+            return heapq.heappop(self.heap)[2]
+        return None
+
+    def _fire(self, t: task):
+        now = datetime.datetime.now()
+        t.lateness = (now - t.nextRun).total_seconds()
+        t.lastRun = now
+        scheduler.lateness.observe(t.lateness, task=t.name)
+        if t.lateness > 1:
+            logging.warning("Task {} fired {:.3f}s late.".format(
+                t.name, t.lateness))
+        else:
+            logging.debug("Task {} fired {:.3f}s late.".format(
+                t.name, t.lateness))
+        try:
+            t.fn()
+        except Exception as e:
+            logging.error("Task {} failed: {}".format(t.name, str(e)))
+        t.scheduleNext()
+        with self.cond:
+            if t.generation == self.generation:
+                heapq.heappush(self.heap, (t.nextRun, next(self.seq), t))
+
+    def runPending(self):
+        """Run all tasks that are due, without waiting
+        """
+        while True:
+            with self.cond:
+                t = self._due()
+            if t is None:
+                return
+            self._fire(t)
+
+    def run(self):
+        """Run tasks as they become due until stopped. Runs again after a stop,
+        i.e. on the next sign in.
+        """
+        with self.cond:
+            self.stopped = False
+        while True:
+            with self.cond:
+                while not self.stopped:
+                    t = self._due()
+                    if t is not None:
+                        break
+                    if self.heap:
+                        delay = (self.heap[0][0] -
+                                 datetime.datetime.now()).total_seconds()
+                        self.cond.wait(max(delay, 0))
+                    else:
+                        self.cond.wait()
+                if self.stopped:
+                    return
+            self._fire(t)
+
+    def wake(self):
+        """Wake the run loop to re-evaluate the heap
+        """
+        with self.cond:
+            self.cond.notify_all()
+
+    def stop(self):
+        """Stop the run loop
+        """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
@@ -1,14 +1,19 @@
 from . import play
 from . import audio
+import concurrent.futures
 import logging
-import multiprocessing
 import time
 import os
+import sqlite3
 import sys
 import psutil
-import schedule
 
-from .util import configManager, fsUtil, db
+from .util import configManager, fsUtil, db, metaCache
+from .worker import workerPool
+from .ingest import ingestQueue
+from .hashing import hashService
+from .scheduler import scheduler
+from .metrics import metricsRegistry, metricsServer
 
 
 class manager:
@@ -20,12 +25,31 @@ class manager:
         self.cwd = os.getcwd()
         self.systemStat = None
         self.db = db()
+        self.workers = workerPool(configManager.cfg.worker.count, 'Normalizer',
+                                  configManager.cfg.worker.mode)
+        self.hasher = hashService(configManager.cfg.worker.hashers)
+        self.scheduler = scheduler()
+        # ingest checks need the database, they run here and hand normalization to the workers
+        self.ingestPool = workerPool(self.workers.workers, 'Ingest')
+        self.ingest = ingestQueue(self.ingestPool, self.ingestFile, self.ingested,
+                                  configManager.cfg.ingest.debounce)
+        configManager.onReload(self.scheduleReload)
+        self.metrics = metricsServer(metricsRegistry, configManager.cfg.metrics.host,
+                                     configManager.cfg.metrics.port)
+        metricsRegistry.gauge('playout_queue_length', 'Sounds in the play queue',
+                              fn=lambda: len(self.playControl.queue))
+        metricsRegistry.gauge('hash_throughput_mbps', 'Average library hashing throughput in MB/s',
+                              fn=self.hasher.throughput)
+        self.usage = metricsRegistry.gauge('system_usage_percent', 'Resource usage at the last system monitor run',
+                                           ('resource',))
         self.lastSignIn = None # identify if system has signed in successfully (not None)
         try:
-            self.db.connect('db.json')
-        except IOError as e:
+            self.db.connect(configManager.cfg.path.db)
+            metaCache.attach(self.db)
+            audio.transcodedCache.attach(self.workers)
+        except (IOError, sqlite3.Error) as e:
             logging.critical("Cannot connect to database: "+str(e))
-        self.watchdogs = [fsUtil.libWatchdogInit(),
+        self.watchdogs = [fsUtil.libWatchdogInit(self.libChanged),
                           fsUtil.configWatchdogInit()]
         pass
 
@@ -42,23 +66,38 @@ class manager:
         """Register events in schedule
         """
         cfg = configManager.cfg.schedule
+        self.scheduler.clear()
         # System monitor
-        schedule.every(cfg.systemMonitor.interval).minutes.at(
-            cfg.systemMonitor.time).do(self.systemMonitor)
+        self.scheduler.every(cfg.systemMonitor.interval, 'minutes',
+                             cfg.systemMonitor.time, self.systemMonitor)
         # Station ID
-        schedule.every(cfg.stationID.interval).hours.at(
-            cfg.stationID.time).do(self.ID)
+        self.scheduler.every(cfg.stationID.interval, 'hours',
+                             cfg.stationID.time, self.ID)
         # Mixer digest
-        schedule.every(cfg.mixerDigest.interval).minutes.at(
-            cfg.mixerDigest.time).do(self.mixer.digest)
+        self.scheduler.every(cfg.mixerDigest.interval, 'minutes',
+                             cfg.mixerDigest.time, self.mixer.digest)
         # Volume guard
-        schedule.every(cfg.volumeGuard.interval).minutes.at(
-            cfg.volumeGuard.time).do(self.mixer.volumeGuard)
+        self.scheduler.every(cfg.volumeGuard.interval, 'minutes',
+                             cfg.volumeGuard.time, self.mixer.volumeGuard)
+
+    def scheduleReload(self):
+        """Re-register events after config hot reload
+        """
+        if self.scheduler.tasks():
+            self.scheduleInit()
+            logging.info("Schedule reloaded.")
 
     def scheduleRun(self):
-        """Run the schedule loop
-        """ 
-        schedule.run_pending()
+        """Run pending events once, without waiting
+        """
+        self.scheduler.runPending()
+
+    def scheduleLoop(self):
+        """Run events as they become due until sign off. Blocks.
+        """
+        logging.info("Scheduler started.")
+        self.scheduler.run()
+        logging.info("Scheduler stopped.")
 
     # TODO signIn / Out special audio
     def signIn(self):
@@ -69,6 +108,11 @@ class manager:
         """
         logging.warning("Welcome to {stationName} automation system. Signing in.".format(
             stationName=configManager.cfg.station.name))
+        if configManager.cfg.metrics.enable:
+            try:
+                self.metrics.start()
+            except OSError as e:
+                logging.error("Cannot serve metrics: " + str(e))
         try:
             assert len(fsUtil.list_sound('stationID')) > 0
         except AssertionError:
@@ -76,52 +120,216 @@ class manager:
             sys.exit(1)
 
         logging.info("Scanning sound lib...")
-        self.loudNorm()
+        targets = self.scanLib()
+        self.loudNorm(list(targets), targets)
         logging.info("All sounds in lib normalized.")
+        audio.transcodedCache.rebuild(self.libSounds())
+        self.ingest.start()
         self.ID()
         self.lastSignIn = time.time()
 
-    def loudNorm(self, targets: list = None):
+    def libSounds(self) -> list:
+        """All sounds in lib
+
+        Returns:
+            list: paths to sound files
+        """
+        sounds = []
+        # get sub dirs in lib using magic
+        subDir = [d[1]
+                  for d in os.walk(configManager.cfg.path.lib) if d[1]][0]
+        for sub in subDir:
+            sounds.extend(fsUtil.list_sound(sub))
+        return sounds
+
+    def scanLib(self) -> dict:
+        """Incremental library scan. Only files whose stat signature changed
+        since the last check are hashed again.
+
+        Returns:
+            dict: sounds that need loudness check, path -> content hash
+        """
+        targets = {}
+        changed = {}  # path -> index state, content unknown
+        skipped = 0
+        # get sub dirs in lib using magic
+        subDir = [d[1]
+                  for d in os.walk(configManager.cfg.path.lib) if d[1]][0]
+        for sub in subDir:
+            for s in fsUtil.list_sound(sub):
+                try:
+                    state = self._indexCheck(s)
+                except OSError as e:
+                    logging.error("Cannot scan {}: {}".format(s, str(e)))
+                    continue
+                if state is None:
+                    skipped += 1
+                else:
+                    changed[s] = state
+        # full hashes of new or changed files, in parallel
+        hashes = self.hasher.hashAll(list(changed))
+        for s, state in changed.items():
+            if s not in hashes:
+                continue  # unreadable, logged by the hasher
+            if self._hashCheck(s, state, hashes[s]):
+                targets[s] = hashes[s]
+            else:
+                skipped += 1
+        logging.info("Lib scanned: {} unchanged, {} to check.".format(
+            skipped, len(targets)))
+        return targets
+
+    def needsCheck(self, s: str) -> bool:
+        """Whether a sound needs a loudness check. The file is only hashed
+        again if its stat signature and sampled fingerprint changed since the
+        last check.
+
+        Args:
+            s (str): path to sound file
+
+        Returns:
+            bool: True if the sound was not checked against the current target
+        """
+        state = self._indexCheck(s)
+        if state is None:
+            return False
+        return self._hashCheck(s, state, self.hasher.sha256(s).result())
+
+    def _indexCheck(self, s: str) -> tuple:
+        # cheap checks against the index, returns None if the file is known,
+        # else the state needed to finish the check with the full hash
+        sig = fsUtil.signature(s)
+        entry = self.db.getIndex(s)
+        known = entry is not None and entry['loudness'] == configManager.cfg.audio.loudness
+        if known and (entry['size'], entry['mtime'], entry['inode']) == sig:
+            return None
+        fp = fsUtil.fingerprint(s)
+        if known and entry['fingerprint'] == fp:
+            # touched but content unchanged
+            self.db.setIndex(s, sig, entry['hash'],
+                             configManager.cfg.audio.loudness, fp)
+            return None
+        return sig, entry, fp
+
+    def _hashCheck(self, s: str, state: tuple, h: str) -> bool:
+        sig, entry, fp = state
+        if (entry is not None and entry['loudness'] == configManager.cfg.audio.loudness
+                and entry['hash'] == h) or self.db.isNormalized(h):
+            # copied or moved but content unchanged
+            self.db.setIndex(s, sig, h, configManager.cfg.audio.loudness, fp)
+            return False
+        return True
+
+    def loudNorm(self, targets: list = None, hashes: dict = None):
         """Loudness normalization in parallel
 
         Args:
             targets (list, optional): Sounds to be normalized. Defaults to None.
+            hashes (dict, optional): content hashes known before normalization, i.e. from scanLib. Defaults to None.
         """
-        procs = []
-
         if targets is None:
-            # get sub dirs in lib using magic
-            subDir = [d[1]
-                      for d in os.walk(configManager.cfg.path.lib) if d[1]][0]
-            for sub in subDir:
-                for s in fsUtil.list_sound(sub):
-                    p = audio.effect.normalize(s)
-                    if p != None:
-                        procs.append((p, s))
-        else:
-            for s in targets:
-                p = audio.effect.normalize(self.db, s)
-
-        if len(procs) > 0:
-            logging.info("Waiting for loudness normalization...")
+            targets = self.libSounds()
+        if hashes is None:
+            hashes = {}
 
-            try:
-                for p in procs:
-                    p[0].join()
-
-                while len(multiprocessing.active_children()) > 0:
-                    time.sleep(0.1)
-
-                for p in procs:  # t = (thread, file)
-                    p[0].close()
-                    file = p[1]
-                    self.db.setRecord(file, fsUtil.sha256sum(
-                        file), configManager.cfg.audio.loudness, configManager.cfg.audio.bitrate)
-                    procs.remove(p)
-            except Exception as e:
-                logging.error("Process error: " + str(e))
-                for p in multiprocessing.active_children():
-                    p.kill()
+        jobs = {self.normalize(s): s for s in targets}
+
+        if len(jobs) > 0:
+            logging.info("Waiting for loudness normalization of {} sounds...".format(
+                len(jobs)))
+
+            # hash rewritten files in parallel while normalization goes on
+            hashed = {}
+            for future in concurrent.futures.as_completed(jobs):
+                if future.cancelled():
+                    continue
+                file = jobs[future]
+                if future.exception() is not None or (not future.result()[0] and file in hashes):
+                    self._recordNormalized(file, future, hashes.get(file))  # content unchanged
+                    continue
+                hashed[self.hasher.sha256(file)] = future
+            for h in concurrent.futures.as_completed(hashed):
+                file = jobs[hashed[h]]
+                try:
+                    self._recordNormalized(file, hashed[h], h.result())
+                except Exception as e:
+                    logging.error("Cannot hash {}: {}".format(file, str(e)))
+
+    def normalize(self, s: str) -> concurrent.futures.Future:
+        """Queue a loudness normalization job. The job only gets plain arguments,
+        so it also runs in worker processes; its outcome is recorded here.
+
+        Args:
+            s (str): path to sound file
+
+        Returns:
+            concurrent.futures.Future: result of audio.normalize
+        """
+        return self.workers.submit(s, audio.normalize, s, configManager.cfg.audio.loudness,
+                                   configManager.cfg.audio.loudness_tolerant,
+                                   audio.effect.cachedLoudness(s))
+
+    def _recordNormalized(self, file: str, future: concurrent.futures.Future, h: str = None):
+        # store the outcome of a normalization job
+        try:
+            normalized, measured = future.result()
+            if h is None:
+                h = self.hasher.sha256(file).result()  # the index keeps full hashes
+            if normalized:
+                metaCache.update(
+                    file, h, loudness=configManager.cfg.audio.loudness)
+                self.db.setRecord(file, h, configManager.cfg.audio.loudness, configManager.cfg.audio.bitrate)
+            elif measured:
+                metaCache.update(file, h, **measured)
+            # checked against current target, skip on next scan
+            self.db.setIndex(file, fsUtil.signature(file), h,
+                             configManager.cfg.audio.loudness, fsUtil.fingerprint(file))
+        except concurrent.futures.CancelledError:
+            pass
+        except Exception as e:
+            logging.error("Process error: " + str(e))
+
+    def libChanged(self, path: str):
+        """Library watchdog callback, queue a new or changed file for ingest
+
+        Args:
+            path (str): absolute path to the file
+        """
+        self.ingest.notify(os.path.relpath(path, self.cwd))
+
+    def ingestFile(self, path: str) -> tuple:
+        """Ingest job run on an ingest thread: loudness check, then
+        normalization in the worker pool
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            tuple: result of audio.normalize, None if it was checked already
+        """
+        if not self.needsCheck(path):
+            return None  # i.e. our own rewrite after normalization
+        logging.info("Ingesting \"{}\"...".format(path))
+        try:
+            return self.normalize(path).result()
+        except concurrent.futures.CancelledError:
+            return None
+
+    def ingested(self, path: str, future: concurrent.futures.Future):
+        """Ingest job done, record it and hot-insert the sound into the playlist
+
+        Args:
+            path (str): path to sound file
+            future (concurrent.futures.Future): result of ingestFile
+        """
+        if future.exception() is not None:
+            logging.error("Cannot ingest {}: {}".format(path, str(future.exception())))
+            return
+        if future.result() is not None:
+            self._recordNormalized(path, future)
+        audio.transcodedCache.request(path)
+        if self.playControl.insertSound(path):
+            logging.info("\"{}\" added to playlist.".format(path))
 
     def systemMonitor(self):
         """Monitor system resources such as CPU and RAM usage
@@ -136,6 +344,9 @@ class manager:
                 'storage': psutil.disk_usage(self.cwd),
                 'power': psutil.sensors_battery()
             }
+            self.usage.set(self.systemStat['CPU'], resource='cpu')
+            self.usage.set(self.systemStat['RAM'].percent, resource='ram')
+            self.usage.set(self.systemStat['storage'].percent, resource='storage')
             if self.systemStat['CPU'] > configManager.cfg.alert.threshold.cpu:
                 logging.warning('CPU usage too high: {}%'.format(
                     self.systemStat['CPU']))
@@ -159,6 +370,18 @@ class manager:
         """Release resources.
         """
 
+        self.scheduler.stop()
+        self.ingest.stop()
+        self.playControl.stopPlayout()
+        logging.debug("Playout stopped.")
+
+        self.workers.shutdown()
+        self.ingestPool.shutdown()
+        self.hasher.shutdown()
+        logging.debug("Worker pool stopped.")
+
+        self.metrics.stop()
+
         for wd in self.watchdogs:
             wd.unschedule_all()
             wd.stop()
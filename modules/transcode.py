@@ -0,0 +1,337 @@
+import concurrent.futures
+import itertools
+import logging
+import mmap
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from pygame import mixer
+
+from .metrics import metricsRegistry
+from .util import configManager, ffmpegWrapper, metaCache
+
+# numpy is optional, only needed to read stored PCM as arrays
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class transcodeCache:
+    """Store of library sounds decoded once to raw PCM in the mixer's native
+    format. Stored sounds are memory mapped, so loading them for playout is
+    a copy out of the page cache without codec or resampling, and the OS
+    keeps or evicts the pages of cold audio.
+
+    Files are named by content hash and mixer format, and kept in a directory
+    bounded in size. Least recently loaded files are evicted first; a hit
+    touches the file, so the order survives restarts. Transcoding runs in a
+    worker pool in the background.
+    """
+    CODECS = {8: 'pcm_u8', -8: 'pcm_s8', 16: 'pcm_u16le', -16: 'pcm_s16le',
+              32: 'pcm_f32le', -32: 'pcm_s32le'}  # pygame size -> ffmpeg codec
+    DTYPES = {8: 'u1', -8: 'i1', 16: '<u2', -16: '<i2', 32: '<f4', -32: '<i4'}  # pygame size -> numpy
+
+    def __init__(self, directory: str = None, budget: float = None) -> None:
+        """
+        Args:
+            directory (str, optional): cache directory. Defaults to cache.transcode_path.
+            budget (float, optional): bytes, or fraction (<=1) of the free disk space.
+                Defaults to cache.transcode_budget.
+        """
+        self.directory = directory
+        self.budgetSize = budget
+        self.lock = threading.RLock()
+        self.entries = None  # file name -> bytes, least recently used first, loaded lazily
+        self.size = 0
+        self.pool = None
+        self.inflight = {}  # file name -> Future
+        self.counter = itertools.count()  # tells apart concurrent transcodes of a file
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, pool):
+        """Transcode in the background on the given worker pool
+
+        Args:
+            pool (workerPool): worker pool
+        """
+        self.pool = pool
+
+    def _load(self):
+        # index the cache directory, called with lock held
+        if self.entries is not None:
+            return
+        if self.directory is None:
+            self.directory = configManager.cfg.cache.transcode_path
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for f in os.listdir(self.directory):
+            path = os.path.join(self.directory, f)
+            if f.endswith('.part'):  # interrupted
+                os.remove(path)
+                continue
+            if not f.endswith('.pcm'):
+                continue
+            st = os.stat(path)
+            files.append((st.st_mtime, f, st.st_size))
+        self.entries = OrderedDict((f, n) for _, f, n in sorted(files))
+        self.size = sum(self.entries.values())
+
+    def budget(self) -> int:
+        """Size budget in bytes, counting what the cache already holds
+
+        Returns:
+            int: budget in bytes
+        """
+        b = self.budgetSize
+        if b is None:
+            b = configManager.cfg.cache.transcode_budget
+        if b <= 1:
+            b = b * (shutil.disk_usage(self.directory).free + self.size)
+        return int(b)
+
+    def _format(self) -> tuple:
+        freq, fmt, channels = mixer.get_init()
+        return freq, fmt, channels
+
+    def name(self, h: str, fmt: tuple) -> str:
+        """Cache file name of a content hash in a mixer format
+
+        Args:
+            h (str): content hash
+            fmt (tuple): mixer format (frequency, size, channels)
+
+        Returns:
+            str: file name
+        """
+        freq, size, channels = fmt
+        return '{}.{}-{}-{}.pcm'.format(h, freq, size, channels)
+
+    def _key(self, path: str) -> str:
+        record = metaCache.lookup(path)
+        if record is None or record.get('hash') is None or not mixer.get_init():
+            return None  # named by content hash only, a fingerprint may collide
+        duration = record.get('duration')
+        if duration is not None and duration > configManager.cfg.audio.stream_threshold:
+            return None  # streamed from disk, not loaded
+        return self.name(record['hash'], self._format())
+
+    def lookup(self, path: str) -> str:
+        """Transcoded file of a sound, if cached
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            str: path to the transcoded file, None on miss
+        """
+        key = self._key(path)
+        with self.lock:
+            if key is None:
+                self.misses += 1
+                return None
+            self._load()
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            file = os.path.join(self.directory, key)
+        try:
+            os.utime(file)
+        except OSError:  # evicted meanwhile
+            with self.lock:
+                self._forget(key)
+            return None
+        return file
+
+    def mapped(self, path: str) -> mmap.mmap:
+        """Memory map the stored PCM of a sound
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            mmap.mmap: read-only map of the frames in the mixer format, None on miss
+        """
+        file = self.lookup(path)
+        if file is None:
+            return None
+        try:
+            with open(file, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:  # evicted meanwhile, or empty
+            logging.warning("Cannot map {}: {}".format(file, str(e)))
+            return None
+
+    def samples(self, path: str):
+        """Stored PCM of a sound as an array backed by the memory map, nothing is copied
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            numpy.ndarray: read-only frames, shape (frames, channels), None on miss
+        """
+        if numpy is None:
+            return None
+        m = self.mapped(path)
+        if m is None:
+            return None
+        freq, size, channels = self._format()
+        dtype = numpy.dtype(transcodeCache.DTYPES[size])
+        frames = len(m) // (dtype.itemsize * channels)
+        return numpy.frombuffer(m, dtype=dtype, count=frames * channels).reshape(frames, channels)
+
+    def contains(self, path: str) -> bool:
+        key = self._key(path)
+        if key is None:
+            return False
+        with self.lock:
+            self._load()
+            return key in self.entries
+
+    def _forget(self, key: str):
+        n = self.entries.pop(key, None)
+        if n is not None:
+            self.size -= n
+
+    def _add(self, key: str) -> bool:
+        # register a finished transcode and make room for it
+        file = os.path.join(self.directory, key)
+        n = os.path.getsize(file)
+        with self.lock:
+            self._forget(key)
+            if n > self.budget():
+                os.remove(file)
+                logging.warning("{} is larger than the transcode cache.".format(key))
+                return False
+            self.entries[key] = n
+            self.size += n
+            self.evict()
+        return True
+
+    def evict(self, reserve: int = 0):
+        """Delete least recently used files until the cache fits in budget
+
+        Args:
+            reserve (int, optional): bytes to keep free in addition. Defaults to 0.
+        """
+        with self.lock:
+            self._load()
+            budget = self.budget() - reserve
+            for key in list(self.entries):
+                if self.size <= budget:
+                    break
+                self._forget(key)
+                try:
+                    os.remove(os.path.join(self.directory, key))
+                except OSError as e:
+                    logging.error("Cannot evict {}: {}".format(key, str(e)))
+
+    def _job(self, path: str, key: str) -> tuple:
+        freq, size, channels = self._format()
+        part = os.path.join(self.directory, '{}.{}.part'.format(key, next(self.counter)))
+        return (path, part, freq, channels, transcodeCache.CODECS[size])
+
+    def _finish(self, key: str, part: str, ok: bool) -> bool:
+        # move a finished transcode in place, drop what a failed one left behind
+        try:
+            if ok:
+                os.replace(part, os.path.join(self.directory, key))
+                return self._add(key)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        return False
+
+    def transcode(self, path: str) -> str:
+        """Transcode a sound now, blocking
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            str: path to the transcoded file, None if it fails
+        """
+        key = self._key(path)
+        if key is None:
+            return None
+        with self.lock:
+            self._load()
+        args = self._job(path, key)
+        if not self._finish(key, args[1], ffmpegWrapper.transcode(*args)):
+            return None
+        return os.path.join(self.directory, key)
+
+    def request(self, path: str) -> concurrent.futures.Future:
+        """Transcode a sound in the background if not cached yet
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            concurrent.futures.Future: resolves to True once cached, False if
+            transcoding failed; None if nothing was queued (already cached,
+            no worker pool or not cacheable)
+        """
+        key = self._key(path)
+        if self.pool is None or key is None:
+            return None
+        with self.lock:
+            self._load()
+            if key in self.entries:
+                return None
+            if key in self.inflight:
+                return self.inflight[key]
+            args = self._job(path, key)
+            job = self.pool.submit(path, ffmpegWrapper.transcode, *args)
+            future = concurrent.futures.Future()
+            self.inflight[key] = future
+
+        def done(f):
+            ok = False
+            try:
+                ok = self._finish(key, args[1],
+                                  not f.cancelled() and f.exception() is None and f.result())
+            except OSError as e:
+                logging.error("Cannot cache {}: {}".format(path, str(e)))
+            finally:
+                with self.lock:
+                    self.inflight.pop(key, None)
+                future.set_result(ok)
+        job.add_done_callback(done)
+        return future
+
+    def rebuild(self, paths: list) -> int:
+        """Queue every sound that is not cached yet
+
+        Args:
+            paths (list): paths to sound files, most wanted first
+
+        Returns:
+            int: transcodes queued
+        """
+        queued = sum(self.request(p) is not None for p in paths)
+        if queued:
+            logging.info("Transcoding {} sounds to the mixer format in the background.".format(queued))
+        return queued
+
+    def stats(self) -> dict:
+        """Cache usage
+
+        Returns:
+            dict: files, bytes, hits, misses and pending transcodes
+        """
+        with self.lock:
+            self._load()
+            return {'files': len(self.entries), 'bytes': self.size, 'hits': self.hits,
+                    'misses': self.misses, 'pending': len(self.inflight)}
+
+
+transcodedCache = transcodeCache()
+metricsRegistry.gauge('transcode_cache_bytes', 'Disk used by stored PCM', fn=lambda: transcodedCache.size)
+metricsRegistry.gauge('transcode_pending', 'Transcodes queued or running', fn=lambda: len(transcodedCache.inflight))
@@ -1,12 +1,14 @@
-from datetime import datetime
-from .logger import rootLogger, logFormatter
+from .logger import addSink, logFormatter
 import logging
 import py_cui
 import sys
+import time
 import types
 
 from modules import station
-from modules.util import configManager, conversion, Singleton
+from modules.util import configManager, Singleton
+from modules.view import stationView
+from modules.console import logBuffer
 
 
 class TUIHandler(logging.Handler):
@@ -26,7 +28,9 @@ class TUI(Singleton):
         self.station.systemMonitor()
 
         self.station.scheduleInit()
+        self.station.playControl.startPlayout('show')
 
+        self.view = stationView(self.station)
         self.root = root
         self.root.set_on_draw_update_func(self._updateUI)
 
@@ -51,7 +55,7 @@ class TUI(Singleton):
             "[M]ute [P]ause [CTRL]+[UP/DN]Volume [H]elp [Q]uit - Use arrow keys to navigate. ENTER to focus.")
 
         self.logConsole = self.root.add_text_block(
-            'Station Log', 0, 1, row_span=4, column_span=2)
+            'Station Log', 0, 1, row_span=3, column_span=2)
         self.logConsole.set_focus_text(
             '[HOME] [END] [PGUP] [PGDN] - For more log history check log files. ESC to defocus.')
         self.logConsole.add_text_color_rule(
@@ -72,7 +76,7 @@ class TUI(Singleton):
 
         TUIhandler = TUIHandler(self.logConsole)
         TUIhandler.setFormatter(logFormatter)
-        rootLogger.addHandler(TUIhandler)
+        addSink(TUIhandler)
 
         self.playlist = self.root.add_scroll_menu(
             'Media Queue', 0, 0, row_span=2)
@@ -102,38 +106,55 @@ class TUI(Singleton):
         self.resMonitor.add_text_color_rule(
             '\( [ 1-7][0-9]%\)', py_cui.GREEN_ON_BLACK, 'contains', match_type='regex')
 
+        self.metricsPanel = self.root.add_scroll_menu('Metrics', 3, 1, column_span=2)
+        self.metricsPanel.set_focus_text(
+            'Counters, gauges and latency histograms, also served on /metrics.')
+
         self.root.add_key_command(py_cui.keys.KEY_Q_LOWER, self.focusPlaylist)
         self.root.add_key_command(
             py_cui.keys.KEY_L_LOWER, self.focusLogConsole)
         self.root.add_key_command(
             py_cui.keys.KEY_S_LOWER, self.focusResMonitor)
+        self.root.add_key_command(
+            py_cui.keys.KEY_T_LOWER, self.focusMetrics)
 
         #--------------------------------#
         # logConsole keybinding override #
         #--------------------------------#
 
+        # bounded buffer, older history is paged in from the log files
+        self.logConsole._text_lines = logBuffer(configManager.cfg.logger.console_lines,
+                                                configManager.cfg.logger.console_history)
+
+        def logConsole_page_up(self, count):
+            added = self._text_lines.pageUp(count)
+            self._viewport_y_start += added
+            self._cursor_text_pos_y += added
+
         def logConsole_handle_key_press(self, key_pressed):
             if key_pressed == py_cui.keys.KEY_LEFT_ARROW:
                 self._move_left()
             elif key_pressed == py_cui.keys.KEY_RIGHT_ARROW:
                 self._move_right()
             elif key_pressed == py_cui.keys.KEY_UP_ARROW:
+                if self._viewport_y_start == 0:
+                    h, _ = self.get_viewport_dims()
+                    self._page_up(h)
                 self._move_up()
             # TODO: Fix this janky operation here
             elif key_pressed == py_cui.keys.KEY_DOWN_ARROW and self._cursor_text_pos_y < len(self._text_lines) - 1:
                 self._move_down()
             elif key_pressed == py_cui.keys.KEY_HOME:
+                self._page_up(self._text_lines.live.maxlen)
                 self._viewport_y_start = 0
             elif key_pressed == py_cui.keys.KEY_END:
-                self._stick_to_bottom()
-                self._cursor_text_pos_x = 0
-            elif key_pressed == py_cui.keys.KEY_HOME:
-                self._viewport_y_start = 0
-            elif key_pressed == py_cui.keys.KEY_END:
+                self._text_lines.reset()
                 self._stick_to_bottom()
                 self._cursor_text_pos_x = 0
             elif key_pressed == py_cui.keys.KEY_PAGE_UP:
                 h, _ = self.get_viewport_dims()
+                if self._viewport_y_start < h:
+                    self._page_up(h)
                 if self._viewport_y_start < h:
                     self._viewport_y_start = 0
                 else:
@@ -161,19 +182,22 @@ class TUI(Singleton):
             text : str
                 Text to write to the text block
             """
-
-            lines = text.splitlines()
-            if len(self._text_lines) == 1 and self._text_lines[0] == '':
-                self.set_text(text)
-            else:
-                self._text_lines.extend(lines)
-            self._stick_to_bottom()  # changed behavior: stick to bottom
+            h, _ = self.get_viewport_dims()
+            atBottom = self._viewport_y_start + h >= len(self._text_lines)
+            dropped = self._text_lines.extend(text.splitlines())
+            if atBottom:
+                self._stick_to_bottom()  # changed behavior: stick to bottom
+            else:  # keep the history being read in place
+                self._viewport_y_start = max(self._viewport_y_start - dropped, 0)
+                self._cursor_text_pos_y = max(self._cursor_text_pos_y - dropped, 0)
 
         # self.logConsole._handle_key_press = _handle_key_press
         self.logConsole._handle_key_press = types.MethodType(
             logConsole_handle_key_press, self.logConsole)
         self.logConsole._stick_to_bottom = types.MethodType(
             logConsole_stick_to_bottom, self.logConsole)
+        self.logConsole._page_up = types.MethodType(
+            logConsole_page_up, self.logConsole)
         self.logConsole.write = types.MethodType(
             logConsolewrite, self.logConsole)
         pass
@@ -190,19 +214,14 @@ class TUI(Singleton):
         self.playlist.set_selected_item_index(min(currIdx + 1, maxIdx))
 
     def itemMoveTop(self):
-        q = self.station.playControl.queue
         currIdx = self.playlist.get_selected_item_index()
-        temp = q[currIdx]
-        del q[currIdx]
-        q.insert(0, temp)
+        self.station.playControl.moveInPlayList(currIdx, 0)
         self.playlist.set_selected_item_index(0)
 
     def itemMoveBottom(self):
-        q = self.station.playControl.queue
         currIdx = self.playlist.get_selected_item_index()
-        temp = q[currIdx]
-        del q[currIdx]
-        q.append(temp)
+        self.station.playControl.moveInPlayList(
+            currIdx, len(self.station.playControl.queue)-1)
         maxIdx = len(self.playlist._view_items)-1
         self.playlist.set_selected_item_index(maxIdx)
 
@@ -223,67 +242,49 @@ class TUI(Singleton):
     def focusLogConsole(self):
         self.root.move_focus(self.logConsole)
 
+    def focusMetrics(self):
+        self.root.move_focus(self.metricsPanel)
+
     def _updateUI(self):
-        logging.debug("TUI update")
-
-        self.station.playControl.play('show')
-
-        status = []
-        if self.station.mixer.muted:
-            status.append("[MUTED]")
-        if self.station.mixer.paused:
-            status.append("[PAUSED]")
-        statusString = ' '.join(status)
-        t = datetime.now()
-        self.root.set_title(
-            '{} {} Broadcast Automation System {}'.format(statusString, configManager.cfg.station.name, t.strftime("%b-%d-%Y %H:%M:%S")))
-
-        self.station.mixer.get_volume()
-        mixerDigest = []
-        for chan, sound in self.station.mixer.channelLastPlayed.items():
-            if chan == 'stationID' or chan is None:
-                continue
-            mixerDigest.append("[{chan:^6}] ({vol:>3}%) {sound}".format(
-                chan=chan, vol=int(self.station.mixer.vol[chan]*100), sound=sound.path if sound else '<empty>'))
-        oldDigest = self.mixerStatus.get_item_list()
-        if oldDigest != mixerDigest:
+        # only widgets whose data changed are redrawn
+        start = time.perf_counter()
+
+        title = self.view.title()
+        if title is not None:
+            self.root.set_title(title)
+
+        mixerDigest = self.view.mixerDigest()
+        if mixerDigest is not None:
             self.mixerStatus.clear()
             self.mixerStatus.add_item_list(mixerDigest)
 
-        # TODO update index after reordering
-        q = self.station.playControl.queue
-        oldPlaylist = self.playlist.get_item_list()
-        newPlaylist = ["{:>3}. [{}] {}".format(
-            i+1, s.strDuration(), s.path) for i, s in enumerate(q)]
-        idx = self.station.playControl.index
-        if idx != -1:  # -1 when initialized
-            newPlaylist[idx] += ' *'
-
-        if oldPlaylist != newPlaylist:
+        items = self.view.queueItems()
+        if items is not None:
+            selected = self.playlist.get_selected_item_index()
             self.playlist.clear()
-            self.playlist.add_item_list(newPlaylist)
-        totalLength = sum([s.duration for s in q])
-        remainingLength = sum([s.duration for s in q if q.index(s) > idx])
-        self.playlist.set_title("Media Queue ({items}) [{remain} / {total}]".format(
-            items=len(q),
-            remain=conversion.floatToHMS(remainingLength),
-            total=conversion.floatToHMS(totalLength)
-        ))
-
-        stat = self.station.systemStat
-        self.resMonitor.clear()
-        self.resMonitor.add_item('[ CPU ] ({:>3}%)'.format(round(stat['CPU'])))
-        self.resMonitor.add_item('[ RAM ] ({:>3}%) free:{:>7} GiB total:{:>7} GiB'.format(
-            round(stat['RAM'].percent),
-            round(stat['RAM'].free / (2**30), 1),
-            round(stat['RAM'].total / (2**30), 1)))
-        self.resMonitor.add_item('[ STR ] ({:>3}%) free:{:>7} GiB total:{:>7} GiB'.format(
-            round(stat['storage'].percent),
-            round(stat['storage'].free / (2**30), 1),
-            round(stat['storage'].total / (2**30), 1)))
-        self.resMonitor.add_item('[ PWR ] ({:>3}%) {}'.format(100 if stat['power'] is None else stat['power'].percent,
-                                                              '' if (stat['power'] is None or stat['power'].power_plugged is False) else 'CHARGING'))
-        pass
+            self.playlist.add_item_list(items)
+            self.playlist.set_selected_item_index(
+                max(min(selected, len(items)-1), 0))
+        for i, line in self.view.queueMarks():
+            self.playlist._view_items[i] = line
+        queueTitle = self.view.queueTitle()
+        if queueTitle is not None:
+            self.playlist.set_title(queueTitle)
+
+        res = self.view.resources()
+        if res is not None:
+            self.resMonitor.clear()
+            self.resMonitor.add_item_list(res)
+
+        metrics = self.view.metrics()
+        if metrics is not None:
+            selected = self.metricsPanel.get_selected_item_index()
+            self.metricsPanel.clear()
+            self.metricsPanel.add_item_list(metrics)
+            self.metricsPanel.set_selected_item_index(
+                max(min(selected, len(metrics)-1), 0))
+
+        self.view.frame(time.perf_counter() - start)
 
     def help(self):
         helpText = "Volume control: CTRL-UP/DN " + \
@@ -1,17 +1,22 @@
 import datetime
 import hashlib
+import json
 import logging
-from math import ceil
+from math import ceil, isfinite
 import subprocess
 import os
-import multiprocessing
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 import pygame
-from tinydb import TinyDB, Query  # lightweight DB based on JSON
 from watchdog.observers import Observer
 from watchdog.events import PatternMatchingEventHandler
 import yaml
 import munch
 
+from .metrics import metricsRegistry
+
 # TODO hot patch
 
 
@@ -33,6 +38,7 @@ class configProxy(Singleton):
     # https://martin-thoma.com/configuration-files-in-python/
     def __init__(self) -> None:
         self.cfg = None
+        self.callbacks = []
         self.load()
 
     def load(self, filename='config.yml'):
@@ -49,75 +55,389 @@ class configProxy(Singleton):
             logging.info('Config hot reload successfully.')
         except Exception as e:
             logging.error('Config hot reload error: ' + str(e))
+            return
+        for fn in self.callbacks:
+            try:
+                fn()
+            except Exception as e:
+                logging.error('Config reload callback error: ' + str(e))
+
+    def onReload(self, fn):
+        """Call fn after every successful hot reload
+
+        Args:
+            fn (callable): callback without arguments
+        """
+        self.callbacks.append(fn)
 
 
 configManager = configProxy()
 
 
 class db(Singleton):
+    """Sound catalog on SQLite. Writes are buffered and committed in batches
+    by a background thread; reads see buffered writes.
+    """
+    SCHEMA = {
+        'sound': ('hash', ('hash', 'name', 'loudness', 'bitrate')),
+        'file': ('path', ('path', 'size', 'mtime', 'inode', 'hash', 'loudness', 'fingerprint')),
+        'meta': ('path', ('path', 'size', 'mtime', 'hash', 'duration', 'sample_rate', 'channels',
+                          'loudness', 'lra', 'true_peak', 'threshold', 'offset', 'fingerprint')),
+    }
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 1  # second
+
     def __init__(self, filename=None) -> None:
+        if hasattr(self, 'pending'):
+            # a Singleton, but __init__ runs on every db() call, keep the connection and buffered writes
+            if filename is not None and self.conn is None:
+                self.connect(filename)
+            return
         super().__init__()
         self.conn = None
+        self.lock = threading.RLock()
+        self.pending = {t: {} for t in db.SCHEMA}  # table -> key -> row
+        self.pendingCount = 0
+        self.closing = threading.Event()
+        self.flusher = None
         if filename is not None:
             self.connect(filename)
 
     def connect(self, filename: str):
         if self.conn is not None:
             self.disconnect()
-        if filename:
-            self.conn = TinyDB(filename)
-        else:
-            self.conn = TinyDB(configManager.cfg.path.db)
+        if not filename:
+            filename = configManager.cfg.path.db
+        base, ext = os.path.splitext(filename)
+        if ext == '.json':  # legacy TinyDB config
+            filename = base + '.sqlite3'
+        with self.lock:
+            self.conn = sqlite3.connect(filename, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            with self.conn:
+                for table, (key, columns) in db.SCHEMA.items():
+                    self.conn.execute('CREATE TABLE IF NOT EXISTS {} ({} PRIMARY KEY, {})'.format(
+                        table, key, ', '.join(c for c in columns if c != key)))
+                    # columns added since the table was created
+                    existing = set(row['name'] for row in self.conn.execute(
+                        'PRAGMA table_info({})'.format(table)))
+                    for c in columns:
+                        if c not in existing:
+                            self.conn.execute('ALTER TABLE {} ADD COLUMN {}'.format(table, c))
+                    if key != 'hash':
+                        self.conn.execute('CREATE INDEX IF NOT EXISTS {t}_hash ON {t} (hash)'.format(
+                            t=table))
+        if os.path.exists(base + '.json'):
+            self.migrate(base + '.json')
+        self.closing.clear()
+        self.flusher = threading.Thread(
+            name='dbFlush', target=self._flushLoop, daemon=True)
+        self.flusher.start()
+
+    def migrate(self, filename: str):
+        """One-time import of a legacy TinyDB json database. The json file is
+        renamed afterwards.
+
+        Args:
+            filename (str): path to the json database
+        """
+        try:
+            with open(filename, 'r') as f:
+                legacy = json.load(f)
+            n = 0
+            for table in db.SCHEMA:
+                for row in legacy.get(table, {}).values():
+                    self._write(table, row)
+                    n += 1
+            self.flush()
+            os.rename(filename, filename + '.migrated')
+            logging.warning("Database migrated from {}: {} records.".format(
+                filename, n))
+        except Exception as e:
+            logging.error("Database migration from {} failed: {}".format(
+                filename, str(e)))
+
+    def _flushLoop(self):
+        while not self.closing.wait(db.FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error("Database flush error: " + str(e))
+
+    def flush(self):
+        """Commit buffered writes in a single transaction
+        """
+        with self.lock:
+            if self.pendingCount == 0 or self.conn is None:
+                return
+            with self.conn:
+                for table, rows in self.pending.items():
+                    if not rows:
+                        continue
+                    columns = db.SCHEMA[table][1]
+                    self.conn.executemany('INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+                        table, ', '.join(columns), ', '.join('?' * len(columns))),
+                        [tuple(row.get(c) for c in columns) for row in rows.values()])
+                    rows.clear()
+            self.pendingCount = 0
 
     def disconnect(self):
-        if self.conn:
-            self.conn.close()
+        self.closing.set()
+        if self.flusher is not None:
+            self.flusher.join()
+            self.flusher = None
+        with self.lock:
+            if self.conn:
+                self.flush()
+                self.conn.close()
+                self.conn = None
+
+    def _write(self, table: str, row: dict):
+        with self.lock:
+            key = db.SCHEMA[table][0]
+            self.pending[table][row[key]] = row
+            self.pendingCount += 1
+            if self.pendingCount >= db.BATCH_SIZE:
+                self.flush()
+
+    def _read(self, table: str, column: str, value) -> dict:
+        with self.lock:
+            rows = self.pending[table]
+            if column == db.SCHEMA[table][0]:
+                if value in rows:
+                    return dict(rows[value])
+            else:
+                for row in rows.values():
+                    if row.get(column) == value:
+                        return dict(row)
+            row = self.conn.execute('SELECT * FROM {} WHERE {} = ? LIMIT 1'.format(
+                table, column), (value,)).fetchone()
+        return dict(row) if row is not None else None
 
     def isNormalized(self, h: str) -> bool:
         """Test if file with given hash has been normalized
 
         Args:
-            con (TinyDB): TinyDB object
             h (str): hash string
 
         Returns:
             bool: is the sound normalized
         """
-        table = self.conn.table('sound')
-        q = Query()
-        data = table.search(q.hash == h)
-        if len(data) == 0:
+        data = self._read('sound', 'hash', h)
+        if data is None:
             return False
         else:
-            return data[0]['loudness'] == configManager.cfg.audio.loudness
+            return data['loudness'] == configManager.cfg.audio.loudness
 
     def setRecord(self, n: str, h: str, l: int, b: str):
         """Insert record to database
 
         Args:
-            con (TinyDB): TinyDB object
             n (str): name of sound file
             h (str): hash of sound file
             l (int): loudness in LUFS
             b (str): bitrate
         """
-        table = self.conn.table('sound')
-        q = Query()
-        table.upsert({'name': n,
-                      'hash': h,
-                      'loudness': l,
-                      'bitrate': b},
-                     q.hash == h)
-        pass
+        self._write('sound', {'name': n,
+                              'hash': h,
+                              'loudness': l,
+                              'bitrate': b})
+
+    def getIndex(self, path: str) -> dict:
+        """Get library index entry of a file
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            dict: index entry, or None if not indexed
+        """
+        return self._read('file', 'path', path)
+
+    def setIndex(self, path: str, sig: tuple, h: str, l: int, fp: str = None):
+        """Insert or update library index entry of a file
+
+        Args:
+            path (str): path to sound file
+            sig (tuple): stat signature (size, mtime, inode)
+            h (str): hash of sound file
+            l (int): target loudness in LUFS the file has been checked against
+            fp (str, optional): sampled fingerprint of the file. Defaults to None.
+        """
+        self._write('file', {'path': path,
+                             'size': sig[0],
+                             'mtime': sig[1],
+                             'inode': sig[2],
+                             'hash': h,
+                             'loudness': l,
+                             'fingerprint': fp})
+
+    def getMeta(self, path: str) -> dict:
+        """Get cached media metadata of a file by path
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            dict: metadata record, or None if not cached
+        """
+        return self._read('meta', 'path', path)
+
+    def findMeta(self, h: str) -> dict:
+        """Get cached media metadata of a file by content hash
+
+        Args:
+            h (str): hash string
+
+        Returns:
+            dict: metadata record, or None if not cached
+        """
+        return self._read('meta', 'hash', h)
+
+    def setMeta(self, record: dict):
+        """Insert or update media metadata of a file
+
+        Args:
+            record (dict): metadata record, keyed by path
+        """
+        self._write('meta', dict(record))
 
     def __del__(self):
         self.disconnect()
 
 
+class metadataCache:
+    """Media metadata cache (duration, sample rate, channels and loudness statistics).
+
+    Records are keyed by path and validated against file size and mtime, so a
+    file is only probed again after it changes. A bounded LRU is kept in memory;
+    the database (once attached) keeps the records across restarts. Records
+    carry the sampled fingerprint; the content hash is filled in from the
+    caller or the library index, None while unknown.
+    """
+    FIELDS = ('duration', 'sample_rate', 'channels',
+              'loudness', 'lra', 'true_peak', 'threshold', 'offset')
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.db = None
+
+    def attach(self, database: db):
+        """Persist records in the given database
+
+        Args:
+            database (db): connected database
+        """
+        self.db = database
+
+    def _signature(self, path: str):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    def _remember(self, record: dict):
+        with self.lock:
+            self.entries[record['path']] = record
+            self.entries.move_to_end(record['path'])
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def lookup(self, path: str) -> dict:
+        """Get a valid record without probing the file
+
+        Args:
+            path (str): path to sound file
+
+        Returns:
+            dict: metadata record, or None if missing or outdated
+        """
+        try:
+            size, mtime = self._signature(path)
+        except OSError:
+            return None
+        with self.lock:
+            record = self.entries.get(path)
+            if record is not None and (record['size'], record['mtime']) == (size, mtime):
+                self.entries.move_to_end(path)
+                return record
+        if self.db is not None and self.db.conn is not None:
+            record = self.db.getMeta(path)
+            if record is not None and (record['size'], record['mtime']) == (size, mtime):
+                record = dict(record)
+                self._remember(record)
+                return record
+        return None
+
+    def get(self, path: str, h: str = None) -> dict:
+        """Get metadata of a file, probing it with ffprobe only if it is new or changed
+
+        Args:
+            path (str): path to sound file
+            h (str, optional): content hash if already known. Defaults to None.
+
+        Returns:
+            dict: metadata record
+        """
+        record = self.lookup(path)
+        if record is not None:
+            return record
+
+        size, mtime = self._signature(path)
+        fp = fsUtil.fingerprint(path)  # callers wait, do not hash the whole file
+        attached = self.db is not None and self.db.conn is not None
+        if h is None and attached:
+            entry = self.db.getIndex(path)
+            if entry is not None and entry['fingerprint'] == fp:
+                h = entry['hash']  # hashed by the last library scan
+        record = {'path': path, 'size': size, 'mtime': mtime, 'hash': h, 'fingerprint': fp}
+        known = None
+        if h is not None and attached:
+            known = self.db.findMeta(h)  # same content moved or renamed
+        if known is not None and known['size'] == size:
+            for field in metadataCache.FIELDS:
+                record[field] = known.get(field)
+        else:
+            info = ffmpegWrapper.probe(path)
+            for field in metadataCache.FIELDS:
+                record[field] = info.get(field)
+        self._store(record)
+        return record
+
+    def update(self, path: str, h: str = None, **fields):
+        """Update fields of a file's record, e.g. measured loudness
+
+        Args:
+            path (str): path to sound file
+            h (str, optional): content hash if already known. Defaults to None.
+        """
+        record = dict(self.get(path, h))
+        if h is not None:
+            record['hash'] = h
+        record.update(fields)
+        # content may have changed, e.g. after normalization
+        record['size'], record['mtime'] = self._signature(path)
+        self._store(record)
+
+    def _store(self, record: dict):
+        self._remember(record)
+        if self.db is not None and self.db.conn is not None:
+            self.db.setMeta(record)
+
+
+metaCache = metadataCache(configManager.cfg.cache.metadata_entries)
+
+
 class fsUtil:
-    # TODO file system watchdog for normalization
+    # file system watchdog feeding the ingest queue
     class SoundWatchdogHandler(PatternMatchingEventHandler):
-        def process(self, event):
+        def __init__(self, callback=None, **kwargs):
+            super().__init__(**kwargs)
+            self.callback = callback
+
+        def process(self, event, path: str):
             """
             event.event_type 
                 'modified' | 'created' | 'moved' | 'deleted'
@@ -126,18 +446,34 @@ class fsUtil:
             event.src_path
                 path/to/observed/file
             """
-            logging.info(
-                "libWatchdog: {} - {}".format(event.src_path, event.event_type))
-            # normalize
+            if event.is_directory:
+                return
+            logging.debug(
+                "libWatchdog: {} - {}".format(path, event.event_type))
+            if self.callback is not None:
+                self.callback(path)
 
         def on_created(self, event):
-            self.process(event)
+            self.process(event, event.src_path)
+
+        def on_modified(self, event):
+            self.process(event, event.src_path)
 
-    def libWatchdogInit():
+        def on_moved(self, event):
+            # editors and downloaders write a temp file, then rename it
+            self.process(event, event.dest_path)
+
+    def libWatchdogInit(callback=None):
+        """Watch the library for new or changed sounds
+
+        Args:
+            callback (callable, optional): called with the path of each changed file. Defaults to None.
+        """
         patterns = ['*'+t for t in configManager.cfg.audio.formats]
         path = os.path.join(os.getcwd(), configManager.cfg.path.lib)
         observer = Observer()
-        observer.schedule(fsUtil.SoundWatchdogHandler(patterns=patterns,
+        observer.schedule(fsUtil.SoundWatchdogHandler(callback=callback,
+                                                      patterns=patterns,
                                                       case_sensitive=True),
                           path=path,
                           recursive=True)
@@ -174,23 +510,59 @@ class fsUtil:
             "Looking for config change recursively in {} of following config types:{}".format(path, patterns))
         return observer
 
-    def sha256sum(filename: str) -> str:
+    def sha256sum(filename: str, bufferSize: int = 1024*1024) -> str:
         """Calculate hash from file in chunks
 
         Args:
             filename (str): path to the file 
+            bufferSize (int, optional): read size. Defaults to 1 MiB.
 
         Returns:
             str: hash string
         """
         h = hashlib.sha256()
-        b = bytearray(128*1024)
+        b = bytearray(bufferSize)
         mv = memoryview(b)
         with open(filename, 'rb', buffering=0) as f:
             for n in iter(lambda: f.readinto(mv), 0):
                 h.update(mv[:n])
         return h.hexdigest()
 
+    def fingerprint(filename: str, block: int = 64*1024) -> str:
+        """Cheap sampled fingerprint: size plus the head, middle and tail blocks.
+        Tells whether a file changed without reading all of it.
+
+        Args:
+            filename (str): path to the file
+            block (int, optional): sampled block size. Defaults to 64 KiB.
+
+        Returns:
+            str: fingerprint string
+        """
+        h = hashlib.sha256()
+        with open(filename, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            h.update(str(size).encode())
+            if size <= 3 * block:
+                h.update(f.read())
+            else:
+                for offset in (0, (size - block) // 2, size - block):
+                    f.seek(offset)
+                    h.update(f.read(block))
+        return h.hexdigest()
+
+    def signature(filename: str) -> tuple:
+        """Cheap change detection signature from file stat
+
+        Args:
+            filename (str): path to the file
+
+        Returns:
+            tuple: (size, mtime, inode)
+        """
+        st = os.stat(filename)
+        return st.st_size, st.st_mtime, st.st_ino
+
     def list_sound(t: str) -> list:
         """list sound files of the given type
 
@@ -225,6 +597,61 @@ class conversion:
 
 
 class ffmpegWrapper:
+    lock = threading.Lock()
+    running = {}  # ffmpeg process -> group of the job that started it
+    local = threading.local()  # group of the job on this thread, i.e. its worker pool
+    seconds = metricsRegistry.histogram('subprocess_seconds', 'Run time of ffmpeg and ffprobe calls',
+                                        ('program', 'status'))
+
+    def observe(cmd: list, started: float, returncode: int):
+        """Record a finished ffmpeg or ffprobe call
+
+        Args:
+            cmd (list): command and arguments
+            started (float): time.perf_counter() at start
+            returncode (int): exit status, None if it could not run
+        """
+        program = os.path.splitext(os.path.basename(cmd[0]))[0]
+        ffmpegWrapper.seconds.observe(time.perf_counter() - started, program=program,
+                                      status='ok' if returncode == 0 else 'error')
+
+    def probe(file) -> dict:
+        """Probe duration, sample rate and channel count in a single ffprobe run
+
+        Args:
+            file (str): path to sound file
+
+        Returns:
+            dict: duration (s), sample_rate (Hz) and channels; empty if probing fails
+        """
+        logging.debug("Running probe:")
+        prog = ''
+        if os.name == 'nt':  # Windows
+            prog = 'ffprobe.exe'
+        elif os.name == 'posix':  # Linux, Mac OS, etc
+            prog = "./ffprobe"
+        cmd = [os.path.join(configManager.cfg.path.bin, prog), '-v', 'error', '-select_streams', 'a:0',
+               '-show_entries', 'format=duration:stream=sample_rate,channels', '-of', 'json', file]
+        started = time.perf_counter()
+        result = None
+        try:
+            try:
+                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            finally:
+                ffmpegWrapper.observe(cmd, started, result and result.returncode)
+            logging.debug("probe output {}: ".format(file)+repr(result))
+            out = json.loads(result.stdout)
+            info = {'duration': float(out['format']['duration'])}
+            if out.get('streams'):
+                info['sample_rate'] = int(out['streams'][0]['sample_rate'])
+                info['channels'] = int(out['streams'][0]['channels'])
+            return info
+        except PermissionError as e:
+            logging.error("Permission error: " + str(e))
+        except Exception as e:
+            logging.error("Error occured in the ffprobe probe: " + str(e))
+        return {}
+
     def getLength(file):
         logging.debug("Running getLength:")
         prog = ''
@@ -250,39 +677,116 @@ class ffmpegWrapper:
         except Exception as e:
             logging.error("Error occured in the ffprobe getLength: " + str(e))
 
-            """ .\bin\ffmpeg.exe -i '.\lib\show\My Funny Valentine.m4a' -hide_banner -filter_complex ebur128 -f null -"""
+    def measureLoudness(file) -> dict:
+        """Measure loudness statistics in a single decode pass, using the
+        analysis (first) pass of the loudnorm filter
 
-    def getLoudness(file):
-        logging.debug("Running getLoudness:")
+        Args:
+            file (str): path to sound file
+
+        Returns:
+            dict: integrated loudness (LUFS), lra (LU), true_peak (dBTP),
+            threshold (LUFS) and offset (LU); empty if measurement fails
+        """
+        logging.debug("Running measureLoudness:")
         prog = ''
         if os.name == 'nt':  # Windows
             prog = 'ffmpeg.exe'
         elif os.name == 'posix':  # Linux, Mac OS, etc
             prog = "./ffmpeg"
+        result = None
         try:
-            # run command
-            try:
-                result = subprocess.run([os.path.join(configManager.cfg.path.bin, prog), '-i', file, '-hide_banner', '-filter_complex',
-                                        'ebur128', '-f', 'null', '-'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                logging.debug("getLength output: "+repr(result))
-            except PermissionError as e:
-                logging.error("Permission error: " + str(e))
-            # extract result
-            try:
-                loudness = float(result.stdout.splitlines()[-8].split()[1])
-                logging.debug(
-                    "Loudness of {} is {} LUFS".format(file, loudness))
-                return loudness
-            except ValueError as e:
-                logging.error(
-                    "Unexpected output for loudness (float expected): " + loudness)
+            result = ffmpegWrapper.run([os.path.join(configManager.cfg.path.bin, prog), '-hide_banner', '-nostats', '-i', file,
+                                        '-af', 'loudnorm=I={}:LRA=7:tp=-2:print_format=json'.format(
+                                            configManager.cfg.audio.loudness),
+                                        '-f', 'null', '-'])
+            # the json summary is the last thing printed
+            out = result.stdout.decode(errors='replace')
+            stats = json.loads(out[out.rindex('{'):out.rindex('}')+1])
+            measured = {'loudness': float(stats['input_i']),
+                        'lra': float(stats['input_lra']),
+                        'true_peak': float(stats['input_tp']),
+                        'threshold': float(stats['input_thresh']),
+                        'offset': float(stats['target_offset'])}
+            logging.debug(
+                "Loudness of {} is {} LUFS".format(file, measured['loudness']))
+            return measured
+        except PermissionError as e:
+            logging.error("Permission error: " + str(e))
         except Exception as e:
             logging.error(
                 "Error occured in the ffmpeg loudness detection: " + str(e) + repr(result))
+        return {}
+
+    def decode(file, rate: int, channels: int, frames: int):
+        """Decode a file to 32-bit float PCM, block by block. The process is
+        tracked so it can be stopped by terminateAll.
+
+        Args:
+            file (str): path to sound file
+            rate (int): sample rate in Hz
+            channels (int): channel count
+            frames (int): frames per block
+
+        Yields:
+            bytes: interleaved float32 frames
+        """
+        prog = ''
+        if os.name == 'nt':  # Windows
+            prog = 'ffmpeg.exe'
+        elif os.name == 'posix':  # Linux, Mac OS, etc
+            prog = "./ffmpeg"
+        cmd = [os.path.join(configManager.cfg.path.bin, prog), '-v', 'error', '-nostdin', '-i', file,
+               '-vn', '-ar', str(rate), '-ac', str(channels), '-f', 'f32le', '-']
+        started = time.perf_counter()
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError:
+            ffmpegWrapper.observe(cmd, started, None)
+            raise
+        ffmpegWrapper._track(p)
+        try:
+            size = frames * channels * 4
+            while True:
+                chunk = p.stdout.read(size)
+                if not chunk:
+                    break
+                yield chunk
+            if p.wait() != 0:
+                raise RuntimeError("ffmpeg returned {}".format(p.returncode))
+        finally:
+            if p.poll() is None:  # consumer stopped early
+                p.kill()
+            p.stdout.close()
+            p.wait()
+            ffmpegWrapper._untrack(p)
+            ffmpegWrapper.observe(cmd, started, p.returncode)
+
+    def getLoudness(file):
+        """Integrated loudness of a file
 
-    # TODO logging is not process safe!
-    def normalizeLoudness(file, loudness):
-        workerName = multiprocessing.current_process().name
+        Args:
+            file (str): path to sound file
+
+        Returns:
+            float: loudness in LUFS, None if measurement fails
+        """
+        return ffmpegWrapper.measureLoudness(file).get('loudness')
+
+    def normalizeLoudness(file, loudness, measured: dict = None) -> bool:
+        """Normalize loudness of a file in place. Blocks until ffmpeg exits.
+
+        Args:
+            file (str): path to sound file
+            loudness (int): target loudness in LUFS
+            measured (dict, optional): statistics from measureLoudness. If given,
+                the file is corrected linearly in a single pass instead of
+                being analyzed again by the dynamic loudnorm mode. Defaults to None.
+
+        Returns:
+            bool: True if the file was normalized
+        """
+        workerName = threading.current_thread().name
         logging.debug(
             "Worker " + workerName + " has started.")
         prog = ''
@@ -292,29 +796,156 @@ class ffmpegWrapper:
             prog = "./ffmpeg"
         try:
             os.rename(file, file+".normalizing")
-            cmd = '"{prog}" -y -i "{infile}" -af loudnorm=I={loudness}:LRA=7:tp=-2 -b:a "{bitrate}" -f mp3 "{outfile}"'.format(
-                prog=os.path.join(configManager.cfg.path.bin, prog),
-                loudness=loudness,
-                bitrate=str(configManager.cfg.audio.bitrate),
-                infile=file+".normalizing",
-                outfile=file+".normalized")
+            cmd = [os.path.join(configManager.cfg.path.bin, prog), '-y', '-i', file+".normalizing",
+                   '-af', ffmpegWrapper.loudnormFilter(loudness, measured),
+                   '-b:a', str(configManager.cfg.audio.bitrate), '-f', 'mp3', file+".normalized"]
 
             logging.info(
                 "Normalizing loudness for \"{}\" at {} LUFS".format(file, loudness))
-            logging.debug("Command: " + cmd)
+            logging.debug("Command: " + ' '.join(cmd))
 
             # suppress output to stdout from the subprocess
-            FNULL = open(os.devnull, 'w')
-            subprocess.call(cmd, stdout=FNULL, stderr=FNULL, shell=False)
-            # subprocess.call(cmd, shell=False)
+            returncode = ffmpegWrapper.call(cmd)
             logging.debug("ffmpeg exited")
 
+            if returncode != 0:
+                raise RuntimeError("ffmpeg returned {}".format(returncode))
             os.remove(file+".normalizing")
             os.rename(file+".normalized", file)
+            return True
         except PermissionError as e:
             logging.error("Permission error: " + str(e))
         except Exception as e:
             logging.error(
                 "Error occurred in the loudness normalization: " + str(e))
+            # put the original back
+            if os.path.exists(file+".normalizing"):
+                if os.path.exists(file+".normalized"):
+                    os.remove(file+".normalized")
+                os.rename(file+".normalizing", file)
         finally:
             logging.debug("Worker " + workerName + " ends.")
+        return False
+
+    def transcode(file, out, rate: int, channels: int, codec: str) -> bool:
+        """Decode a file to headerless PCM. Blocks until ffmpeg exits.
+
+        Args:
+            file (str): path to sound file
+            out (str): path to the PCM file written
+            rate (int): sample rate in Hz
+            channels (int): channel count
+            codec (str): ffmpeg PCM codec, e.g. pcm_s16le
+
+        Returns:
+            bool: True if transcoded
+        """
+        prog = ''
+        if os.name == 'nt':  # Windows
+            prog = 'ffmpeg.exe'
+        elif os.name == 'posix':  # Linux, Mac OS, etc
+            prog = "./ffmpeg"
+        cmd = [os.path.join(configManager.cfg.path.bin, prog), '-y', '-v', 'error', '-nostdin', '-i', file,
+               '-vn', '-map_metadata', '-1', '-ar', str(rate), '-ac', str(channels),
+               '-c:a', codec, '-f', codec[len('pcm_'):], out]
+        logging.debug("Command: " + ' '.join(cmd))
+        try:
+            returncode = ffmpegWrapper.call(cmd)
+            if returncode != 0:
+                raise RuntimeError("ffmpeg returned {}".format(returncode))
+            return True
+        except Exception as e:
+            logging.error("Error occurred in the transcoding of {}: {}".format(file, str(e)))
+            if os.path.exists(out):
+                os.remove(out)
+        return False
+
+    def loudnormFilter(loudness, measured: dict = None) -> str:
+        """Build loudnorm filter arguments
+
+        Args:
+            loudness (int): target loudness in LUFS
+            measured (dict, optional): statistics from measureLoudness. Defaults to None.
+
+        Returns:
+            str: filter string
+        """
+        f = 'loudnorm=I={}:LRA=7:tp=-2'.format(loudness)
+        # silence measures -inf, leave it to the dynamic mode
+        if measured and all(isfinite(v) for v in measured.values()):
+            f += ':measured_I={loudness}:measured_LRA={lra}:measured_TP={true_peak}' \
+                 ':measured_thresh={threshold}:offset={offset}:linear=true'.format(**measured)
+        return f
+
+    def run(cmd: list) -> subprocess.CompletedProcess:
+        """Run an ffmpeg command and capture its output (stdout and stderr combined).
+        Running processes are tracked so they can be stopped by terminateAll.
+
+        Args:
+            cmd (list): command and arguments
+
+        Returns:
+            subprocess.CompletedProcess: return code and output
+        """
+        started = time.perf_counter()
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT)
+        except OSError:
+            ffmpegWrapper.observe(cmd, started, None)
+            raise
+        ffmpegWrapper._track(p)
+        try:
+            out, _ = p.communicate()
+            return subprocess.CompletedProcess(cmd, p.returncode, out)
+        finally:
+            ffmpegWrapper._untrack(p)
+            ffmpegWrapper.observe(cmd, started, p.returncode)
+
+    def call(cmd: list) -> int:
+        """Run an ffmpeg command with output suppressed. Running processes are
+        tracked so they can be stopped by terminateAll.
+
+        Args:
+            cmd (list): command and arguments
+
+        Returns:
+            int: return code
+        """
+        started = time.perf_counter()
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
+        except OSError:
+            ffmpegWrapper.observe(cmd, started, None)
+            raise
+        ffmpegWrapper._track(p)
+        try:
+            return p.wait()
+        finally:
+            ffmpegWrapper._untrack(p)
+            ffmpegWrapper.observe(cmd, started, p.returncode)
+
+    def _track(p: subprocess.Popen):
+        with ffmpegWrapper.lock:
+            ffmpegWrapper.running[p] = getattr(ffmpegWrapper.local, 'group', None)
+
+    def _untrack(p: subprocess.Popen):
+        with ffmpegWrapper.lock:
+            ffmpegWrapper.running.pop(p, None)
+
+    def terminateAll(group=None):
+        """Terminate running ffmpeg processes
+
+        Args:
+            group (optional): only those started by jobs of this group, i.e. a worker pool.
+                Defaults to None, i.e. all of them.
+        """
+        with ffmpegWrapper.lock:
+            procs = [p for p, g in ffmpegWrapper.running.items() if group is None or g is group]
+        for p in procs:
+            p.terminate()
+        if procs:
+            logging.warning(
+                "{} ffmpeg processes terminated.".format(len(procs)))
+
@@ -0,0 +1,201 @@
+import collections
+import time
+from datetime import datetime
+
+from .metrics import metricsRegistry, histogram
+from .util import configManager, conversion
+
+
+class section:
+    """A piece of view state rendered only when its source changed. The source
+    publishes a cheap change token (i.e. a version counter); render runs only
+    when the token differs from the one seen last time.
+    """
+    def __init__(self, token, render) -> None:
+        """
+        Args:
+            token (callable): returns the current change token
+            render (callable): builds the view data
+        """
+        self.token = token
+        self.render = render
+        self.last = object()  # never equal to a real token
+        self.data = None
+
+    def poll(self):
+        """Render if the source changed
+
+        Returns:
+            rendered data, None if unchanged
+        """
+        token = self.token()
+        if token == self.last:
+            return None
+        self.last = token
+        self.data = self.render()
+        return self.data
+
+
+class stationView:
+    """View model of the station for the TUI. Every query returns None when
+    the widget behind it does not need a redraw, so a steady frame costs the
+    same for any queue length.
+    """
+    MARK = ' *'
+    frameSeconds = metricsRegistry.histogram('tui_frame_seconds', 'Time spent on one TUI update')
+
+    def __init__(self, station) -> None:
+        self.station = station
+        self.control = station.playControl
+        self.labels = []  # playlist lines without the play mark
+        self.marked = -1  # index carrying the play mark
+        self.frameTimes = collections.deque(maxlen=100)  # seconds per update
+        self.titleSection = section(self._titleToken, self._title)
+        self.mixerSection = section(self._mixerToken, self._mixerDigest)
+        self.queueSection = section(lambda: self.control.queue.version, self._queueItems)
+        self.queueTitleSection = section(
+            lambda: (self.control.queue.version, self.control.index), self._queueTitle)
+        self.resourceSection = section(self._resourceToken, self._resources)
+        self.metricsSection = section(lambda: int(time.time()), self._metrics)
+
+    def _titleToken(self):
+        return (self.station.mixer.muted, self.station.mixer.paused, int(time.time()))
+
+    def _title(self) -> str:
+        status = []
+        if self.station.mixer.muted:
+            status.append("[MUTED]")
+        if self.station.mixer.paused:
+            status.append("[PAUSED]")
+        return '{} {} Broadcast Automation System {}'.format(
+            ' '.join(status), configManager.cfg.station.name, datetime.now().strftime("%b-%d-%Y %H:%M:%S"))
+
+    def _mixerToken(self):
+        m = self.station.mixer
+        vol = m.get_volume()
+        return tuple((chan, vol.get(chan), getattr(s, 'path', s))
+                     for chan, s in m.channelLastPlayed.items())
+
+    def _mixerDigest(self) -> list:
+        m = self.station.mixer
+        digest = []
+        for chan, s in m.channelLastPlayed.items():
+            if chan == 'stationID' or chan is None:
+                continue
+            digest.append("[{chan:^6}] ({vol:>3}%) {sound}".format(
+                chan=chan, vol=int(m.vol[chan]*100), sound=s.path if s else '<empty>'))
+        return digest
+
+    def _queueItems(self) -> list:
+        self.labels = ["{:>3}. [{}] {}".format(i+1, conversion.floatToHMS(d), s.path)
+                       for i, (s, d) in enumerate(self.control.queue.entries())]
+        self.marked = -1
+        return list(self.labels)
+
+    def _queueTitle(self) -> str:
+        q = self.control.queue
+        return "Media Queue ({items}) [{remain} / {total}]".format(
+            items=len(q),
+            remain=conversion.floatToHMS(q.remaining(self.control.index)),
+            total=conversion.floatToHMS(q.total()))
+
+    def _resourceToken(self):
+        frame = max(self.frameTimes) if self.frameTimes else 0
+        return id(self.station.systemStat), round(frame * 1000)
+
+    def _resources(self) -> list:
+        stat = self.station.systemStat
+        frame = max(self.frameTimes) if self.frameTimes else 0
+        return [
+            '[ CPU ] ({:>3}%)'.format(round(stat['CPU'])),
+            '[ RAM ] ({:>3}%) free:{:>7} GiB total:{:>7} GiB'.format(
+                round(stat['RAM'].percent),
+                round(stat['RAM'].free / (2**30), 1),
+                round(stat['RAM'].total / (2**30), 1)),
+            '[ STR ] ({:>3}%) free:{:>7} GiB total:{:>7} GiB'.format(
+                round(stat['storage'].percent),
+                round(stat['storage'].free / (2**30), 1),
+                round(stat['storage'].total / (2**30), 1)),
+            '[ PWR ] ({:>3}%) {}'.format(100 if stat['power'] is None else stat['power'].percent,
+                                         '' if (stat['power'] is None or stat['power'].power_plugged is False) else 'CHARGING'),
+            '[ TUI ] frame {:.1f} ms'.format(frame * 1000)]
+
+    def _metrics(self) -> list:
+        lines = []
+        for m in metricsRegistry.collect():
+            for labels in m.labelSets():
+                name = m.name
+                if labels:
+                    name += '{' + ','.join(labels.values()) + '}'
+                if isinstance(m, histogram):
+                    s = m.summary(**labels)
+                    if s is None:
+                        continue
+                    lines.append('{:<40} n={:<7} mean={:>8.1f}ms p95={:>8.1f}ms'.format(
+                        name, s['count'], s['mean'] * 1000, s['p95'] * 1000))
+                    continue
+                try:
+                    value = m.get(**labels)
+                except Exception:
+                    continue  # owner gone
+                if value is None:
+                    continue
+                if m.name.endswith('_bytes'):
+                    lines.append('{:<40} {:.1f} MiB'.format(name, value / 2**20))
+                else:
+                    lines.append('{:<40} {:g}'.format(name, value))
+        return lines
+
+    def title(self) -> str:
+        return self.titleSection.poll()
+
+    def mixerDigest(self) -> list:
+        return self.mixerSection.poll()
+
+    def queueItems(self) -> list:
+        """Playlist lines, None if the playlist did not change. The play
+        mark is applied through queueMarks.
+        """
+        return self.queueSection.poll()
+
+    def queueMarks(self) -> list:
+        """Lines to replace when the play index moved
+
+        Returns:
+            list: (index, line) to update, empty if nothing changed
+        """
+        idx = self.control.index
+        if idx == self.marked:
+            return []
+        changes = []
+        if 0 <= self.marked < len(self.labels):
+            changes.append((self.marked, self.labels[self.marked]))
+        if 0 <= idx < len(self.labels):
+            changes.append((idx, self.labels[idx] + stationView.MARK))
+        self.marked = idx
+        return changes
+
+    def queueTitle(self) -> str:
+        return self.queueTitleSection.poll()
+
+    def resources(self) -> list:
+        if self.station.systemStat is None:
+            return None
+        return self.resourceSection.poll()
+
+    def metrics(self) -> list:
+        """Metric summaries, at most once a second
+
+        Returns:
+            list: one line per metric and label values, None if not due
+        """
+        return self.metricsSection.poll()
+
+    def frame(self, seconds: float):
+        """Record the time spent on one update
+
+        Args:
+            seconds (float): frame time
+        """
+        self.frameTimes.append(seconds)
+        stationView.frameSeconds.observe(seconds)
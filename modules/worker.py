@@ -0,0 +1,278 @@
+import concurrent.futures
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from .util import ffmpegWrapper
+
+# job running in this worker process, for log context
+_context = {'job': None, 'start': None}
+
+
+class jobContext(logging.Filter):
+    """Tag records logged in a worker process with the job and its elapsed time
+    """
+    def filter(self, record) -> bool:
+        if _context['job'] is not None:
+            record.msg = "[{} +{:.1f}s] {}".format(
+                os.path.basename(_context['job']), time.time() - _context['start'], record.getMessage())
+            record.args = None
+        record.threadName = multiprocessing.current_process().name
+        return True
+
+
+class logBridge:
+    """Carry log records from worker processes to the handlers of the main
+    process. Workers only put records on a multiprocessing queue; a listener
+    thread in the main process hands them to the local loggers.
+    """
+    def __init__(self, ctx) -> None:
+        self.queue = ctx.Queue()
+        self.thread = None
+
+    def attach(q, level: int, name: str):
+        """Process pool initializer: log through the bridge queue
+
+        Args:
+            q (multiprocessing.Queue): bridge queue
+            level (int): root logger level
+            name (str): worker process name prefix
+        """
+        multiprocessing.current_process().name = '{}-p{}'.format(name, os.getpid())
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        handler = logging.handlers.QueueHandler(q)
+        handler.addFilter(jobContext())
+        root.addHandler(handler)
+        root.setLevel(level)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            logger = logging.getLogger(record.name)
+            if logger.isEnabledFor(record.levelno):
+                logger.handle(record)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                name='LogBridge', target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+
+def _initProcess(q, level: int, name: str, cancels):
+    # process pool initializer: log through the bridge, stop our ffmpeg on cancel
+    logBridge.attach(q, level, name)
+    threading.Thread(name='Cancel', target=_watchCancel, args=(cancels,), daemon=True).start()
+
+
+def _watchCancel(cancels):
+    # ffmpegWrapper only sees processes started in this process, count cancels of the pool
+    seen = cancels.value
+    while True:
+        time.sleep(0.1)
+        if cancels.value != seen:
+            seen = cancels.value
+            ffmpegWrapper.terminateAll()
+
+
+def _runJob(name: str, fn, args: tuple):
+    # job entry point in a worker process
+    _context['job'], _context['start'] = name, time.time()
+    try:
+        return fn(*args)
+    finally:
+        _context['job'] = None
+
+
+class job:
+    """A unit of work waiting in the pool queue
+    """
+    def __init__(self, name: str, fn, args: tuple) -> None:
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.future = concurrent.futures.Future()
+
+
+class workerPool:
+    """Bounded pool of worker threads consuming a job queue.
+
+    Heavy lifting (ffmpeg) happens in subprocesses, so threads are enough to
+    keep every core busy while the number of concurrent decodes stays bounded.
+    In 'process' mode each worker thread hands its job to a worker process
+    instead, for jobs that spend their time in Python; their log records are
+    forwarded to the main process through a logBridge.
+    """
+    MODES = ('thread', 'process')
+
+    def __init__(self, workers: int = 0, name: str = 'Worker', mode: str = 'thread',
+                 level: int = logging.INFO) -> None:
+        """
+        Args:
+            workers (int, optional): number of worker threads. Defaults to 0, i.e. cores minus one.
+            name (str, optional): thread name prefix. Defaults to 'Worker'.
+            mode (str, optional): 'thread' or 'process'. Defaults to 'thread'.
+            level (int, optional): log level of progress reports. Defaults to logging.INFO.
+        """
+        assert mode in workerPool.MODES
+        if not workers:
+            workers = max((os.cpu_count() or 2) - 1, 1)
+        self.workers = workers
+        self.name = name
+        self.mode = mode
+        self.level = level
+        self.executor = None
+        self.bridge = None
+        self.cancels = None  # shared with worker processes, bumped by cancel
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.submitted = 0
+        self.finished = 0
+        self.failed = 0
+        self.lastReport = 0
+
+    def start(self):
+        """Start worker threads if not running yet
+        """
+        with self.lock:
+            if self.mode == 'process' and self.executor is None:
+                # spawn: forking a process with running threads is unsafe
+                ctx = multiprocessing.get_context('spawn')
+                self.bridge = logBridge(ctx)
+                self.bridge.start()
+                self.cancels = ctx.Value('i', 0)
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=ctx, initializer=_initProcess,
+                    initargs=(self.bridge.queue, logging.getLogger().level, self.name, self.cancels))
+            self.threads = [t for t in self.threads if t.is_alive()]
+            for i in range(len(self.threads), self.workers):
+                t = threading.Thread(name='{}-{}'.format(self.name, i),
+                                     target=self._run, daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def submit(self, name: str, fn, *args) -> concurrent.futures.Future:
+        """Queue a job
+
+        Args:
+            name (str): job description, i.e. path to the file processed
+            fn (callable): function to run in a worker
+
+        Returns:
+            concurrent.futures.Future: result of fn
+        """
+        j = job(name, fn, args)
+        with self.lock:
+            self.submitted += 1
+        self.cancelled.clear()
+        self.start()
+        self.jobs.put(j)
+        return j.future
+
+    def progress(self) -> tuple:
+        """Job progress
+
+        Returns:
+            tuple: (finished, failed, submitted)
+        """
+        with self.lock:
+            return self.finished, self.failed, self.submitted
+
+    def _report(self):
+        done, failed, total = self.progress()
+        now = time.time()
+        if done == total or now - self.lastReport >= 5:
+            self.lastReport = now
+            logging.log(self.level, "{} progress: {}/{} done, {} failed.".format(
+                self.name, done, total, failed))
+
+    def _run(self):
+        ffmpegWrapper.local.group = self  # ffmpeg started by our jobs, stopped by cancel
+        while True:
+            j = self.jobs.get()
+            if j is None:  # shutdown sentinel
+                self.jobs.task_done()
+                return
+            try:
+                if self.cancelled.is_set() or not j.future.set_running_or_notify_cancel():
+                    j.future.cancel()
+                    with self.lock:
+                        self.submitted -= 1
+                    continue
+                try:
+                    if self.executor is not None:
+                        result = self.executor.submit(
+                            _runJob, j.name, j.fn, j.args).result()
+                    else:
+                        result = j.fn(*j.args)
+                    with self.lock:
+                        self.finished += 1
+                    j.future.set_result(result)
+                except Exception as e:
+                    logging.error("Job {} failed: {}".format(j.name, str(e)))
+                    with self.lock:
+                        self.finished += 1
+                        self.failed += 1
+                    j.future.set_exception(e)
+                self._report()
+            finally:
+                self.jobs.task_done()
+
+    def cancel(self):
+        """Drop queued jobs and stop the ffmpeg processes of running ones
+        """
+        self.cancelled.set()
+        dropped = 0
+        while True:
+            try:
+                j = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if j is not None:
+                j.future.cancel()
+                dropped += 1
+            self.jobs.task_done()
+        with self.lock:
+            self.submitted -= dropped
+        ffmpegWrapper.terminateAll(self)
+        if self.cancels is not None:
+            with self.cancels.get_lock():
+                self.cancels.value += 1  # worker processes stop theirs
+        if dropped:
+            logging.warning("{}: {} queued jobs cancelled.".format(
+                self.name, dropped))
+
+    def shutdown(self):
+        """Cancel pending work and stop worker threads
+        """
+        self.cancel()
+        with self.lock:
+            threads = list(self.threads)
+            self.threads = []
+        for _ in threads:
+            self.jobs.put(None)
+        for t in threads:
+            t.join(timeout=5)
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.cancels = None
+        if self.bridge is not None:
+            self.bridge.stop()
+            self.bridge = None
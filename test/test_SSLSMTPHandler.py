@@ -0,0 +1,67 @@
+from modules.logger import SSLSMTPHandler
+
+import logging
+import smtplib
+import time
+import unittest
+from unittest import mock
+
+
+class TestSSLSMTPHandler(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(smtplib, 'SMTP')
+        self.SMTP = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sessions = []
+
+        def session(*args, **kwargs):
+            s = mock.Mock()
+            s.noop.return_value = (250, b'OK')
+            self.sessions.append(s)
+            return s
+        self.SMTP.side_effect = session
+        self.handler = SSLSMTPHandler(mailhost=('smtp.example.com', 587), fromaddr='wrpi@example.com',
+                                      toaddrs=['ops@example.com'], subject='Alert',
+                                      credentials=('user', 'secret'), timeout=5, keepalive=300)
+        self.handler.handleError = mock.Mock()
+
+    def emit(self, msg='Playout error'):
+        self.handler.emit(logging.makeLogRecord({'msg': msg, 'levelno': logging.ERROR}))
+
+    def test_reuse(self):
+        self.emit()
+        self.emit()
+        assert len(self.sessions) == 1
+        s = self.sessions[0]
+        s.starttls.assert_called_once()
+        s.login.assert_called_once_with('user', 'secret')
+        assert s.send_message.call_count == 2
+        s.noop.assert_not_called()  # used recently
+
+    def test_keepalive(self):
+        self.emit()
+        self.handler.lastUsed = time.time() - 301
+        self.emit()
+        assert len(self.sessions) == 1
+        self.sessions[0].noop.assert_called_once()
+
+    def test_reconnect_idle(self):
+        self.emit()
+        self.sessions[0].noop.side_effect = smtplib.SMTPServerDisconnected()
+        self.handler.lastUsed = time.time() - 301
+        self.emit()
+        assert len(self.sessions) == 2
+        assert self.sessions[1].send_message.call_count == 1
+
+    def test_reconnect_on_send(self):
+        self.emit()
+        self.sessions[0].send_message.side_effect = smtplib.SMTPServerDisconnected()
+        self.emit()
+        assert len(self.sessions) == 2
+        assert self.sessions[1].send_message.call_count == 1
+        self.handler.handleError.assert_not_called()
+
+    def test_no_alert(self):
+        self.handler.emit(logging.makeLogRecord({'msg': 'Email alert sent.', 'noAlert': True}))
+        assert self.sessions == []
@@ -0,0 +1,62 @@
+from modules.alert import alertAggregator
+
+import logging
+import unittest
+
+
+class TestAlertAggregator(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.target = logging.Handler(logging.ERROR)
+        self.target.emit = self.sent.append
+        self.alerts = alertAggregator(self.target, window=600, interval=3600, digest="08:00")
+
+    def tearDown(self):
+        self.alerts.close()
+
+    def record(self, msg, level=logging.ERROR, lineno=1):
+        return logging.LogRecord('root', level, 'station.py', lineno, msg, None, None)
+
+    def test_fingerprint(self):
+        a = self.record('Cannot normalize "lib/show/a.mp3": ffmpeg returned 1')
+        b = self.record('Cannot normalize "lib/show/b.mp3": ffmpeg returned 234')
+        c = self.record('Cannot normalize "lib/show/b.mp3": ffmpeg returned 1', lineno=2)
+        assert alertAggregator.fingerprint(a) == alertAggregator.fingerprint(b)
+        assert alertAggregator.fingerprint(a) != alertAggregator.fingerprint(c)
+
+    def test_storm(self):
+        for i in range(100):
+            self.alerts.handle(self.record('Job {} failed'.format(i)))
+        self.alerts.flush()
+        assert len(self.sent) == 1
+        assert 'x100' in self.sent[0].getMessage()
+        for i in range(50):
+            self.alerts.handle(self.record('Job {} failed'.format(i)))
+        self.alerts.flush()
+        assert len(self.sent) == 1  # suppressed within the window
+
+    def test_batch(self):
+        self.alerts.handle(self.record('Disk full', lineno=1))
+        self.alerts.handle(self.record('Playout error', lineno=2))
+        self.alerts.flush()
+        assert len(self.sent) == 1
+        assert self.sent[0].getMessage().startswith('2 alerts:')
+
+    def test_digest(self):
+        for i in range(3):
+            self.alerts.handle(self.record('Job {} failed'.format(i)))
+        self.alerts.flush()
+        self.alerts.digest()
+        digest = self.sent[-1].getMessage()
+        assert digest.startswith('Daily digest: 3 alerts of 1 kinds.')
+        assert '[ERROR] x3 first ' in digest
+        self.alerts.digest()
+        assert len(self.sent) == 2  # nothing new, no digest
+
+    def test_no_alert(self):
+        r = self.record('Fail to send email alert')
+        r.noAlert = True
+        self.alerts.handle(r)
+        self.alerts.flush()
+        assert self.sent == []
@@ -0,0 +1,64 @@
+from modules.audio import automation
+
+import time
+import unittest
+
+
+class fakeChannel:
+    def __init__(self, vol=1.0):
+        self.vol = vol
+        self.history = []
+
+    def get_volume(self):
+        return self.vol
+
+    def set_volume(self, vol):
+        self.vol = vol
+        self.history.append(vol)
+
+
+class TestAutomation(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = automation()
+
+    def test_fade(self):
+        chan = fakeChannel(1.0)
+        start = time.monotonic()
+        future = self.engine.fade(chan, 0.2, length=100)
+        assert time.monotonic() - start < 0.05  # does not block
+        assert future.result(timeout=2) is True
+        assert chan.vol == 0.2
+        assert all(a >= b for a, b in zip(chan.history, chan.history[1:]))
+
+    def test_parallel(self):
+        chans = [fakeChannel(0.0) for _ in range(10)]
+        start = time.monotonic()
+        futures = [self.engine.fade(c, 1.0, length=200) for c in chans]
+        assert all(f.result(timeout=2) for f in futures)
+        assert time.monotonic() - start < 1
+        assert all(c.vol == 1.0 for c in chans)
+
+    def test_retarget(self):
+        chan = fakeChannel(1.0)
+        first = self.engine.fade(chan, 0.0, length=1000)
+        time.sleep(0.1)
+        second = self.engine.fade(chan, 1.0, length=100)
+        assert first.result(timeout=2) is False
+        assert second.result(timeout=2) is True
+        assert chan.vol == 1.0
+
+    def test_cancel(self):
+        chan = fakeChannel(1.0)
+        future = self.engine.fade(chan, 0.0, length=1000)
+        time.sleep(0.1)
+        self.engine.cancel(chan)
+        assert future.result(timeout=2) is False
+        assert 0 < chan.vol < 1
+        assert not self.engine.busy(chan)
+
+    def test_equal_power(self):
+        chan = fakeChannel(0.0)
+        self.engine.fade(chan, 1.0, length=200, curve='equal_power').result(timeout=2)
+        mid = chan.history[len(chan.history) // 2]
+        assert mid > 0.6  # sin curve rises faster than linear
@@ -0,0 +1,202 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.audio import sound, streamChannel
+from modules.play import control
+from modules.util import configManager
+
+import concurrent.futures
+import threading
+import time
+import unittest
+from unittest import mock
+from pygame import mixer
+
+
+class mixerStub:
+    """The parts of virtualMixerWrapper the play control uses
+    """
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.mixer = mixer
+        self.channelMap = {'show': streamChannel(mixer.Channel(0))}
+        self.channelLastPlayed = {'show': None}
+        self.paused = False
+        self.listeners = []
+
+    def fadeout(self, ms):
+        for chan in self.channelMap.values():
+            chan.fadeout(ms)
+
+
+def done(result=None, exception=None):
+    future = concurrent.futures.Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+class TestControl(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.quit()
+        mixer.init(frequency=44100, size=-16, channels=2)
+        mixer.set_num_channels(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+
+    def setUp(self):
+        self.sounds = {}
+        self.futures = {}
+        self.ctrl = control(mixerStub())
+        self.addCleanup(self.ctrl.stopPlayout)
+        self.addCleanup(self.ctrl.channelMap['show'].stop)
+        prefetch = mock.patch('modules.play.decodedPrefetch')
+        self.prefetch = prefetch.start()
+        self.addCleanup(prefetch.stop)
+        self.prefetch.request.side_effect = self.request
+        cache = mock.patch('modules.play.decodedCache')
+        self.cache = cache.start()
+        self.addCleanup(cache.stop)
+        self.cache.lookahead.side_effect = lambda paths, limit: paths[:limit]
+        fade = mock.patch.object(configManager.cfg.audio, 'transition_length', 0)
+        fade.start()
+        self.addCleanup(fade.stop)
+
+    def request(self, path):
+        if path in self.futures:
+            return self.futures[path]
+        return done(self.sounds[path])
+
+    def library(self, *durations):
+        # sounds of given seconds, discovered by pullPlayList
+        found = []
+        for i, seconds in enumerate(durations):
+            path = 'lib/show/{}.wav'.format(i)
+            self.sounds[path] = mixer.Sound(buffer=b'\0' * 4 * int(44100 * seconds))
+            found.append(sound(path, seconds))
+        discover = mock.patch.object(self.ctrl, '_discoverSound', return_value=found)
+        discover.start()
+        self.addCleanup(discover.stop)
+        return found
+
+    def waitIdle(self, timeout=5):
+        deadline = time.time() + timeout
+        while self.ctrl.channelMap['show'].get_busy():
+            assert time.time() < deadline
+            time.sleep(0.005)
+
+    def test_timeout(self):
+        self.library(5)
+        assert self.ctrl.play('show') == 0  # playlist pulled
+        timeout = self.ctrl.play('show')
+        assert 5 - control.END_MARGIN - 0.1 < timeout <= 5 - control.END_MARGIN
+        assert self.ctrl.channelLastPlayed['show'].path == 'lib/show/0.wav'
+        # still playing, sleep until just before the end
+        assert self.ctrl.play('show') <= timeout
+        self.ctrl.expectedEnd = time.time() + control.END_MARGIN / 2
+        assert self.ctrl.play('show') == control.END_POLL_INTERVAL
+
+    def test_empty(self):
+        self.library()
+        assert self.ctrl.play('show') == control.IDLE_INTERVAL
+
+    def test_wait_decoding(self):
+        self.library(0.5)
+        future = concurrent.futures.Future()
+        self.futures['lib/show/0.wav'] = future
+        self.ctrl.play('show')
+        assert self.ctrl.play('show') is None
+        assert not self.ctrl.channelMap['show'].get_busy()
+        future.set_result(self.sounds['lib/show/0.wav'])
+        assert self.ctrl.wakeup.is_set()
+        assert self.ctrl.play('show') > 0
+        assert self.ctrl.channelMap['show'].get_busy()
+
+    def test_paused(self):
+        self.library(5)
+        self.ctrl.play('show')
+        self.ctrl.play('show')
+        end = self.ctrl.expectedEnd
+        self.ctrl.virtualMixer.paused = True
+        assert self.ctrl.play('show') is None
+        time.sleep(0.05)
+        self.ctrl.virtualMixer.paused = False
+        self.ctrl.play('show')
+        assert self.ctrl.expectedEnd - end >= 0.05
+
+    def test_backoff(self):
+        self.library(0.1)
+        self.futures['lib/show/0.wav'] = done(exception=RuntimeError('broken'))
+        self.ctrl.play('show')
+        timeouts = [self.ctrl.play('show') for _ in range(6)]
+        assert timeouts == [0.1, 0.2, 0.4, 0.8, 1, 1]
+        assert self.ctrl.failures == 6
+        del self.futures['lib/show/0.wav']
+        assert self.ctrl.play('show') > 0
+        assert self.ctrl.failures == 0
+        assert len(self.ctrl.gaps) == 0
+
+    def test_backoff_play_error(self):
+        self.library(0.1)
+        self.ctrl.play('show')
+        with mock.patch.object(self.ctrl, 'play_file', return_value=None):
+            assert self.ctrl.play('show') == control.FAIL_BACKOFF
+            assert self.ctrl.play('show') == control.FAIL_BACKOFF * 2
+        assert self.ctrl.play('show') > 0
+        assert self.ctrl.failures == 0
+
+    def test_gap(self):
+        self.library(0.1, 0.1)
+        count = (control.gapSeconds.summary() or {'count': 0})['count']
+        self.ctrl.play('show')
+        self.ctrl.play('show')
+        assert len(self.ctrl.gaps) == 0  # nothing played before
+        self.waitIdle()
+        self.ctrl.play('show')
+        assert len(self.ctrl.gaps) == 1
+        assert 0 <= self.ctrl.gaps[0] < 1
+        assert control.gapSeconds.summary()['count'] == count + 1
+        assert self.ctrl.channelLastPlayed['show'].path == 'lib/show/1.wav'
+
+    def test_playout(self):
+        self.library(0.1, 0.1)
+        with mock.patch.object(configManager.cfg.audio.crossfade, 'enable', False):
+            self.ctrl.startPlayout('show')
+        thread = self.ctrl.playout
+        assert thread.name == 'Playout'
+        deadline = time.time() + 5
+        while len(self.ctrl.gaps) < 2:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        self.ctrl.stopPlayout()
+        assert not thread.is_alive()
+        assert self.ctrl.playout is None
+        # can start again after a stop
+        with mock.patch.object(configManager.cfg.audio.crossfade, 'enable', False):
+            self.ctrl.startPlayout('show')
+        assert self.ctrl.playout.is_alive()
+
+    def test_playout_error(self):
+        self.library(0.1)
+        calls = []
+        def play(t):
+            calls.append(t)
+            raise RuntimeError('broken')
+        with mock.patch.object(control, 'IDLE_INTERVAL', 0.01), \
+                mock.patch.object(self.ctrl, 'play', side_effect=play):
+            thread = threading.Thread(target=self.ctrl._playoutLoop, args=('show',), daemon=True)
+            thread.start()
+            deadline = time.time() + 5
+            while len(calls) < 3:
+                assert time.time() < deadline
+                time.sleep(0.01)
+            self.ctrl.playoutStopped.set()
+            self.ctrl.wake()
+            thread.join(timeout=5)
+        assert not thread.is_alive()
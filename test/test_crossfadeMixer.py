@@ -0,0 +1,126 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.audio import sound
+from modules.mixing import crossfadeMixer
+
+try:
+    import numpy
+    import pygame.sndarray  # needs numpy
+except ImportError:
+    numpy = None
+import threading
+import unittest
+from pygame import mixer
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestCrossfadeMixer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.quit()
+        mixer.init(frequency=1000, size=-16, channels=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+
+    def setUp(self):
+        self.engine = crossfadeMixer(None, lambda: None, None, overlap=100, block=50)
+
+    def test_length(self):
+        a = numpy.full((1000, 2), 1000, dtype=numpy.int16)
+        b = numpy.full((500, 2), 1000, dtype=numpy.int16)
+        self.engine.append('a', a)
+        self.engine.append('b', b)
+        out = []
+        while True:
+            block = self.engine.render(self.engine.block)
+            if block is None:
+                break
+            out.append(block)
+        out = numpy.concatenate(out)
+        assert len(out) == 1000 + 500 - 100
+        # equal-power fade keeps a constant signal above both inputs' halves
+        assert out.min() >= 1000 * 0.7
+        assert [m[0] for m in self.engine.marks] == [0, 900]
+
+    def test_now_playing(self):
+        a, b = sound('a.wav'), sound('b.wav')
+        a.duration = b.duration = 0.3
+        self.engine.append(a, numpy.zeros((300, 2), dtype=numpy.int16))
+        self.engine.append(b, numpy.zeros((300, 2), dtype=numpy.int16))
+        self.engine.render(150)
+        self.engine._updateNowPlaying()
+        assert self.engine.nowPlaying is a
+        self.engine.render(100)
+        self.engine._updateNowPlaying()
+        assert self.engine.nowPlaying is b
+
+    def test_samples(self):
+        a = sound('a.wav')
+        a.duration = 0.3
+        stored = numpy.full((300, 2), 1000, dtype=numpy.int16)
+        stored.flags.writeable = False  # as read from a memory map
+        queue = [a]
+        fetched = []
+        engine = crossfadeMixer(None, lambda: queue.pop() if queue else None, fetched.append,
+                                overlap=100, block=50, samples=lambda path: stored)
+        out = engine.render(300)
+        assert fetched == []
+        assert len(out) == 300 and (out == 1000).all()
+
+    def test_skip(self):
+        a, b = sound('a.wav'), sound('b.wav')
+        a.duration = b.duration = 1
+        queue = [b]
+        engine = crossfadeMixer(None, lambda: queue.pop() if queue else None, None, overlap=100, block=50,
+                                samples=lambda path: numpy.full((1000, 2), -1000, dtype=numpy.int16))
+        engine.append(a, numpy.full((1000, 2), 1000, dtype=numpy.int16))
+        engine.render(200)
+        engine.skip(50)
+        assert len(engine.marks) == 0
+        out = engine.render(2000)
+        assert len(out) == 50 + 1000
+        assert out[0, 0] == 1000 and out[49, 0] < 100  # faded out
+        assert (out[50:] == -1000).all()  # next sound from its start
+        assert [m[0] for m in engine.marks] == [250]
+
+    def test_view(self):
+        data = mixer.Sound(buffer=bytes(400))
+        a = self.engine._toArray(data)
+        assert a.shape == (100, 2)
+        assert numpy.shares_memory(a, pygame.sndarray.samples(data))  # not a copy
+
+    def test_skip_while_fetching(self):
+        class stubChannel:
+            def get_busy(self):
+                return False
+
+            def play(self, data):
+                pass
+
+        a, b = sound('a.wav'), sound('b.wav')
+        a.duration = b.duration = 1
+        fetching, release = threading.Event(), threading.Event()
+
+        def fetch(s):
+            fetching.set()
+            release.wait(5)
+            return mixer.Sound(buffer=bytes(4000))
+
+        queue = [b]
+        engine = crossfadeMixer(stubChannel(), lambda: queue.pop() if queue else None, fetch,
+                                overlap=100, block=50)
+        engine.append(a, numpy.zeros((60, 2), dtype=numpy.int16))
+        feeder = threading.Thread(target=engine._feed)
+        feeder.start()
+        assert fetching.wait(5)
+        skipper = threading.Thread(target=engine.skip)
+        skipper.start()
+        skipper.join(1)
+        done = not skipper.is_alive()
+        release.set()
+        feeder.join(5)
+        assert done  # did not wait for the decode
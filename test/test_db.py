@@ -0,0 +1,74 @@
+from modules.util import db
+
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+
+class TestDb(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'db.sqlite3')
+        self.db = db(self.filename)
+
+    def tearDown(self):
+        self.db.disconnect()
+        self.dir.cleanup()
+
+    def test_record(self):
+        assert not self.db.isNormalized('abc')
+        self.db.setRecord('a.mp3', 'abc', -23, '192k')
+        assert self.db.isNormalized('abc')
+        self.db.setRecord('a.mp3', 'abc', -16, '192k')
+        assert not self.db.isNormalized('abc')
+
+    def test_persist(self):
+        self.db.setIndex('a.mp3', (1, 2.0, 3), 'abc', -23)
+        self.db.setMeta({'path': 'a.mp3', 'hash': 'abc', 'duration': 1.5})
+        self.db.disconnect()
+        self.db.connect(self.filename)
+        assert self.db.getIndex('a.mp3')['inode'] == 3
+        assert self.db.findMeta('abc')['duration'] == 1.5
+        assert self.db.getMeta('b.mp3') is None
+
+    def test_singleton(self):
+        self.db.setMeta({'path': 'a.mp3', 'hash': 'abc', 'duration': 1.5})
+        again = db()
+        assert again is self.db
+        assert again.conn is not None and again.pendingCount == 1
+        again.disconnect()
+        again.connect(self.filename)
+        assert again.getMeta('a.mp3')['duration'] == 1.5
+
+    def test_batch(self):
+        for i in range(db.BATCH_SIZE + 1):
+            self.db.setMeta({'path': str(i), 'hash': str(i)})
+        assert self.db.pendingCount == 1
+        assert self.db.getMeta(str(db.BATCH_SIZE))['hash'] == str(db.BATCH_SIZE)
+        assert self.db.findMeta('0')['path'] == '0'
+
+    def test_migrate(self):
+        self.db.disconnect()
+        legacy = os.path.join(self.dir.name, 'db.json')
+        with open(legacy, 'w') as f:
+            json.dump({'_default': {}, 'sound': {'1': {'name': 'a.mp3', 'hash': 'abc',
+                                                       'loudness': -23, 'bitrate': '192k'}}}, f)
+        self.db.connect(legacy)
+        assert self.db.isNormalized('abc')
+        assert not os.path.exists(legacy)
+        assert os.path.exists(legacy + '.migrated')
+
+    def test_new_column(self):
+        self.db.disconnect()
+        legacy = os.path.join(self.dir.name, 'old.sqlite3')
+        conn = sqlite3.connect(legacy)
+        conn.execute('CREATE TABLE file (path PRIMARY KEY, size, mtime, inode, hash, loudness)')
+        conn.commit()
+        conn.close()
+        self.db.connect(legacy)
+        self.db.setIndex('a.mp3', (1, 2.0, 3), 'abc', -23, 'fp')
+        self.db.flush()
+        assert self.db.getIndex('a.mp3')['fingerprint'] == 'fp'
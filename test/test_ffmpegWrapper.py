@@ -0,0 +1,47 @@
+from modules.util import ffmpegWrapper
+
+import subprocess
+import unittest
+from unittest import mock
+
+LOUDNORM_OUTPUT = b"""[Parsed_loudnorm_0 @ 0x55d5c4a3c0c0]
+{
+	"input_i" : "-16.53",
+	"input_tp" : "-1.02",
+	"input_lra" : "5.40",
+	"input_thresh" : "-26.86",
+	"output_i" : "-23.15",
+	"output_tp" : "-7.44",
+	"output_lra" : "4.90",
+	"output_thresh" : "-33.41",
+	"normalization_type" : "dynamic",
+	"target_offset" : "0.15"
+}
+"""
+
+
+class TestFfmpegWrapper(unittest.TestCase):
+
+    def test_measure(self):
+        result = subprocess.CompletedProcess([], 0, LOUDNORM_OUTPUT)
+        with mock.patch.object(ffmpegWrapper, 'run', return_value=result):
+            measured = ffmpegWrapper.measureLoudness('a.mp3')
+        assert measured == {'loudness': -16.53, 'lra': 5.4, 'true_peak': -1.02,
+                            'threshold': -26.86, 'offset': 0.15}
+
+    def test_measure_fail(self):
+        result = subprocess.CompletedProcess([], 1, b'a.mp3: No such file')
+        with mock.patch.object(ffmpegWrapper, 'run', return_value=result):
+            assert ffmpegWrapper.measureLoudness('a.mp3') == {}
+
+    def test_filter_linear(self):
+        measured = {'loudness': -16.53, 'lra': 5.4, 'true_peak': -1.02,
+                    'threshold': -26.86, 'offset': 0.15}
+        f = ffmpegWrapper.loudnormFilter(-23, measured)
+        assert f == 'loudnorm=I=-23:LRA=7:tp=-2:measured_I=-16.53:measured_LRA=5.4:measured_TP=-1.02' \
+                    ':measured_thresh=-26.86:offset=0.15:linear=true'
+
+    def test_filter_silence(self):
+        measured = {'loudness': float('-inf'), 'lra': 0.0, 'true_peak': float('-inf'),
+                    'threshold': -70.0, 'offset': 0.0}
+        assert ffmpegWrapper.loudnormFilter(-23, measured) == 'loudnorm=I=-23:LRA=7:tp=-2'
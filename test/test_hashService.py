@@ -0,0 +1,41 @@
+from modules.hashing import hashService
+from modules.util import fsUtil
+
+import os
+import tempfile
+import unittest
+
+
+class TestHashService(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(8):
+            path = os.path.join(self.dir.name, "{}.wav".format(i))
+            with open(path, 'wb') as f:
+                f.write(os.urandom(300 * 1024 + i))
+            self.files.append(path)
+        self.hasher = hashService(4)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+        self.dir.cleanup()
+
+    def test_hash_all(self):
+        hashes = self.hasher.hashAll(self.files + [os.path.join(self.dir.name, 'missing.wav')])
+        assert hashes == {f: fsUtil.sha256sum(f) for f in self.files}
+        assert self.hasher.throughput() > 0
+
+    def test_single(self):
+        assert self.hasher.sha256(self.files[0]).result(timeout=5) == fsUtil.sha256sum(self.files[0])
+
+    def test_fingerprint(self):
+        path = self.files[0]
+        fp = fsUtil.fingerprint(path)
+        assert fsUtil.fingerprint(path) == fp
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            f.seek((size - 64 * 1024) // 2)  # sampled middle block
+            f.write(b'\0' * 16)
+        assert fsUtil.fingerprint(path) != fp
@@ -0,0 +1,67 @@
+from modules.ingest import ingestQueue
+from modules.worker import workerPool
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+
+class TestIngestQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.pool = workerPool(1, 'Test')
+        self.done = []
+        self.ready = threading.Semaphore(0)
+        self.ingest = ingestQueue(self.pool, os.path.getsize, self.onReady, debounce=0.1)
+
+    def tearDown(self):
+        self.ingest.stop()
+        self.pool.shutdown()
+        self.dir.cleanup()
+
+    def onReady(self, path, future):
+        self.done.append((path, future.result()))
+        self.ready.release()
+
+    def write(self, name, size):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'ab') as f:
+            f.write(b'\0' * size)
+        return path
+
+    def test_coalesce(self):
+        self.ingest.start()
+        path = self.write('a.wav', 10)
+        for _ in range(5):
+            self.ingest.notify(path)
+        assert self.ready.acquire(timeout=5)
+        assert not self.ready.acquire(timeout=0.3)
+        assert self.done == [(path, 10)]
+
+    def test_partial_write(self):
+        self.ingest.start()
+        path = self.write('a.wav', 10)
+        self.ingest.notify(path)
+        time.sleep(0.05)
+        self.write('a.wav', 10)  # still being copied, no event yet
+        assert self.ready.acquire(timeout=5)
+        assert self.done == [(path, 20)]
+
+    def test_ignored(self):
+        assert ingestQueue.ignored('lib/show/.a.wav.swp')
+        assert ingestQueue.ignored('lib/show/a.wav.part')
+        assert ingestQueue.ignored('lib/show/a.txt')
+        assert not ingestQueue.ignored('lib/show/a.wav')
+
+    def test_priority(self):
+        paths = [self.write('a.wav', 300), self.write('b.wav', 100), self.write('c.wav', 200)]
+        for p in paths:
+            self.ingest.notify(p)
+        time.sleep(0.15)  # settled before start
+        self.ingest.start()
+        for _ in paths:
+            assert self.ready.acquire(timeout=5)
+        assert [size for _, size in self.done] == [100, 200, 300]
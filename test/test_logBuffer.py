@@ -0,0 +1,52 @@
+from modules.console import logBuffer, reverseLines
+
+import os
+import tempfile
+import unittest
+
+
+class TestLogBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.files = []
+        n = 0
+        for day in range(3):
+            path = os.path.join(self.dir.name, 'WRPI.2021-06-0{}.log'.format(day+1))
+            with open(path, 'w') as f:
+                for _ in range(100):
+                    f.write('line {}\n'.format(n))
+                    n += 1
+            self.files.append(path)
+        self.lines = ['line {}'.format(i) for i in range(n)]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_reverse(self):
+        assert list(reverseLines(self.files, blockSize=7)) == self.lines[::-1]
+
+    def test_ring(self):
+        buf = logBuffer(capacity=10, files=lambda: self.files)
+        buf.extend(self.lines)
+        assert len(buf) == 10
+        assert buf[0] == 'line 290'
+        assert buf[-1] == 'line 299'
+
+    def test_page(self):
+        buf = logBuffer(capacity=10, historyLimit=250, files=lambda: self.files)
+        buf.extend(self.lines)
+        assert buf.pageUp(150) == 150
+        assert buf[0] == 'line 140'
+        assert buf.pageUp(150) == 100  # history limit
+        assert [buf[i] for i in range(len(buf))] == self.lines[40:]
+        buf.reset()
+        assert len(buf) == 10
+
+    def test_live_while_paged(self):
+        buf = logBuffer(capacity=10, historyLimit=100, files=lambda: self.files)
+        buf.extend(self.lines)
+        buf.pageUp(20)
+        buf.extend(['new {}'.format(i) for i in range(5)])
+        assert [buf[i] for i in range(len(buf))] == \
+            self.lines[270:] + ['new {}'.format(i) for i in range(5)]
@@ -0,0 +1,81 @@
+from modules.logger import logDispatcher
+
+import logging
+import queue
+import threading
+import time
+import unittest
+
+
+class drainedQueue(queue.Queue):
+    # full on the first put, then emptied by another thread before the get
+    def __init__(self):
+        super().__init__(maxsize=1)
+        self.full = True
+
+    def put_nowait(self, item):
+        if self.full:
+            self.full = False
+            raise queue.Full
+        super().put_nowait(item)
+
+
+class TestLogDispatcher(unittest.TestCase):
+
+    def record(self, msg):
+        return logging.makeLogRecord({'msg': msg})
+
+    def messages(self, handler):
+        out = []
+        while not handler.queue.empty():
+            out.append(handler.queue.get_nowait().msg)
+        return out
+
+    def test_drop_oldest(self):
+        handler = logDispatcher(size=2)
+        for i in range(5):
+            handler.enqueue(self.record(str(i)))
+        assert handler.dropped == 3
+        assert self.messages(handler) == ['3', '4']
+        handler.enqueue(self.record('5'))
+        assert self.messages(handler) == ['5', 'Log queue overflow: 3 records dropped.']
+        assert handler.reported == 3
+
+    def test_drop_new(self):
+        handler = logDispatcher(size=2, overflow='drop_new')
+        for i in range(5):
+            handler.enqueue(self.record(str(i)))
+        assert handler.dropped == 3
+        assert self.messages(handler) == ['0', '1']
+
+    def test_block(self):
+        handler = logDispatcher(size=1, overflow='block', timeout=0.1)
+        handler.enqueue(self.record('0'))
+        start = time.time()
+        handler.enqueue(self.record('1'))
+        assert time.time() - start >= 0.1
+        assert handler.dropped == 1
+        consumer = threading.Timer(0.1, handler.queue.get)
+        consumer.start()
+        handler.timeout = 5
+        handler.enqueue(self.record('2'))  # waits for the consumer
+        consumer.join()
+        assert handler.dropped == 1
+        assert self.messages(handler) == ['2']
+
+    def test_drained_meanwhile(self):
+        handler = logDispatcher(size=1)
+        handler.queue = drainedQueue()
+        handler.enqueue(self.record('0'))  # must not spin on an empty queue
+        assert handler.dropped == 0
+        assert self.messages(handler) == ['0']
+
+    def test_concurrent_counts(self):
+        handler = logDispatcher(size=10, overflow='drop_new')
+        threads = [threading.Thread(target=lambda: [handler.enqueue(self.record('x')) for _ in range(1000)])
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert handler.dropped == 4000 - 10
@@ -0,0 +1,141 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.meter import loudnessMeter, measureSound, measureFile
+from modules.util import ffmpegWrapper, metaCache
+
+import math
+try:
+    import numpy
+except ImportError:
+    numpy = None
+import unittest
+from unittest import mock
+from pygame import mixer
+
+RATE = 48000
+
+
+def tone(dbfs, seconds, rate=RATE):
+    """1 kHz sine at the given peak level, stereo"""
+    t = numpy.arange(int(seconds * rate)) / rate
+    x = 10 ** (dbfs / 20) * numpy.sin(2 * numpy.pi * 997 * t)
+    return numpy.stack([x, x], axis=1)
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestLoudnessMeter(unittest.TestCase):
+    # reference signals from EBU Tech 3341 and 3342
+
+    def measure(self, *parts, rate=RATE):
+        meter = loudnessMeter(rate, 2)
+        meter.feed(numpy.concatenate([tone(db, sec, rate) for db, sec in parts]))
+        return meter
+
+    def test_integrated(self):
+        meter = self.measure((-23, 20))
+        assert abs(meter.integrated()[0] + 23) < 0.1
+        meter = self.measure((-33, 20))
+        assert abs(meter.integrated()[0] + 33) < 0.1
+
+    def test_relative_gate(self):
+        meter = self.measure((-36, 10), (-23, 60), (-36, 10))
+        assert abs(meter.integrated()[0] + 23) < 0.1
+        meter = self.measure((-26, 20), (-20, 20.1), (-26, 20))
+        assert abs(meter.integrated()[0] + 23) < 0.1
+
+    def test_absolute_gate(self):
+        meter = self.measure((-72, 10), (-26, 20), (-72, 10))
+        assert abs(meter.integrated()[0] + 26) < 0.1
+
+    def test_sample_rate(self):
+        meter = self.measure((-23, 20), rate=44100)
+        assert abs(meter.integrated()[0] + 23) < 0.1
+
+    def test_lra(self):
+        assert abs(self.measure((-20, 20), (-30, 20)).lra() - 10) < 1
+        assert abs(self.measure((-20, 20), (-15, 20)).lra() - 5) < 1
+
+    def test_momentary(self):
+        meter = self.measure((-23, 2))
+        m = meter.momentary()
+        assert len(m) == 17  # one per 100 ms from 400 ms on
+        assert numpy.all(numpy.abs(m + 23) < 0.1)
+        assert len(meter.shortTerm()) == 0
+
+    def test_blocks(self):
+        x = numpy.random.default_rng(0).standard_normal((RATE * 10, 2)) * 0.1
+        whole = loudnessMeter(RATE, 2)
+        whole.feed(x)
+        blocks = loudnessMeter(RATE, 2)
+        for i in range(0, len(x), 12345):
+            blocks.feed(x[i:i + 12345])
+        for a, b in zip(whole.stats().values(), blocks.stats().values()):
+            assert abs(a - b) < 1e-6
+
+    def test_int16(self):
+        meter = loudnessMeter(RATE, 2)
+        meter.feed((tone(-23, 20) * 32768).astype(numpy.int16))
+        assert abs(meter.integrated()[0] + 23) < 0.1
+
+    def test_true_peak(self):
+        meter = self.measure((-6, 5))
+        assert abs(meter.truePeak() + 6) < 0.1
+        # a sine at a quarter of the sample rate, sampled between its peaks
+        t = numpy.arange(RATE)
+        x = numpy.sin(numpy.pi / 2 * t + numpy.pi / 4) * 0.5
+        meter = loudnessMeter(RATE, 1)
+        meter.feed(x[:, None])
+        assert 20 * math.log10(numpy.abs(x).max()) < -8.9  # sample peak
+        assert abs(meter.truePeak() + 6) < 0.5
+
+    def test_silence(self):
+        meter = loudnessMeter(RATE, 2)
+        meter.feed(numpy.zeros((RATE * 5, 2)))
+        assert meter.stats() == {'loudness': -math.inf, 'lra': 0.0, 'true_peak': -math.inf,
+                                 'threshold': -70.0, 'offset': 0.0}
+
+    def test_lfe(self):
+        x = tone(-23, 10)
+        silent = numpy.zeros((len(x), 1))
+        meter = loudnessMeter(RATE, 6)
+        # L R C LFE Ls Rs, only the LFE is loud
+        meter.feed(numpy.concatenate([x, silent, x[:, :1] * 10, silent, silent], axis=1))
+        assert abs(meter.integrated()[0] + 23) < 0.1
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestMeasureSound(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.quit()
+        mixer.init(frequency=RATE, size=-16, channels=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+
+    def test_measure(self):
+        data = mixer.Sound(buffer=(tone(-23, 10) * 32767).astype(numpy.int16).tobytes())
+        assert abs(measureSound(data)['loudness'] + 23) < 0.1
+        # a mono source duplicated by the mixer
+        assert abs(measureSound(data, channels=1)['loudness'] + 26) < 0.1
+
+    def test_measure_file(self):
+        pcm = tone(-23, 10).astype(numpy.float32).tobytes()
+        blocks = [pcm[i:i + 4800 * 8] for i in range(0, len(pcm), 4800 * 8)]
+        record = {'sample_rate': RATE, 'channels': 2}
+        with mock.patch.object(metaCache, 'get', return_value=record), \
+                mock.patch.object(ffmpegWrapper, 'decode', return_value=iter(blocks)) as decode:
+            measured = measureFile('a.mp3')
+        assert decode.call_args[0][:3] == ('a.mp3', RATE, 2)
+        assert abs(measured['loudness'] + 23) < 0.1
+
+    def test_measure_file_fail(self):
+        def fail(*args):
+            raise RuntimeError("ffmpeg returned 1")
+            yield
+        with mock.patch.object(metaCache, 'get', return_value={}), \
+                mock.patch.object(ffmpegWrapper, 'decode', side_effect=fail):
+            assert measureFile('a.mp3') == {}
@@ -0,0 +1,77 @@
+from modules.util import metadataCache, ffmpegWrapper, fsUtil
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.dir.name, "{}.wav".format(i))
+            with open(path, 'wb') as f:
+                f.write(bytes([i]) * 64)
+            self.files.append(path)
+        self.cache = metadataCache(capacity=2)
+        patcher = mock.patch.object(
+            ffmpegWrapper, 'probe', return_value={'duration': 1.5, 'sample_rate': 44100, 'channels': 2})
+        self.probe = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_probe_once(self):
+        self.cache.get(self.files[0])
+        self.cache.get(self.files[0])
+        assert self.probe.call_count == 1
+        assert self.cache.get(self.files[0])['duration'] == 1.5
+
+    def test_bounded(self):
+        for f in self.files:
+            self.cache.get(f)
+        assert len(self.cache.entries) == 2
+        assert self.files[0] not in self.cache.entries
+
+    def test_changed_file(self):
+        self.cache.get(self.files[0])
+        with open(self.files[0], 'ab') as f:
+            f.write(b'\0')
+        assert self.cache.lookup(self.files[0]) is None
+        self.cache.get(self.files[0])
+        assert self.probe.call_count == 2
+
+    def test_update(self):
+        self.cache.update(self.files[1], loudness=-23)
+        assert self.cache.get(self.files[1])['loudness'] == -23
+        assert self.probe.call_count == 1
+
+    def test_hash(self):
+        class indexDb:
+            conn = True
+
+            def getIndex(self, path):
+                return {'hash': 'abc', 'fingerprint': fsUtil.fingerprint(path)}
+
+            def getMeta(self, path):
+                return None
+
+            def findMeta(self, h):
+                return None
+
+            def setMeta(self, record):
+                pass
+
+        with mock.patch.object(fsUtil, 'sha256sum') as sha256sum:
+            record = self.cache.get(self.files[0])
+            assert record['hash'] is None  # unknown, not the fingerprint
+            assert record['fingerprint'] == fsUtil.fingerprint(self.files[0])
+            self.cache.update(self.files[0], 'def', loudness=-23)
+            assert self.cache.get(self.files[0])['hash'] == 'def'
+            self.cache.attach(indexDb())
+            assert self.cache.get(self.files[1])['hash'] == 'abc'  # from the library index
+        sha256sum.assert_not_called()  # no full read on the caller's thread
@@ -0,0 +1,36 @@
+from modules.metrics import registry, metricsServer
+
+import unittest
+import urllib.error
+import urllib.request
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = registry('test')
+        self.server = metricsServer(self.registry, port=0)  # any free port
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server.port, path)
+
+    def test_metrics(self):
+        self.registry.counter('hits_total', 'Hits').inc()
+        with urllib.request.urlopen(self.url('/metrics'), timeout=5) as r:
+            assert r.status == 200
+            assert r.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            body = r.read().decode()
+        assert 'test_hits_total 1\n' in body
+
+    def test_not_found(self):
+        with self.assertRaises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(self.url('/'), timeout=5)
+        assert e.exception.code == 404
+
+    def test_stop(self):
+        self.server.stop()
+        self.server.stop()  # idempotent
+        with self.assertRaises(urllib.error.URLError):
+            urllib.request.urlopen(self.url('/metrics'), timeout=5)
@@ -0,0 +1,52 @@
+from modules.audio import sound
+from modules.playlist import playlist
+
+import random
+import unittest
+
+
+class TestPlaylist(unittest.TestCase):
+
+    def setUp(self):
+        self.sounds = []
+        for i in range(50):
+            s = sound('lib/show/{}.wav'.format(i))
+            s.duration = i + 1
+            self.sounds.append(s)
+
+    def test_list(self):
+        rng = random.Random(7)
+        q, ref = playlist(), []
+        for s in self.sounds:
+            i = rng.randint(0, len(ref))
+            assert q.insert(i, s)
+            ref.insert(i, s)
+        for _ in range(200):
+            i, j = rng.randrange(len(ref)), rng.randrange(len(ref))
+            q.move(i, j)
+            ref.insert(j, ref.pop(i))
+        for _ in range(10):
+            i = rng.randrange(len(ref))
+            assert q.pop(i) is ref.pop(i)
+        assert list(q) == ref
+        assert [q[i] for i in range(len(ref))] == ref
+        assert all(q.index(s) == i for i, s in enumerate(ref))
+
+    def test_membership(self):
+        q = playlist(self.sounds[:3])
+        assert 'lib/show/1.wav' in q
+        assert self.sounds[2] in q
+        assert not q.append(sound('lib/show/1.wav'))
+        del q[1]
+        assert 'lib/show/1.wav' not in q
+        assert len(q) == 2
+
+    def test_durations(self):
+        q = playlist(self.sounds[:4])  # 1, 2, 3, 4 seconds
+        assert q.total() == 10
+        assert q.elapsed(2) == 3
+        assert q.remaining(1) == 7
+        assert q.eta(1, 3) == 5
+        assert q.eta(2, 0) == 7  # wraps around: 3 + 4
+        q.move(3, 0)
+        assert q.elapsed(1) == 4
@@ -0,0 +1,61 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.audio import soundCache, prefetcher
+
+import tempfile
+import threading
+import time
+import unittest
+import wave
+from unittest import mock
+from pygame import mixer
+
+
+class TestPrefetcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.init(frequency=44100, size=-16, channels=2)
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.file = os.path.join(cls.dir.name, "a.wav")
+        with wave.open(cls.file, 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(b'\0' * 4 * 44100)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+        cls.dir.cleanup()
+
+    def setUp(self):
+        patcher = mock.patch.object(soundCache, 'budget', return_value=2**24)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = soundCache()
+        self.prefetch = prefetcher(self.cache)
+
+    def test_request(self):
+        future = self.prefetch.request(self.file)
+        data = future.result(timeout=5)
+        assert isinstance(data, mixer.Sound)
+        assert self.prefetch.ready(self.file)
+        assert self.prefetch.request(self.file).result() is data
+
+    def test_missing(self):
+        future = self.prefetch.request(os.path.join(self.dir.name, "missing.wav"))
+        assert future.exception(timeout=5) is not None
+        assert not self.prefetch.inflight
+
+    def test_measure_off_thread(self):
+        measured = []
+        with mock.patch.object(prefetcher, '_measure',
+                               lambda self, path, data: measured.append(threading.current_thread().name)), \
+                mock.patch('modules.meter.available', return_value=True):
+            self.prefetch.request(self.file).result(timeout=5)
+            deadline = time.time() + 5
+            while not measured and time.time() < deadline:
+                time.sleep(0.01)
+        assert measured == ['Meter']
@@ -0,0 +1,69 @@
+from modules.metrics import registry, histogram
+
+import unittest
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = registry('test')
+
+    def test_counter(self):
+        c = self.registry.counter('calls_total', 'Calls', ('status',))
+        c.inc(status='ok')
+        c.inc(2, status='ok')
+        c.inc(status='error')
+        assert self.registry.counter('calls_total', 'Calls', ('status',)) is c
+        assert c.get(status='ok') == 3 and c.get(status='other') == 0
+        text = self.registry.render()
+        assert '# HELP test_calls_total Calls\n# TYPE test_calls_total counter\n' in text
+        assert 'test_calls_total{status="ok"} 3\n' in text
+        assert 'test_calls_total{status="error"} 1\n' in text
+
+    def test_gauge(self):
+        g = self.registry.gauge('queue', 'Queue length')
+        assert '\ntest_queue ' not in self.registry.render()  # never set
+        g.set(4)
+        assert 'test_queue 4\n' in self.registry.render()
+        items = [1, 2]
+        self.registry.gauge('queue', 'Queue length', fn=lambda: len(items))
+        assert g.get() == 2
+        items.append(3)
+        assert 'test_queue 3\n' in self.registry.render()
+
+    def test_gauge_fails(self):
+        self.registry.gauge('broken', 'Broken', fn=lambda: 1 / 0)
+        assert self.registry.render() == '# HELP test_broken Broken\n# TYPE test_broken gauge\n'
+
+    def test_type_conflict(self):
+        self.registry.counter('x', 'X')
+        with self.assertRaises(AssertionError):
+            self.registry.gauge('x', 'X')
+
+    def test_histogram(self):
+        h = self.registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        for v in (0.05, 0.1, 0.5, 2):
+            h.observe(v)
+        lines = self.registry.render().splitlines()
+        assert lines[2:] == ['test_latency_seconds_bucket{le="0.1"} 2',
+                             'test_latency_seconds_bucket{le="1"} 3',
+                             'test_latency_seconds_bucket{le="+Inf"} 4',
+                             'test_latency_seconds_sum 2.65',
+                             'test_latency_seconds_count 4']
+
+    def test_summary(self):
+        h = histogram('h', 'H', ('source',), buckets=(0.01, 0.1, 1))
+        assert h.summary() is None
+        for _ in range(90):
+            h.observe(0.005, source='a')
+        for _ in range(10):
+            h.observe(0.5, source='b')
+        s = h.summary()
+        assert s['count'] == 100 and abs(s['mean'] - 0.0545) < 1e-9
+        assert 0.1 < s['p95'] < 1  # within the bucket of the slow tail
+        assert h.summary(source='a')['p95'] <= 0.01
+        assert h.labelSets() == [{'source': 'a'}, {'source': 'b'}]
+
+    def test_escape(self):
+        self.registry.counter('c', 'C', ('path',)).inc(path='a "b"\\c')
+        assert 'test_c{path="a \\"b\\"\\\\c"} 1' in self.registry.render()
@@ -0,0 +1,79 @@
+from modules.scheduler import scheduler, task
+
+import datetime
+import threading
+import time
+import unittest
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime.datetime(2021, 6, 6, 12, 34, 20, 500)
+
+    def test_minutes_at(self):
+        t = task('t', None, 3, 'minutes', ':15')
+        t.scheduleNext(self.now)
+        assert t.nextRun == datetime.datetime(2021, 6, 6, 12, 37, 15)
+
+    def test_minutes_at_later_this_minute(self):
+        # as schedule 1.1.0: the first run may fall within the current minute's interval
+        t = task('t', None, 3, 'minutes', ':45')
+        t.scheduleNext(self.now)
+        assert t.nextRun == datetime.datetime(2021, 6, 6, 12, 36, 45)
+        t.lastRun = t.nextRun
+        t.scheduleNext(t.nextRun + datetime.timedelta(seconds=0.1))
+        assert t.nextRun == datetime.datetime(2021, 6, 6, 12, 39, 45)
+
+    def test_every_minute_at(self):
+        t = task('t', None, 1, 'minutes', ':45')
+        t.scheduleNext(self.now)
+        assert t.nextRun == datetime.datetime(2021, 6, 6, 12, 34, 45)
+
+    def test_hours_at(self):
+        t = task('t', None, 1, 'hours', '00:00')
+        t.scheduleNext(self.now)
+        assert t.nextRun == datetime.datetime(2021, 6, 6, 13, 0, 0)
+
+    def test_hours_at_minute(self):
+        t = task('t', None, 2, 'hours', ':50')
+        t.scheduleNext(self.now)
+        assert t.nextRun == datetime.datetime(2021, 6, 6, 13, 50, 0)
+
+    def test_days_at(self):
+        t = task('t', None, 1, 'days', '06:00')
+        t.scheduleNext(self.now)
+        assert t.nextRun == datetime.datetime(2021, 6, 7, 6, 0, 0)
+
+    def test_run(self):
+        s = scheduler()
+        fired = threading.Event()
+        t = s.every(1, 'seconds', None, fired.set)
+        runner = threading.Thread(target=s.run)
+        runner.start()
+        assert fired.wait(timeout=3)
+        assert t.lateness is not None and t.lateness < 0.5
+        start = time.time()
+        s.stop()
+        runner.join(timeout=3)
+        assert not runner.is_alive()
+        assert time.time() - start < 1
+
+    def test_run_after_stop(self):
+        s = scheduler()
+        s.stop()
+        fired = threading.Event()
+        s.every(1, 'seconds', None, fired.set)
+        runner = threading.Thread(target=s.run)
+        runner.start()
+        assert fired.wait(timeout=3)
+        s.stop()
+        runner.join(timeout=3)
+        assert not runner.is_alive()
+
+    def test_clear(self):
+        s = scheduler()
+        s.every(1, 'minutes', None, print)
+        s.clear()
+        assert s.tasks() == []
+        assert s.idleSeconds() is None
@@ -0,0 +1,106 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.audio import soundCache, transcodedCache
+
+import mmap
+import tempfile
+import unittest
+import wave
+from unittest import mock
+from pygame import mixer
+
+
+class TestSoundCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.init(frequency=44100, size=-16, channels=2)
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.files = []
+        for i in range(3):
+            path = os.path.join(cls.dir.name, "{}.wav".format(i))
+            with wave.open(path, 'wb') as w:
+                w.setnchannels(2)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                w.writeframes(b'\0' * 4 * 44100)  # 1 second
+            cls.files.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+        cls.dir.cleanup()
+
+    def setUp(self):
+        self.cache = soundCache()
+        # room for two seconds of 16 bit stereo
+        patcher = mock.patch.object(
+            soundCache, 'budget', return_value=2 * 4 * 44100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit(self):
+        a = self.cache.get(self.files[0])
+        assert self.cache.get(self.files[0]) is a
+        assert self.cache.size == 4 * 44100
+
+    def test_lru(self):
+        for f in self.files:
+            self.cache.get(f)
+        assert not self.cache.contains(self.files[0])
+        assert self.cache.contains(self.files[2])
+
+    def test_pin(self):
+        self.cache.get(self.files[0])
+        self.cache.pin(self.files[0], 'show')
+        for f in self.files[1:]:
+            self.cache.get(f)
+        assert self.cache.contains(self.files[0])
+        assert not self.cache.contains(self.files[1])
+        self.cache.unpin('show')
+        self.cache.evict(reserve=4 * 44100)
+        assert not self.cache.contains(self.files[0])
+
+    def test_lookahead(self):
+        with mock.patch.object(soundCache, 'estimate', return_value=4 * 44100):
+            assert self.cache.lookahead(self.files, 3) == self.files[:2]
+            self.cache.get(self.files[0])
+            self.cache.pin(self.files[0], 'show')
+            assert self.cache.lookahead(self.files[1:], 3) == self.files[1:2]
+
+    def mapped(self, path):
+        # raw frames of a wav file in a memory map
+        raw = os.path.join(self.dir.name, "raw.pcm")
+        with wave.open(path) as w, open(raw, 'wb') as f:
+            f.write(w.readframes(w.getnframes()))
+        with open(raw, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def test_stored(self):
+        with mock.patch.object(transcodedCache, 'mapped', return_value=self.mapped(self.files[1])) as mapped:
+            data = self.cache.get(self.files[0])
+        mapped.assert_called_once_with(self.files[0])
+        assert data.get_length() == 1
+
+    def test_undecodable(self):
+        bad = os.path.join(self.dir.name, "bad.m4a")
+        with open(bad, 'wb') as f:
+            f.write(b'\0' * 1024)
+        with mock.patch.object(transcodedCache, 'transcode', return_value='bad.pcm') as transcode, \
+                mock.patch.object(transcodedCache, 'mapped', side_effect=[None, self.mapped(self.files[1])]):
+            data = self.cache.get(bad)
+        transcode.assert_called_once_with(bad)
+        assert data.get_length() == 1
+
+    def test_release_stored(self):
+        self.cache.get(self.files[0])
+        self.cache.get(self.files[1])
+        self.cache.pin(self.files[0], 'show')
+        with mock.patch.object(transcodedCache, 'contains', side_effect=lambda p: p == self.files[0]):
+            self.cache.pin(self.files[0], 'show')  # replayed
+            assert self.cache.contains(self.files[0])
+            self.cache.pin(self.files[1], 'show')
+            assert not self.cache.contains(self.files[0])  # stored, left to the page cache
+            self.cache.unpin('show')
+            assert self.cache.contains(self.files[1])  # not stored, kept
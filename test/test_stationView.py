@@ -0,0 +1,52 @@
+from modules.audio import sound
+from modules.playlist import playlist
+from modules.view import stationView
+
+import time
+import types
+import unittest
+
+
+class TestStationView(unittest.TestCase):
+
+    def setUp(self):
+        self.sounds = []
+        for i in range(10000):
+            s = sound('lib/show/{}.wav'.format(i))
+            s.duration = 60
+            self.sounds.append(s)
+        self.control = types.SimpleNamespace(queue=playlist(self.sounds), index=-1)
+        self.view = stationView(types.SimpleNamespace(playControl=self.control, systemStat=None))
+
+    def test_queue_unchanged(self):
+        assert len(self.view.queueItems()) == 10000
+        assert self.view.queueItems() is None
+        assert self.view.queueTitle() is not None
+        assert self.view.queueTitle() is None
+
+    def test_marks(self):
+        self.view.queueItems()
+        self.control.index = 3
+        assert self.view.queueMarks() == [(3, '  4. [0:01:00] lib/show/3.wav *')]
+        self.control.index = 4
+        marks = self.view.queueMarks()
+        assert marks[0] == (3, '  4. [0:01:00] lib/show/3.wav')
+        assert marks[1][0] == 4
+        assert self.view.queueMarks() == []
+        assert self.view.queueTitle().endswith('[166:35:00 / 166:40:00]')
+
+    def test_modified(self):
+        self.view.queueItems()
+        self.control.queue.move(0, 9999)
+        assert self.view.queueItems()[-1].endswith('lib/show/0.wav')
+
+    def test_steady_frame(self):
+        self.view.queueItems()
+        self.view.queueTitle()
+        start = time.perf_counter()
+        for _ in range(1000):
+            assert self.view.queueItems() is None
+            self.view.queueMarks()
+            self.view.queueTitle()
+        # a steady frame does not touch the 10k items
+        assert time.perf_counter() - start < 0.5
@@ -0,0 +1,60 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.audio import streamChannel
+
+import tempfile
+import unittest
+import wave
+from pygame import mixer
+
+
+class TestStreamChannel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.init(frequency=44100, size=-16, channels=2)
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.file = os.path.join(cls.dir.name, "a.wav")
+        with wave.open(cls.file, 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(b'\1\0' * 2 * 44100 * 5)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+        cls.dir.cleanup()
+
+    def setUp(self):
+        self.chan = streamChannel(mixer.Channel(0))
+
+    def tearDown(self):
+        self.chan.stop()
+
+    def test_stream(self):
+        self.chan.stream(self.file)
+        assert self.chan.streaming
+        assert self.chan.get_busy()
+        self.chan.stop()
+        assert not self.chan.get_busy()
+
+    def test_pause(self):
+        self.chan.stream(self.file)
+        self.chan.pause()
+        assert self.chan.get_busy()
+        self.chan.unpause()
+        assert self.chan.get_busy()
+
+    def test_volume(self):
+        self.chan.stream(self.file)
+        self.chan.set_volume(0.5)
+        assert self.chan.get_volume() == 0.5
+        assert abs(mixer.music.get_volume() - 0.5) < 0.01
+
+    def test_play_stops_stream(self):
+        self.chan.stream(self.file)
+        self.chan.play(mixer.Sound(self.file))
+        assert not self.chan.streaming
+        assert not mixer.music.get_busy()
@@ -0,0 +1,39 @@
+from bench.library import syntheticLibrary
+from modules.util import fsUtil
+
+import os
+import tempfile
+import unittest
+import wave
+
+
+class TestSyntheticLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def library(self, name, **kwargs):
+        return syntheticLibrary(os.path.join(self.dir.name, name), count=10, seconds=2, **kwargs)
+
+    def test_generate(self):
+        files = self.library('lib').generate()
+        assert len(files) == 13  # 10 shows, one of each other type
+        assert sorted(os.listdir(os.path.join(self.dir.name, 'lib'))) == ['PSA', 'fill', 'show', 'stationID']
+        with wave.open(os.path.join(self.dir.name, 'lib', 'show', 'show-00000.wav')) as w:
+            assert (w.getnchannels(), w.getframerate(), w.getnframes()) == (2, 44100, 88200)
+        with wave.open(os.path.join(self.dir.name, 'lib', 'stationID', 'stationID-00000.wav')) as w:
+            assert w.getnframes() == 4410
+        assert len({fsUtil.sha256sum(f) for f in files}) == len(files)  # all distinct
+
+    def test_reproducible(self):
+        for kind in ('sine', 'noise'):
+            a = self.library(kind + 'a', kind=kind).generate()
+            b = self.library(kind + 'b', kind=kind).generate()
+            assert [fsUtil.sha256sum(f) for f in a] == [fsUtil.sha256sum(f) for f in b]
+        c = self.library('c', kind='noise', seed=1).generate()
+        assert fsUtil.sha256sum(c[0]) != fsUtil.sha256sum(b[0])
+
+    def test_encoded_needs_ffmpeg(self):
+        with self.assertRaises(ValueError):
+            self.library('lib').generate(['.wav', '.mp3'])
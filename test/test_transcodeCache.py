@@ -0,0 +1,180 @@
+import os
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from modules.transcode import transcodeCache
+from modules.util import ffmpegWrapper, metaCache
+from modules.worker import workerPool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+import tempfile
+import time
+import unittest
+import wave
+from unittest import mock
+from pygame import mixer
+
+
+def writeWav(path, frames):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(b'\0' * 4 * frames)
+
+
+class TestTranscodeCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mixer.quit()
+        mixer.init(frequency=44100, size=-16, channels=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        mixer.quit()
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.lib = os.path.join(self.dir.name, 'lib')
+        os.mkdir(self.lib)
+        self.root = os.path.join(self.dir.name, 'cache')
+        self.records = {}
+        for name in ('a', 'b', 'c'):
+            path = os.path.join(self.lib, name + '.wav')
+            writeWav(path, 1000)
+            self.records[path] = {'path': path, 'hash': name * 8, 'duration': 1}
+        patcher = mock.patch.object(metaCache, 'lookup', side_effect=self.records.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+        patcher = mock.patch.object(ffmpegWrapper, 'transcode', side_effect=self.transcode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = transcodeCache(self.root, 10000)
+
+    def transcode(self, file, out, rate, channels, codec):
+        self.calls.append((file, rate, channels, codec))
+        if file.endswith(('bad.wav', 'broken.wav')):
+            with open(out, 'wb') as f:
+                f.write(b'\0' * 100)  # partial output left behind
+            if file.endswith('broken.wav'):
+                raise RuntimeError('killed')
+            return False
+        with wave.open(file) as w, open(out, 'wb') as f:
+            f.write(w.readframes(w.getnframes()))
+        return True
+
+    def path(self, name):
+        return os.path.join(self.lib, name + '.wav')
+
+    def test_lookup(self):
+        assert self.cache.lookup(self.path('a')) is None
+        file = self.cache.transcode(self.path('a'))
+        assert os.path.basename(file) == 'aaaaaaaa.44100--16-2.pcm'
+        assert self.calls == [(self.path('a'), 44100, 2, 'pcm_s16le')]
+        assert self.cache.lookup(self.path('a')) == file
+        assert os.path.getsize(file) == 4000
+        stats = self.cache.stats()
+        assert (stats['files'], stats['hits'], stats['misses']) == (1, 1, 1)
+        assert not [f for f in os.listdir(self.root) if f.endswith('.part')]
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_mapped(self):
+        assert self.cache.mapped(self.path('a')) is None
+        self.cache.transcode(self.path('a'))
+        with self.cache.mapped(self.path('a')) as m:
+            data = mixer.Sound(buffer=m)
+        assert abs(data.get_length() - 1000 / 44100) < 1e-3
+        samples = self.cache.samples(self.path('a'))
+        assert samples.shape == (1000, 2) and samples.dtype == numpy.int16
+        assert not samples.flags.writeable and not samples.flags.owndata
+
+    def test_not_cacheable(self):
+        self.records[self.path('a')]['duration'] = 3600  # streamed
+        assert self.cache.transcode(self.path('a')) is None
+        assert self.cache.transcode(os.path.join(self.lib, 'unknown.wav')) is None
+        assert self.calls == []
+
+    def test_evict(self):
+        # each file is 4000 bytes, two fit
+        for name in ('a', 'b'):
+            self.cache.transcode(self.path(name))
+        self.cache.lookup(self.path('a'))  # b is least recently used now
+        self.cache.transcode(self.path('c'))
+        assert self.cache.contains(self.path('a'))
+        assert not self.cache.contains(self.path('b'))
+        assert self.cache.contains(self.path('c'))
+        assert len(os.listdir(self.root)) == 2
+        assert self.cache.stats()['bytes'] <= 10000
+
+    def test_too_large(self):
+        self.cache = transcodeCache(self.root, 1000)
+        assert self.cache.transcode(self.path('a')) is None
+        assert os.listdir(self.root) == []
+
+    def test_reload(self):
+        for name in ('a', 'b'):
+            self.cache.transcode(self.path(name))
+        a = os.path.join(self.root, 'aaaaaaaa.44100--16-2.pcm')
+        b = os.path.join(self.root, 'bbbbbbbb.44100--16-2.pcm')
+        now = time.time()
+        os.utime(b, (now - 60, now - 60))  # a was loaded last
+        open(os.path.join(self.root, 'cccccccc.44100--16-2.pcm.0.part'), 'w').close()
+        cache = transcodeCache(self.root, 10000)
+        assert cache.contains(self.path('a')) and cache.contains(self.path('b'))
+        assert list(cache.entries) == [os.path.basename(b), os.path.basename(a)]
+        assert not os.path.exists(os.path.join(self.root, 'cccccccc.44100--16-2.pcm.0.part'))
+
+    def test_format(self):
+        self.cache.transcode(self.path('a'))
+        mixer.quit()
+        mixer.init(frequency=48000, size=-16, channels=2)
+        try:
+            assert self.cache.lookup(self.path('a')) is None  # other format
+            self.cache.transcode(self.path('a'))
+            assert self.calls[-1] == (self.path('a'), 48000, 2, 'pcm_s16le')
+        finally:
+            mixer.quit()
+            mixer.init(frequency=44100, size=-16, channels=2)
+
+    def test_request(self):
+        pool = workerPool(2, 'Transcoder')
+        self.addCleanup(pool.shutdown)
+        assert self.cache.request(self.path('a')) is None  # no pool attached
+        self.cache.attach(pool)
+        future = self.cache.request(self.path('a'))
+        assert future.result(timeout=5) is True
+        assert self.cache.contains(self.path('a'))
+        assert self.cache.request(self.path('a')) is None  # cached
+        assert self.cache.rebuild([self.path('a'), self.path('b')]) == 1
+
+    def test_request_fail(self):
+        pool = workerPool(1, 'Transcoder')
+        self.addCleanup(pool.shutdown)
+        self.cache.attach(pool)
+        bad = os.path.join(self.lib, 'bad.wav')
+        self.records[bad] = {'path': bad, 'hash': 'd' * 8, 'duration': 1}
+        assert self.cache.request(bad).result(timeout=5) is False
+        assert not self.cache.contains(bad)
+        assert self.cache.stats()['pending'] == 0
+        assert not [f for f in os.listdir(self.root) if f.endswith('.part')]
+
+    def test_request_error(self):
+        pool = workerPool(1, 'Transcoder')
+        self.addCleanup(pool.shutdown)
+        self.cache.attach(pool)
+        broken = os.path.join(self.lib, 'broken.wav')
+        self.records[broken] = {'path': broken, 'hash': 'e' * 8, 'duration': 1}
+        assert self.cache.request(broken).result(timeout=5) is False
+        assert self.cache.stats()['pending'] == 0
+        assert not [f for f in os.listdir(self.root) if f.endswith('.part')]
+
+    def test_transcode_fail(self):
+        bad = os.path.join(self.lib, 'bad.wav')
+        self.records[bad] = {'path': bad, 'hash': 'd' * 8, 'duration': 1}
+        assert self.cache.transcode(bad) is None
+        assert os.listdir(self.root) == []
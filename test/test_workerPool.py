@@ -0,0 +1,120 @@
+from modules.worker import workerPool
+from modules.util import ffmpegWrapper
+
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = workerPool(2, 'Test')
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_results(self):
+        futures = [self.pool.submit(str(i), pow, i, 2) for i in range(10)]
+        assert [f.result(timeout=5) for f in futures] == [i*i for i in range(10)]
+        assert self.pool.progress() == (10, 0, 10)
+
+    def test_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]  # current, peak
+
+        def work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        futures = [self.pool.submit(str(i), work) for i in range(8)]
+        for f in futures:
+            f.result(timeout=5)
+        assert running[1] <= 2
+
+    def test_failure(self):
+        future = self.pool.submit('fail', int, 'x')
+        with self.assertRaises(ValueError):
+            future.result(timeout=5)
+        assert self.pool.progress()[1] == 1
+
+    def test_cancel(self):
+        gate = threading.Event()
+        started = threading.Semaphore(0)
+
+        def work():
+            started.release()
+            return gate.wait()
+
+        blocked = [self.pool.submit(str(i), work) for i in range(2)]
+        for _ in blocked:
+            assert started.acquire(timeout=5)
+        queued = [self.pool.submit(str(i), pow, i, 2) for i in range(5)]
+        self.pool.cancel()
+        gate.set()
+        assert all(f.cancelled() for f in queued)
+        assert all(f.result(timeout=5) for f in blocked)
+
+    def test_cancel_own_processes(self):
+        other = workerPool(1, 'Other')
+        self.addCleanup(other.shutdown)
+        mine = self.pool.submit('mine', ffmpegWrapper.call, ['sleep', '10'])
+        theirs = other.submit('theirs', ffmpegWrapper.call, ['sleep', '1'])
+        deadline = time.time() + 5
+        while len(ffmpegWrapper.running) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.pool.cancel()
+        assert mine.result(timeout=5) != 0  # terminated
+        assert theirs.result(timeout=5) == 0  # other pool left alone
+
+
+def logJob(n):
+    logging.warning("job %d logging", n)
+    return n
+
+
+class TestProcessPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = workerPool(2, 'Test', 'process')
+        self.records = []
+        self.handler = logging.Handler(logging.WARNING)  # job records, not progress reports
+        self.handler.emit = self.records.append
+        logging.getLogger().addHandler(self.handler)
+
+    def tearDown(self):
+        logging.getLogger().removeHandler(self.handler)
+        self.pool.shutdown()
+
+    def test_log_bridge(self):
+        futures = [self.pool.submit('a{}.wav'.format(i), logJob, i) for i in range(4)]
+        assert [f.result(timeout=30) for f in futures] == list(range(4))
+        deadline = time.time() + 5
+        while len(self.records) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        messages = sorted(r.getMessage() for r in self.records)
+        assert len(messages) == 4
+        assert messages[0].startswith('[a0.wav +')
+        assert messages[0].endswith('] job 0 logging')
+        assert all(r.threadName.startswith('Test-p') for r in self.records)
+
+    def test_shutdown_running(self):
+        with tempfile.TemporaryDirectory() as d:
+            marker = os.path.join(d, 'started')
+            future = self.pool.submit('long', ffmpegWrapper.call,
+                                      ['sh', '-c', 'touch "{}"; exec sleep 30'.format(marker)])
+            deadline = time.time() + 30
+            while not os.path.exists(marker) and time.time() < deadline:
+                time.sleep(0.01)
+            assert os.path.exists(marker)
+            start = time.time()
+            self.pool.shutdown()
+            assert time.time() - start < 5
+            assert future.result(timeout=1) != 0  # terminated in the worker process